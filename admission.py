@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Admission control for Raspberry Pi LED Server
+Expensive routes are grouped into lanes (ADMISSION_LANES), each with a concurrency limit, a short bounded
+queue and a token bucket per client. Requests over a client's rate get 429, requests finding the queue full
+or waiting too long get 503, both with Retry-After. Routes outside the lanes are never held back, and the
+lanes together can only occupy the worker threads ADMISSION_RESERVED leaves over
+"""
+
+import logging
+import math
+import threading
+import time
+from config import *
+from metrics import METRICS
+
+log = logging.getLogger(__name__)
+
+_REJECTED = METRICS.counter("admission_rejected_total", "Requests refused by admission control", ("lane", "reason"))
+_WAIT = METRICS.histogram("admission_queue_wait_seconds", "Time admitted requests waited for a lane slot", ("lane",))
+_ACTIVE = METRICS.gauge("admission_active", "Requests running in a lane", ("lane",))
+_QUEUED = METRICS.gauge("admission_queued", "Requests waiting for a lane slot", ("lane",))
+
+# Token buckets of clients idle this long are full again and can be forgotten
+_MAX_CLIENTS = 1024
+
+
+class Rejected(Exception):
+    """Request refused; `status` is 429 or 503, `retry_after` whole seconds"""
+
+    def __init__(self, lane, reason, status, retry_after, message):
+        super().__init__(message)
+        self.lane = lane
+        self.reason = reason
+        self.status = status
+        self.retry_after = retry_after
+
+
+class Lane:
+    def __init__(self, name, prefixes, concurrency, queue, wait, rate, burst):
+        """Initialize lane: `concurrency` requests run at once, `queue` more wait up to `wait` seconds;
+        each client gets `rate` requests per second with bursts of `burst`"""
+        self.name = name
+        self.prefixes = tuple(prefixes)
+        self.concurrency = concurrency
+        self.queue = queue
+        self.wait = wait
+        self.rate = rate
+        self.burst = burst
+        self._cond = threading.Condition()
+        self._active = 0
+        self._waiting = 0
+        self._hold = 1.0  # EWMA of the seconds a request holds its slot, for Retry-After
+        self._buckets = {}  # client -> [tokens, monotonic time of last refill]
+        self._m_active = _ACTIVE.labels(name)
+        self._m_queued = _QUEUED.labels(name)
+        self._m_wait = _WAIT.labels(name)
+
+    def _take_token(self, client, now):
+        """0 when the client has a token (and takes it), else seconds until it will"""
+        bucket = self._buckets.get(client)
+        if bucket is None:
+            if len(self._buckets) >= _MAX_CLIENTS:
+                full_after = self.burst / self.rate
+                self._buckets = {c: b for c, b in self._buckets.items() if now - b[1] < full_after}
+            bucket = self._buckets[client] = [float(self.burst), now]
+        else:
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+        if bucket[0] >= 1.0:
+            bucket[0] -= 1.0
+            return 0.0
+        return (1.0 - bucket[0]) / self.rate
+
+    def _reject(self, reason, status, retry_after, message):
+        _REJECTED.labels(self.name, reason).inc()
+        return Rejected(self.name, reason, status, max(1, math.ceil(retry_after)), message)
+
+    def enter(self, client):
+        """Take a slot, waiting in the queue if need be; raises Rejected. Pair with leave()"""
+        start = time.monotonic()
+        with self._cond:
+            if self.rate:
+                delay = self._take_token(client, start)
+                if delay:
+                    raise self._reject("rate", 429, delay, f"Too many {self.name} requests; retry in {delay:.1f}s")
+            if self._active >= self.concurrency:
+                # Time for the requests ahead to drain through the slots
+                drain = self._hold * (self._waiting + 1) / self.concurrency
+                if self._waiting >= self.queue:
+                    raise self._reject("queue_full", 503, drain, f"Too many {self.name} requests in progress")
+                self._waiting += 1
+                self._m_queued.inc()
+                try:
+                    deadline = start + self.wait
+                    while self._active >= self.concurrency:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0 or not self._cond.wait(remaining):
+                            if self._active >= self.concurrency:
+                                raise self._reject("timeout", 503, drain,
+                                                   f"Timed out after {self.wait:g}s waiting for a {self.name} slot")
+                finally:
+                    self._waiting -= 1
+                    self._m_queued.dec()
+            self._active += 1
+            self._m_active.inc()
+        admitted = time.monotonic()
+        self._m_wait.observe(admitted - start)
+        return admitted
+
+    def leave(self, admitted):
+        """Release the slot taken by enter(), which returned `admitted`"""
+        held = time.monotonic() - admitted
+        with self._cond:
+            self._active -= 1
+            self._m_active.dec()
+            self._hold += 0.2 * (held - self._hold)
+            self._cond.notify()
+
+    def status(self):
+        with self._cond:
+            return {"active": self._active, "queued": self._waiting, "concurrency": self.concurrency,
+                    "queue": self.queue, "rate": self.rate, "burst": self.burst, "hold_s": round(self._hold, 3),
+                    "clients": len(self._buckets)}
+
+
+class Admission:
+    """Lanes by route prefix; a route in no lane is always admitted"""
+
+    def __init__(self, lanes=ADMISSION_LANES, threads=SERVER_THREADS, reserved=ADMISSION_RESERVED):
+        self.lanes = [Lane(name, **spec) for name, spec in lanes.items()]
+        held = sum(lane.concurrency + lane.queue for lane in self.lanes)
+        if held > threads - reserved:
+            log.warning("Admission lanes can hold %d of %d worker threads, more than the %d ADMISSION_RESERVED "
+                        "leaves; status routes may wait behind them", held, threads, threads - reserved)
+
+    def lane_for(self, route):
+        """The lane a route rule ("/snmp/walk") belongs to, or None"""
+        for lane in self.lanes:
+            if route.startswith(lane.prefixes):
+                return lane
+        return None
+
+    def status(self):
+        return {lane.name: lane.status() for lane in self.lanes}
@@ -2,52 +2,104 @@
 # -*- coding: utf-8 -*-
 """
 Main application file for Raspberry Pi LED Server
-Entry point for the HTTP server with GPIO control
+Entry point for the HTTP server with GPIO control; it serves before the hardware is up
+(see startup.py)
 """
 
+import logging
 import signal
 import sys
-from gpio_controller import GPIOController
+from logging_setup import setup_logging, shutdown_logging
 from command_executor import CommandExecutor
+from journal import open_journal
+from probes import start_probes
+from startup import start_controller
 from routes import Routes
-from config import HOST, PORT
+from gpio_client import GPIOClient, CommandClient, RemoteConfigStore
+import gpio_daemon
+from config import HOST, PORT, SERVER_MODE, SERVER_WORKERS
+from wsgi_server import serve, serve_workers
+
+log = logging.getLogger("app")
 
 
 class LEDServer:
-    def __init__(self):
+    def __init__(self, workers=SERVER_WORKERS):
         """Initialize the LED server with all components"""
+        setup_logging()
+        self.workers = workers
+        if workers > 1:
+            # Each forked worker builds its own components in _run_worker; the GPIO daemon owns the pins
+            return
+        self._build()
+    
+    def _build(self, worker=False):
+        """Create GPIO, command and route components; workers reach the pins through the GPIO daemon"""
         try:
-            self.gpio = GPIOController()
-            self.cmd = CommandExecutor(self.gpio)
-            self.routes = Routes(self.gpio, self.cmd)
+            if worker:
+                self.gpio = GPIOClient()
+                self.gpio.wait_ready()
+                self.gpio.relay_events()
+                self.cmd = CommandClient(self.gpio)
+                self.store = RemoteConfigStore(self.gpio)
+            else:
+                self.gpio = start_controller()
+                self.journal = open_journal()
+                self.probes = start_probes()
+                self.cmd = CommandExecutor(self.gpio, self.journal, self.probes)
+            self.routes = Routes(self.gpio, self.cmd, store=getattr(self, 'store', None))
             self.app = self.routes.get_app()
         except Exception as e:
-            print(f"Failed to initialize server: {e}")
+            log.critical("Failed to initialize server: %s", e)
+            shutdown_logging()
             sys.exit(1)
     
     def cleanup(self):
         """Clean up resources before shutdown"""
-        print("\nShutting down LED server...")
+        log.info("Shutting down LED server...")
+        if hasattr(self, 'routes'):
+            self.routes.store.close()
         if hasattr(self, 'gpio'):
             self.gpio.cleanup()
-        print("Cleanup complete.")
+        if getattr(self, 'probes', None) is not None:
+            self.probes.close()
+        if getattr(self, 'journal', None) is not None:
+            self.journal.close()
+        log.info("Cleanup complete.")
+        shutdown_logging()
+    
+    def _run_worker(self, listen_fd):
+        """Body of one forked web worker"""
+        self._build(worker=True)
+        try:
+            serve(self.app, HOST, PORT, "threaded", fd=listen_fd)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.cleanup()
     
     def run(self):
-        """Run the Flask server"""
-        print(f"Starting LED server on {HOST}:{PORT}")
-        print("Press Ctrl+C to stop the server")
+        """Run the HTTP server selected by SERVER_MODE, or SERVER_WORKERS worker processes"""
+        if self.workers > 1:
+            log.info("Starting LED server on %s:%s (%d workers and the GPIO daemon)", HOST, PORT, self.workers)
+        else:
+            log.info("Starting LED server on %s:%s (%s server)", HOST, PORT, SERVER_MODE)
+        log.info("Press Ctrl+C to stop the server")
         
         try:
-            self.app.run(host=HOST, port=PORT, debug=False)
+            if self.workers > 1:
+                serve_workers(self._run_worker, self.workers, HOST, PORT, services=(gpio_daemon.main,))
+            else:
+                serve(self.app, HOST, PORT, SERVER_MODE)
         except KeyboardInterrupt:
-            print("\nReceived interrupt signal")
+            log.info("Received interrupt signal")
         finally:
             self.cleanup()
 
 
 def signal_handler(signum, frame):
     """Handle shutdown signals gracefully"""
-    print(f"\nReceived signal {signum}")
+    log.info("Received signal %s", signum)
     sys.exit(0)
 
 
@@ -0,0 +1,366 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Static asset pipeline for Raspberry Pi LED Server
+Minifies, precompresses and content-hash fingerprints CSS/JS/fonts at startup and serves them
+with immutable caching; url_for('static', ...) resolves to the fingerprinted names
+"""
+
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+import posixpath
+import re
+import time
+from flask import Response, request
+from config import *
+from metrics import METRICS
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+log = logging.getLogger(__name__)
+
+_ASSET_BYTES = METRICS.counter("static_asset_bytes_total", "Static asset bytes sent", ("encoding",))
+
+# Uploaded and placeholder images keep their plain URLs; they are referenced from saved config
+ASSET_EXTENSIONS = {".css", ".js", ".svg", ".ttf", ".woff2"}
+COMPRESSIBLE = {".css", ".js", ".svg", ".ttf"}
+EXCLUDED_DIRS = {"images"}
+# Part of the cache key for minified output; bump when minify_css/minify_js change what they emit
+MINIFIER_VERSION = 1
+_MIMETYPES = {".woff2": "font/woff2", ".ttf": "font/ttf", ".js": "text/javascript", ".css": "text/css"}
+
+_IDENT = re.compile(r"[A-Za-z0-9_$]")
+_REGEX_KEYWORDS = {"return", "typeof", "case", "do", "else", "in", "of", "new", "delete", "void", "throw",
+                   "instanceof", "yield", "await"}
+_CSS_URL = re.compile(r"url\(\s*(['\"]?)([^'\")]+)\1\s*\)")
+
+
+def _skip_string(text, i):
+    """Index just past the quoted string starting at text[i]"""
+    quote = text[i]
+    i += 1
+    while i < len(text):
+        if text[i] == "\\":
+            i += 2
+            continue
+        if text[i] == quote:
+            return i + 1
+        i += 1
+    return i
+
+
+def minify_css(text):
+    """Drop comments (except /*! ... */) and whitespace that CSS does not need"""
+    out = []
+    i, n = 0, len(text)
+    while i < n:
+        c = text[i]
+        if c in "\"'":
+            end = _skip_string(text, i)
+            out.append(text[i:end])
+            i = end
+        elif text.startswith("/*", i):
+            end = text.find("*/", i + 2)
+            end = n if end < 0 else end + 2
+            if text.startswith("/*!", i):
+                out.append(text[i:end])
+            i = end
+        elif c.isspace():
+            while i < n and text[i].isspace():
+                i += 1
+            prev = out[-1][-1] if out and out[-1] else ""
+            nxt = text[i] if i < n else ""
+            # Space before ':' is significant in selectors ("a :hover"), so only trim after it
+            if prev and nxt and prev not in "{};,>:(" and nxt not in "{};,>)":
+                out.append(" ")
+        else:
+            if c == "}" and out and out[-1] == ";":
+                out.pop()
+            out.append(c)
+            i += 1
+    return "".join(out).strip()
+
+
+def _regex_allowed(out):
+    """Whether a '/' after the emitted code so far starts a regex literal rather than a division"""
+    j = len(out) - 1
+    while j >= 0 and out[j] in " \n":
+        j -= 1
+    if j < 0:
+        return True
+    if out[j] in "(,=:[!&|?{};+-*%<>~^":
+        return True
+    end = j + 1
+    while j >= 0 and _IDENT.match(out[j]):
+        j -= 1
+    return "".join(out[j + 1:end]) in _REGEX_KEYWORDS
+
+
+def _minify_js_code(text, i, out, in_template_expr=False):
+    """Minify code from text[i]; inside a template ${...} stop at its closing brace. Returns the new index"""
+    n = len(text)
+    depth = 0
+    while i < n:
+        c = text[i]
+        if c in "\"'":
+            end = _skip_string(text, i)
+            out.extend(text[i:end])
+            i = end
+        elif c == "`":
+            i = _copy_template(text, i, out)
+        elif text.startswith("//", i):
+            end = text.find("\n", i)
+            i = n if end < 0 else end
+        elif text.startswith("/*", i):
+            end = text.find("*/", i + 2)
+            end = n if end < 0 else end + 2
+            # A comment spanning lines still ends a statement for automatic semicolon insertion
+            if "\n" in text[i:end]:
+                out.append("\n")
+            i = end
+        elif c == "/" and _regex_allowed(out):
+            start = i
+            i += 1
+            in_class = False
+            while i < n and text[i] != "\n":
+                if text[i] == "\\":
+                    i += 2
+                    continue
+                if text[i] == "[":
+                    in_class = True
+                elif text[i] == "]":
+                    in_class = False
+                elif text[i] == "/" and not in_class:
+                    i += 1
+                    break
+                i += 1
+            while i < n and _IDENT.match(text[i]):
+                i += 1
+            out.extend(text[start:i])
+        elif c.isspace():
+            start = i
+            while i < n and text[i].isspace():
+                i += 1
+            newline = "\n" in text[start:i]
+            prev = out[-1] if out else ""
+            nxt = text[i] if i < n else ""
+            if not prev or not nxt:
+                continue
+            if newline:
+                # Keep line breaks: automatic semicolon insertion depends on them
+                if prev != "\n":
+                    out.append("\n")
+            elif (_IDENT.match(prev) and _IDENT.match(nxt)) or (prev == nxt and prev in "+-") or "/" in (prev, nxt):
+                out.append(" ")
+        else:
+            if in_template_expr:
+                if c == "{":
+                    depth += 1
+                elif c == "}":
+                    if depth == 0:
+                        return i
+                    depth -= 1
+            out.append(c)
+            i += 1
+    return i
+
+
+def _copy_template(text, i, out):
+    """Copy a template literal verbatim, minifying the code inside its ${...} substitutions"""
+    n = len(text)
+    out.append("`")
+    i += 1
+    while i < n:
+        c = text[i]
+        if c == "\\":
+            out.extend(text[i:i + 2])
+            i += 2
+        elif c == "`":
+            out.append("`")
+            return i + 1
+        elif text.startswith("${", i):
+            out.extend("${")
+            i = _minify_js_code(text, i + 2, out, in_template_expr=True)
+            if i < n:
+                out.append("}")
+                i += 1
+        else:
+            out.append(c)
+            i += 1
+    return i
+
+
+def minify_js(text):
+    """Strip comments, indentation and blank lines; strings, templates and regexes are left untouched"""
+    out = []
+    _minify_js_code(text, 0, out)
+    return "".join(out).strip() + "\n"
+
+
+class Asset:
+    def __init__(self, logical, body, mimetype):
+        """Initialize asset from its final (minified, rewritten) body"""
+        self.logical = logical
+        self.mimetype = mimetype
+        self.digest = hashlib.sha256(body).hexdigest()
+        root, ext = posixpath.splitext(logical)
+        self.url_name = f"{root}.{self.digest[:10]}{ext}"
+        self.variants = {"identity": body}
+
+
+class AssetPipeline:
+    def __init__(self, static_dir, cache_dir=ASSET_CACHE_DIR):
+        """Initialize pipeline; call build() to process the static folder"""
+        self.static_dir = static_dir
+        if cache_dir and not os.path.isabs(cache_dir):
+            cache_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), cache_dir)
+        self.cache_dir = cache_dir
+        self.by_logical = {}
+        self.by_url = {}
+
+    def _sources(self):
+        for root, dirs, files in os.walk(self.static_dir):
+            rel_root = os.path.relpath(root, self.static_dir)
+            if rel_root == ".":
+                dirs[:] = [d for d in dirs if d not in EXCLUDED_DIRS]
+            for name in files:
+                if os.path.splitext(name)[1].lower() in ASSET_EXTENSIONS:
+                    yield posixpath.normpath(posixpath.join(rel_root.replace(os.sep, "/"), name))
+
+    def _rewrite_css_urls(self, logical, text):
+        """Point url(...) references inside a stylesheet at the fingerprinted files"""
+        base = posixpath.dirname(logical)
+
+        def replace(match):
+            ref = match.group(2)
+            if ref.startswith(("data:", "http:", "https:", "//", "#")):
+                return match.group(0)
+            path, _, suffix = ref.partition("?")
+            path, _, fragment = path.partition("#")
+            target = self.by_logical.get(posixpath.normpath(posixpath.join(base, path)))
+            if target is None:
+                return match.group(0)
+            rel = posixpath.relpath(target.url_name, base or ".")
+            return f"url({rel}{'#' + fragment if fragment else ''})"
+
+        return _CSS_URL.sub(replace, text)
+
+    def _cached(self, name, produce):
+        """Bytes from the on-disk cache of an earlier start, else produce() and store them"""
+        cached = os.path.join(self.cache_dir, name) if self.cache_dir else None
+        if cached and os.path.exists(cached):
+            with open(cached, "rb") as f:
+                return f.read()
+        data = produce()
+        if cached:
+            try:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                tmp = f"{cached}.{os.getpid()}.tmp"
+                with open(tmp, "wb") as f:
+                    f.write(data)
+                os.replace(tmp, cached)
+            except OSError as e:
+                log.warning("Asset cache write failed: %s", e)
+        return data
+
+    def _compressed(self, asset, encoding, compress):
+        """Compressed variant of an asset's final body"""
+        return self._cached(f"{asset.digest}.{encoding}", lambda: compress(asset.variants["identity"]))
+
+    def _minified(self, raw, ext, minify):
+        """Minified text of a source file, keyed by the source's hash so unchanged files skip the minifier"""
+        name = f"{hashlib.sha256(raw).hexdigest()}.v{MINIFIER_VERSION}.min{ext}"
+        return self._cached(name, lambda: minify(raw.decode("utf-8")).encode("utf-8")).decode("utf-8")
+
+    def build(self):
+        """Minify, fingerprint and precompress every asset; stylesheets last so their url()s resolve"""
+        start = time.perf_counter()
+        sources = sorted(self._sources(), key=lambda p: (p.endswith(".css"), p))
+        raw_total = sent_total = 0
+        for logical in sources:
+            ext = posixpath.splitext(logical)[1].lower()
+            with open(os.path.join(self.static_dir, *logical.split("/")), "rb") as f:
+                raw = f.read()
+            body = raw
+            if ext == ".css":
+                if logical.endswith(".min.css"):
+                    text = raw.decode("utf-8")
+                else:
+                    text = self._minified(raw, ext, minify_css)
+                body = self._rewrite_css_urls(logical, text).encode("utf-8")
+            elif ext == ".js" and not logical.endswith(".min.js"):
+                body = self._minified(raw, ext, minify_js).encode("utf-8")
+            mimetype = _MIMETYPES.get(ext) or mimetypes.guess_type(logical)[0] or "application/octet-stream"
+            asset = Asset(logical, body, mimetype)
+            if ext in COMPRESSIBLE:
+                gz = self._compressed(asset, "gzip", lambda b: gzip.compress(b, compresslevel=9, mtime=0))
+                if len(gz) < len(body):
+                    asset.variants["gzip"] = gz
+                if brotli is not None:
+                    br = self._compressed(asset, "br", lambda b: brotli.compress(b, quality=11))
+                    if len(br) < len(body):
+                        asset.variants["br"] = br
+            self.by_logical[logical] = asset
+            self.by_url[asset.url_name] = asset
+            raw_total += len(raw)
+            sent_total += min(len(v) for v in asset.variants.values())
+        log.info("Built %d static assets in %.2fs: %d -> %d bytes%s", len(sources), time.perf_counter() - start,
+                 raw_total, sent_total, "" if brotli else " (brotli not installed, gzip only)")
+        return self
+
+    def url_for(self, filename):
+        """Fingerprinted name for a static file, or the name unchanged if it is not a pipeline asset"""
+        asset = self.by_logical.get(filename)
+        return asset.url_name if asset else filename
+
+    def _choose_encoding(self, asset):
+        accept = request.accept_encodings
+        for encoding in ("br", "gzip"):
+            if encoding in asset.variants and accept[encoding]:
+                return encoding
+        return "identity"
+
+    def response(self, filename):
+        """Response for a pipeline asset, or None to fall through to plain static serving"""
+        asset = self.by_url.get(filename)
+        immutable = asset is not None
+        if asset is None:
+            asset = self.by_logical.get(filename)
+            if asset is None:
+                return None
+        encoding = self._choose_encoding(asset)
+        etag = f"{asset.digest[:20]}-{encoding}"
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            body = asset.variants[encoding]
+            response = Response(body, mimetype=asset.mimetype)
+            if encoding != "identity":
+                response.headers["Content-Encoding"] = encoding
+            _ASSET_BYTES.labels(encoding).inc(len(body))
+        response.set_etag(etag)
+        response.headers["Vary"] = "Accept-Encoding"
+        # Fingerprinted names never change content; plain names must be revalidated
+        response.headers["Cache-Control"] = "public, max-age=31536000, immutable" if immutable else "no-cache"
+        return response
+
+    def init_app(self, app):
+        """Rewrite url_for('static', ...) to fingerprinted names and serve them from memory"""
+        plain_static = app.view_functions["static"]
+
+        @app.url_defaults
+        def fingerprint_static(endpoint, values):
+            if endpoint == "static" and "filename" in values:
+                values["filename"] = self.url_for(values["filename"])
+
+        def static(filename):
+            response = self.response(filename)
+            return response if response is not None else plain_static(filename=filename)
+
+        app.view_functions["static"] = static
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+/status while dashboards hammer /snmp/walk
+--dashboards clients, each from its own loopback address, keep --holds /snmp/walk requests in flight against
+an SNMP agent taking --snmp-delay seconds, on the pooled server with SERVER_THREADS workers. Meanwhile one
+client polls /status. Before: no admission control, so the walks take every worker and /status waits in the
+listen backlog. After: the snmp lane's concurrency limit, queue and per-client rate limit refuse the excess
+with 429/503 and Retry-After. Reports /status latency and what happened to the walks
+
+    python benchmarks/admission.py
+    python benchmarks/admission.py --dashboards 10 --holds 4 --snmp-delay 4
+"""
+
+import argparse
+import collections
+import http.client
+import threading
+import time
+
+from harness import BenchServer, install_snmp_agent, summarize, write_results
+from config import SERVER_THREADS
+
+
+def request(port, path, source, timeout):
+    """(status, Retry-After or None) of one GET from `source`"""
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=timeout, source_address=(source, 0))
+    try:
+        conn.request("GET", path)
+        resp = conn.getresponse()
+        resp.read()
+        return resp.status, resp.getheader("Retry-After")
+    finally:
+        conn.close()
+
+
+def run(args, admission):
+    stop = threading.Event()
+    outcomes = collections.Counter()
+    reject_s, status_s, retry_after = [], [], set()
+    lock = threading.Lock()
+
+    with BenchServer(server_mode="threaded", admission=admission) as server:
+        def dashboard(source):
+            while not stop.is_set():
+                start = time.perf_counter()
+                try:
+                    status, retry = request(server.port, "/snmp/walk?target=127.0.0.1", source, 60)
+                except OSError:
+                    status, retry = "error", None
+                with lock:
+                    outcomes[status] += 1
+                    if status in (429, 503):
+                        reject_s.append(time.perf_counter() - start)
+                        retry_after.add(retry)
+                if retry:
+                    # A well-behaved client honours Retry-After
+                    stop.wait(float(retry))
+
+        clients = [threading.Thread(target=dashboard, args=(f"127.0.0.{10 + d}",), daemon=True)
+                   for d in range(args.dashboards) for _ in range(args.holds)]
+        for client in clients:
+            client.start()
+        time.sleep(0.5)
+        failures = 0
+        deadline = time.monotonic() + args.duration
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            try:
+                status, _ = request(server.port, "/status", "127.0.0.2", args.snmp_delay * 4)
+                if status != 200:
+                    failures += 1
+            except OSError:
+                failures += 1
+            status_s.append(time.perf_counter() - start)
+            time.sleep(0.05)
+        stop.set()
+        for client in clients:
+            client.join()
+        lanes = server.routes.admission.status() if server.routes.admission else None
+
+    return {"status_ms": summarize(status_s), "status_failures": failures,
+            "walks": {str(k): v for k, v in sorted(outcomes.items(), key=str)},
+            "reject_ms": summarize(reject_s), "retry_after": sorted(r for r in retry_after if r), "lanes": lanes}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dashboards", type=int, default=6, help="clients, each with its own source address")
+    parser.add_argument("--holds", type=int, default=5, help="walks each client keeps in flight")
+    parser.add_argument("--snmp-delay", type=float, default=2.0, help="seconds the stand-in agent takes per walk")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per run")
+    parser.add_argument("--out", default=None, help="results directory (default benchmarks/results)")
+    args = parser.parse_args()
+
+    install_snmp_agent(delay=args.snmp_delay)
+    results = {"dashboards": args.dashboards, "holds": args.holds, "snmp_delay": args.snmp_delay,
+               "server_threads": SERVER_THREADS}
+    for name, admission in (("no admission control (before)", False), ("admission lanes (after)", True)):
+        r = results[name] = run(args, admission)
+        walks = "  ".join(f"{k}: {v}" for k, v in r["walks"].items())
+        print(f"{name:30s} /status p50 {r['status_ms']['p50']:7.1f} p99 {r['status_ms']['p99']:7.1f} "
+              f"max {r['status_ms']['max']:7.1f} ms  failures {r['status_failures']}  walks {walks}")
+        if r["reject_ms"]["count"]:
+            print(f"{'':30s} rejections answered in p50 {r['reject_ms']['p50']:.1f} ms, Retry-After {r['retry_after']}")
+
+    path = write_results("admission", results, args.out) if args.out else write_results("admission", results)
+    print(f"results written to {path}")
+
+
+if __name__ == "__main__":
+    main()
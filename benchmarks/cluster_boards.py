@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Frame fan-out across several boards in cluster mode
+Drives ClusterController over simulated pigpio links with injected latency and measures, per frame,
+how far apart the boards light it (skew, with and without CLUSTER_ALIGN) and how long the caller
+waits; then stalls one board mid-animation and checks the others keep their frame rate
+
+    python benchmarks/cluster_boards.py
+    python benchmarks/cluster_boards.py --latencies 1,5,20,40 --period 0.1
+"""
+
+import argparse
+import socket
+import time
+
+from harness import summarize, write_results
+import cluster
+
+
+class LinkPi:
+    """Simulated remote pigpiod: each call crosses a link with `latency` one-way delay; the levels
+    change when the request arrives, and the time of each frame is recorded. A stalled link
+    hangs until the client's timeout, like a board that froze or dropped off the network"""
+
+    def __init__(self, latency, timeout=cluster.CLUSTER_TIMEOUT):
+        self.latency = latency
+        self.timeout = timeout
+        self.connected = True
+        self.stalled = False
+        self.levels = 0
+        self.applied = []  # (monotonic time, levels) per bank write
+
+    def _cross(self):
+        if self.stalled:
+            time.sleep(self.timeout)
+            raise socket.timeout("timed out")
+        time.sleep(self.latency)
+
+    def set_mode(self, gpio, mode):
+        self._cross()
+        self._cross()
+
+    def _bank(self, bits, high):
+        self._cross()
+        self.levels = self.levels | bits if high else self.levels & ~bits
+        self.applied.append((time.monotonic(), self.levels))
+        self._cross()
+
+    def set_bank_1(self, bits):
+        self._bank(bits, True)
+
+    def clear_bank_1(self, bits):
+        self._bank(bits, False)
+
+    def read_bank_1(self):
+        self._cross()
+        self._cross()
+        return self.levels
+
+    def stop(self):
+        self.connected = False
+
+
+def _first_seen(pi, levels, after):
+    """Time the board first showed `levels` at or after `after`"""
+    for t, seen in pi.applied:
+        if t >= after and seen == levels:
+            return t
+    return None
+
+
+def run_animation(latencies, frames, period, align, stall_board=None):
+    """Play `frames` single-LED frames across boards; returns skew, call latency and per-board delivery"""
+    cluster.CLUSTER_ALIGN = align
+    links = [LinkPi(latency) for latency in latencies]
+    boards = [{"name": f"board{i}", "host": f"sim{i}"} for i in range(len(links))]
+    connect = lambda board: links[int(board["host"][3:])]
+    gpio = cluster.ClusterController(boards, connect)
+    # Let every board connect and settle its latency estimate
+    for _ in range(10):
+        gpio._apply_states(True)
+        gpio.pi.flush()
+        gpio._off_all()
+        gpio.pi.flush()
+        time.sleep(period)
+
+    pins = gpio._pin_bits
+    issued, calls = [], []
+    for i in range(frames):
+        if stall_board is not None and i == frames // 3:
+            links[stall_board].stalled = True
+        states = [False] * len(pins)
+        states[i % len(pins)] = True
+        issued.append((time.monotonic(), pins[i % len(pins)]))
+        start = time.perf_counter()
+        gpio._apply_states(*states)
+        calls.append(time.perf_counter() - start)
+        time.sleep(period)
+    gpio.pi.flush()
+
+    skews, delivered = [], {}
+    for index, (t, levels) in enumerate(issued):
+        # A frame counts as delivered only if its board showed it before the next frame was issued
+        until = issued[index + 1][0] if index + 1 < len(issued) else float("inf")
+        seen = {}
+        for name, pi in zip((b["name"] for b in boards), links):
+            when = _first_seen(pi, levels, t)
+            if when is not None and when < until + max(latencies) * 2:
+                seen[name] = when
+                delivered[name] = delivered.get(name, 0) + 1
+        if len(seen) > 1:
+            skews.append(max(seen.values()) - min(seen.values()))
+    status = gpio.get_status()["boards"]
+    links_by_name = dict(zip((b["name"] for b in boards), links))
+    for link in links:
+        link.stalled = False
+    gpio.cleanup()
+    return {
+        "skew_ms": summarize(skews),
+        "call_us": summarize(calls, scale=1e6),
+        "frames_delivered": {name: delivered.get(name, 0) for name in links_by_name},
+        "online_at_end": {name: board["online"] for name, board in status.items()},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latencies", default="0.5,2,5,10", help="one-way link latency per board, ms")
+    parser.add_argument("--frames", type=int, default=120, help="animation frames per run")
+    parser.add_argument("--period", type=float, default=0.05, help="seconds per frame")
+    parser.add_argument("--out", default=None, help="results directory (default benchmarks/results)")
+    args = parser.parse_args()
+
+    latencies = [float(ms) / 1e3 for ms in args.latencies.split(",")]
+    cluster.CLUSTER_RECONNECT_INTERVAL = 0.2
+    results = {"latencies_ms": [l * 1e3 for l in latencies], "frames": args.frames, "period_s": args.period}
+    runs = (("unaligned", False, None), ("aligned", True, None), ("aligned, last board stalls", True, len(latencies) - 1))
+    for name, align, stall in runs:
+        r = results[name] = run_animation(latencies, args.frames, args.period, align, stall)
+        print(f"{name:28s} skew p50 {r['skew_ms']['p50']:.1f} ms p99 {r['skew_ms']['p99']:.1f} ms, "
+              f"call p50 {r['call_us']['p50']:.0f} us, delivered {r['frames_delivered']}, online {r['online_at_end']}")
+
+    path = write_results("cluster_boards", results, args.out) if args.out else write_results("cluster_boards", results)
+    print(f"results written to {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Compare two benchmark result files and flag regressions
+
+    python benchmarks/compare.py results/e2e-old.json results/e2e-new.json [--threshold 10]
+
+Exits non-zero when any tracked metric regresses by more than the threshold (percent).
+"""
+
+import argparse
+import json
+import sys
+
+# Leaf names where bigger is better; every other timing/size leaf is treated as lower-is-better
+_HIGHER_IS_BETTER = ("rps", "fps", "achieved_fps", "throughput")
+# Leaves that describe the run rather than measure it
+_IGNORED = ("count", "clients", "rounds", "iterations", "frames", "duration_s", "target_fps", "t", "requests",
+            "sse_sessions", "udp_packets", "tcp_connections")
+
+
+def _flatten(node, prefix=""):
+    if isinstance(node, dict):
+        for key, value in node.items():
+            if key == "samples":
+                continue
+            yield from _flatten(value, f"{prefix}.{key}" if prefix else key)
+    elif isinstance(node, (int, float)) and not isinstance(node, bool):
+        yield prefix, float(node)
+
+
+def compare(old, new, threshold):
+    """Return rows of (metric, old, new, change %, verdict)"""
+    old_flat = dict(_flatten(old["results"]))
+    new_flat = dict(_flatten(new["results"]))
+    rows = []
+    for key in sorted(set(old_flat) & set(new_flat)):
+        leaf = key.rsplit(".", 1)[-1]
+        if leaf in _IGNORED:
+            continue
+        a, b = old_flat[key], new_flat[key]
+        if a == 0:
+            change = 0.0 if b == 0 else float("inf")
+        else:
+            change = (b - a) / abs(a) * 100.0
+        worse = -change if leaf in _HIGHER_IS_BETTER else change
+        verdict = "REGRESSION" if worse > threshold else ("improved" if worse < -threshold else "")
+        rows.append((key, a, b, change, verdict))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("old")
+    parser.add_argument("new")
+    parser.add_argument("--threshold", type=float, default=10.0, help="percent change treated as significant")
+    args = parser.parse_args()
+
+    with open(args.old) as f:
+        old = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+
+    print(f"{old.get('revision')} -> {new.get('revision')}")
+    rows = compare(old, new, args.threshold)
+    width = max((len(r[0]) for r in rows), default=10)
+    for key, a, b, change, verdict in rows:
+        print(f"{key:{width}}  {a:12.3f}  {b:12.3f}  {change:+8.1f}%  {verdict}")
+    regressions = [r for r in rows if r[4] == "REGRESSION"]
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) above {args.threshold:.0f}%")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Page-load cost of /load-config and /load-positions
+Compares the old read-and-parse-per-request handlers (mounted under /legacy) with the
+in-memory store, for a first visit and for a revisit that sends If-None-Match
+"""
+
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+
+from harness import BenchServer, summarize, write_results
+from flask import jsonify
+from config_store import ConfigStore
+
+# Shaped like the admin panel's default configuration
+SAMPLE_CONFIG = {
+    "components": {
+        "rpi": {"name": "Raspberry Pi", "description": "SNMP Attacker", "ip": "Auto-detect",
+                "imageUrl": "/static/images/bd463120-b910-447d-82a5-571217c5db0e.jpg"},
+        "switch": {"name": "MOXA Switch", "description": "SNMP v1/v2c Enabled", "model": "MOXA EDR-8010",
+                   "defaultIP": "192.168.127.254", "imageUrl": "/static/images/moxa-edr-8010-series-datasheet-v1.jpg"},
+        **{f"device{i}": {"name": f"Device {i}", "type": "workstation", "port": f"Port {i}",
+                          "imageUrl": "/static/images/workstation-default.svg"} for i in range(1, 5)},
+    },
+    "display": {"hoverEffects": True, "packetAnimations": True, "attackIndicators": True,
+                "connectionUpColor": "#27ae60", "connectionDownColor": "#e74c3c", "attackColor": "#f39c12",
+                "showIPAddresses": True, "showPortNumbers": True, "compactMode": False,
+                "showDevice1": True, "showDevice2": True, "showDevice3": False, "showDevice4": False},
+}
+SAMPLE_POSITIONS = {f"device-{i}": {"x": 120 * i, "y": 340} for i in range(1, 5)}
+SAMPLE_POSITIONS.update({"rpi-component": {"x": 80, "y": 60}, "switch-component": {"x": 420, "y": 200}})
+
+
+def _mount_legacy(app, data_dir):
+    """The pre-store handlers: open, json.load and jsonify on every request"""
+    def legacy_document(name, key):
+        def view():
+            path = os.path.join(data_dir, name)
+            if os.path.exists(path):
+                with open(path, 'r') as f:
+                    return jsonify({"ok": True, key: json.load(f)})
+            return jsonify({"ok": True, key: {}})
+        return view
+
+    app.add_url_rule("/legacy/load-config", "legacy_load_config", legacy_document("app_config.json", "config"))
+    app.add_url_rule("/legacy/load-positions", "legacy_load_positions",
+                     legacy_document("component_positions.json", "positions"))
+
+
+def _wire_bytes(status, headers, body):
+    """Approximate bytes on the wire: status line, headers and body"""
+    return len(f"HTTP/1.1 {status}\r\n") + sum(len(f"{k}: {v}\r\n") for k, v in headers) + 2 + len(body)
+
+
+def _page_load(server, paths, etags=None):
+    """Fetch `paths` in order like one page load; returns (latencies, bytes, statuses, etags seen)"""
+    latencies, total_bytes, statuses, seen = [], 0, [], {}
+    for path in paths:
+        headers = {"If-None-Match": etags[path]} if etags and path in etags else None
+        start = time.perf_counter()
+        status, resp_headers, body = server.exchange("GET", path, headers=headers)
+        latencies.append(time.perf_counter() - start)
+        total_bytes += _wire_bytes(status, resp_headers, body)
+        statuses.append(status)
+        etag = dict(resp_headers).get("ETag")
+        if etag:
+            seen[path] = etag
+    return latencies, total_bytes, statuses, seen
+
+
+def _scenario(server, paths, loads, revisit=False):
+    latencies, page_bytes = [], []
+    etags = _page_load(server, paths)[3] if revisit else None
+    statuses = set()
+    for _ in range(loads):
+        lat, nbytes, codes, _ = _page_load(server, paths, etags)
+        latencies.extend(lat)
+        page_bytes.append(nbytes)
+        statuses.update(codes)
+    return {"requests_per_page": len(paths), "statuses": sorted(statuses),
+            "bytes_per_page": sum(page_bytes) / len(page_bytes),
+            "latency_ms": summarize(latencies)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--loads", type=int, default=300, help="simulated page loads per scenario")
+    parser.add_argument("--out", default=None, help="results directory (default benchmarks/results)")
+    args = parser.parse_args()
+
+    data_dir = tempfile.mkdtemp(prefix="config-bench-")
+    try:
+        with open(os.path.join(data_dir, "app_config.json"), "w") as f:
+            json.dump(SAMPLE_CONFIG, f, indent=2)
+        with open(os.path.join(data_dir, "component_positions.json"), "w") as f:
+            json.dump(SAMPLE_POSITIONS, f, indent=2)
+
+        server = BenchServer()
+        server.routes.store = ConfigStore(data_dir)
+        _mount_legacy(server.app, data_dir)
+        with server:
+            # diagram.js used to request /load-config twice per page (visibility, then customizations)
+            results = {
+                "before": _scenario(server, ["/legacy/load-config", "/legacy/load-config",
+                                             "/legacy/load-positions"], args.loads),
+                "after first visit": _scenario(server, ["/load-config", "/load-positions"], args.loads),
+                "after revisit": _scenario(server, ["/load-config", "/load-positions"], args.loads, revisit=True),
+            }
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+    for name, res in results.items():
+        print(f"{name:18s} {res['requests_per_page']} requests/page, {res['bytes_per_page']:.0f} bytes/page, "
+              f"p50 {res['latency_ms']['p50']:.2f} ms, p99 {res['latency_ms']['p99']:.2f} ms, "
+              f"status {res['statuses']}")
+    path = write_results("config_load", results, args.out) if args.out else write_results("config_load", results)
+    print(f"results written to {path}")
+
+
+if __name__ == "__main__":
+    main()
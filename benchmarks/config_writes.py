@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+SD card writes caused by dragging components around the diagram
+Replays a simulated drag session against /save-positions and counts the files actually written,
+versus the old handler that rewrote the whole document (indent=2) on every drag end
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from harness import BenchServer, write_results
+from config_store import ConfigStore
+
+COMPONENTS = ('raspberry-pi', 'network-switch', 'device-1', 'device-2', 'device-3', 'device-4')
+
+
+def _drag_session(seconds, rng):
+    """(offset seconds, component) drag ends: bursts of quick re-drags separated by pauses"""
+    events, t = [], 0.0
+    while t < seconds:
+        component = rng.choice(COMPONENTS)
+        for _ in range(rng.randint(1, 6)):
+            t += rng.uniform(0.3, 1.2)
+            events.append((t, component))
+        t += rng.uniform(0.5, 4.0)
+    return [e for e in events if e[0] < seconds]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=60.0, help="length of the drag session")
+    parser.add_argument("--seed", type=int, default=1, help="random seed for the session")
+    parser.add_argument("--out", default=None, help="results directory (default benchmarks/results)")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    session = _drag_session(args.seconds, rng)
+    data_dir = tempfile.mkdtemp(prefix="config-writes-")
+    writes = []
+    positions = {c: {"x": 100.0 * i, "y": 120.0} for i, c in enumerate(COMPONENTS)}
+    try:
+        with open(os.path.join(data_dir, "component_positions.json"), "w") as f:
+            json.dump(positions, f, indent=2)
+        server = BenchServer()
+        store = ConfigStore(data_dir)
+        server.routes.store = store
+        flush = store.positions.flush
+
+        def counting_flush():
+            wrote = flush()
+            if wrote:
+                writes.append(os.path.getsize(store.positions.path))
+            return wrote
+
+        store.positions.flush = counting_flush
+
+        legacy_bytes = 0
+        start = time.perf_counter()
+        with server:
+            for offset, component in session:
+                delay = start + offset - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                positions[component] = {"x": round(rng.uniform(0, 1300), 1), "y": round(rng.uniform(0, 250), 1)}
+                server.request("POST", "/save-positions", body={component: positions[component]})
+                # What the old handler wrote for the same drag end: the whole document, indented
+                legacy_bytes += len(json.dumps(positions, indent=2))
+            # Let the last debounce window expire, as it would on the Pi
+            time.sleep(store.debounce + 0.5)
+            store.close()
+            with open(store.positions.path) as f:
+                on_disk = json.load(f)
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+    results = {
+        "session_seconds": args.seconds,
+        "drag_ends": len(session),
+        "before": {"file_writes": len(session), "bytes_written": legacy_bytes},
+        "after": {"file_writes": len(writes), "bytes_written": sum(writes),
+                  "debounce_s": store.debounce, "max_delay_s": store.max_delay},
+        "final_state_matches": on_disk == positions,
+    }
+    print(f"{len(session)} drag ends in {args.seconds:.0f}s")
+    print(f"before: {len(session)} writes, {legacy_bytes} bytes")
+    print(f"after:  {len(writes)} writes, {sum(writes)} bytes (final state matches: {on_disk == positions})")
+    path = write_results("config_writes", results, args.out) if args.out else write_results("config_writes", results)
+    print(f"results written to {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Round-trip latency of GPIO commands through the GPIO daemon
+Runs gpio_daemon.GPIODaemon over SimulatedPi in a separate process and times GPIOClient calls
+over the Unix socket, against the same calls made in process on GPIOController
+
+    python benchmarks/gpio_daemon.py
+    python benchmarks/gpio_daemon.py --calls 20000 --threads 4
+"""
+
+import argparse
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+
+from harness import summarize, write_results
+from gpio_controller import GPIOController, SimulatedPi
+from gpio_client import GPIOClient
+
+OPERATIONS = {
+    "get_status": lambda g: g.get_status(),
+    "turn_on_pin": lambda g: g.turn_on_pin("9"),
+    "apply_frame": lambda g: g._apply_states(True, False, True, False, True, False, True, False,
+                                             True, False, True, False, True, False, True, False),
+}
+
+
+def _daemon_process(socket_path, ready):
+    from gpio_daemon import GPIODaemon
+    from command_executor import CommandExecutor
+    gpio = GPIOController(pi=SimulatedPi())
+    GPIODaemon(gpio, CommandExecutor(gpio), socket_path).start()
+    ready.set()
+    threading.Event().wait()
+
+
+def _time_calls(gpio, op, calls, threads):
+    """Per-call latencies of `op` issued from `threads` threads"""
+    latencies, lock = [], threading.Lock()
+
+    def worker():
+        local = []
+        for _ in range(calls // threads):
+            start = time.perf_counter()
+            op(gpio)
+            local.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(local)
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    start = time.perf_counter()
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    return latencies, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=10000, help="calls per operation")
+    parser.add_argument("--threads", type=int, default=1, help="concurrent calling threads")
+    parser.add_argument("--out", default=None, help="results directory (default benchmarks/results)")
+    args = parser.parse_args()
+
+    socket_path = os.path.join(tempfile.mkdtemp(prefix="gpio-daemon-"), "gpio.sock")
+    ctx = multiprocessing.get_context("spawn")
+    ready = ctx.Event()
+    daemon = ctx.Process(target=_daemon_process, args=(socket_path, ready), daemon=True)
+    daemon.start()
+    ready.wait(30)
+
+    local = GPIOController(pi=SimulatedPi())
+    remote = GPIOClient(socket_path)
+    remote.wait_ready()
+    results = {"calls": args.calls, "threads": args.threads}
+    try:
+        for name, op in OPERATIONS.items():
+            for label, gpio in (("in_process", local), ("daemon", remote)):
+                _time_calls(gpio, op, min(1000, args.calls), args.threads)  # warm-up
+                latencies, elapsed = _time_calls(gpio, op, args.calls, args.threads)
+                results.setdefault(name, {})[label] = {"calls_per_s": len(latencies) / elapsed,
+                                                       "latency_us": summarize(latencies, 1e6)}
+            d, p = results[name]["daemon"]["latency_us"], results[name]["in_process"]["latency_us"]
+            print(f"{name:12s} in process p50 {p['p50']:6.1f} us   daemon p50 {d['p50']:6.1f} us  "
+                  f"p99 {d['p99']:6.1f} us  ({results[name]['daemon']['calls_per_s']:.0f} calls/s)")
+    finally:
+        remote.cleanup()
+        daemon.terminate()
+
+    path = write_results("gpio_daemon", results, args.out) if args.out else write_results("gpio_daemon", results)
+    print(f"results written to {path}")
+
+
+if __name__ == "__main__":
+    main()
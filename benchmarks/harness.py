@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Shared fixtures for the LED server benchmarks
+Runs the real Routes app on loopback against the simulated GPIO backend,
+stand-in SNMP tools and loopback UDP/TCP sinks, and writes JSON results
+"""
+
+import http.client
+import json
+import os
+import platform
+import queue
+import socket
+import stat
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from werkzeug.serving import make_server
+from gpio_controller import GPIOController, SimulatedPi
+from command_executor import CommandExecutor
+from routes import Routes
+from wsgi_server import PooledWSGIServer
+import logging_setup
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+# Canned replies modelled on a Moxa EDR with 8 ports
+_IFNAMES = "\n".join(f'IF-MIB::ifName.{i} = STRING: {i}' for i in range(1, 9))
+_ADMIN = "\n".join(f'IF-MIB::ifAdminStatus.{i} = INTEGER: up(1)' for i in range(1, 9))
+_OPER = "\n".join(f'IF-MIB::ifOperStatus.{i} = INTEGER: up(1)' for i in range(1, 9))
+
+_SNMP_SHIM = """#!/bin/sh
+# Stand-in SNMP agent: answers like net-snmp tools after a fixed agent delay, plus a one-time
+# delay on the first call (ARP, agent engine discovery, cold tool start)
+if [ ! -e "{marker}" ]; then
+  touch "{marker}"
+  sleep {first_contact}
+fi
+sleep {delay}
+case "$*" in
+  *1.3.6.1.2.1.31.1.1.1.1*) printf '%s\\n' "{names}" ;;
+  *1.3.6.1.2.1.2.2.1.7*) printf '%s\\n' "{admin}" ;;
+  *1.3.6.1.2.1.2.2.1.8*) printf '%s\\n' "{oper}" ;;
+  *) echo "SNMPv2-MIB::sysUpTime.0 = Timeticks: (1234) 0:00:12.34" ;;
+esac
+"""
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of an unsorted list"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    idx = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[idx]
+
+
+def summarize(samples, scale=1e3):
+    """p50/p90/p99/max/mean of latency samples (seconds), scaled to ms by default"""
+    if not samples:
+        return {"count": 0}
+    return {
+        "count": len(samples),
+        "mean": sum(samples) / len(samples) * scale,
+        "p50": percentile(samples, 50) * scale,
+        "p90": percentile(samples, 90) * scale,
+        "p99": percentile(samples, 99) * scale,
+        "max": max(samples) * scale,
+    }
+
+
+def install_snmp_agent(delay=0.02, first_contact=0.0):
+    """Put stand-in snmpwalk/snmpget/snmpset on PATH; returns the temp dir"""
+    bindir = tempfile.mkdtemp(prefix="bench-snmp-")
+    script = _SNMP_SHIM.format(delay=delay, first_contact=first_contact, marker=os.path.join(bindir, "contacted"),
+                               names=_IFNAMES, admin=_ADMIN, oper=_OPER)
+    for tool in ("snmpwalk", "snmpget", "snmpset"):
+        path = os.path.join(bindir, tool)
+        with open(path, 'w') as f:
+            f.write(script)
+        os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+    os.environ["PATH"] = bindir + os.pathsep + os.environ.get("PATH", "")
+    return bindir
+
+
+class LoopbackSink:
+    """Loopback UDP and TCP listeners that count what crafted-packet routes send"""
+
+    def __init__(self):
+        self.udp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.udp.bind(("127.0.0.1", 0))
+        self.tcp = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.tcp.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.tcp.bind(("127.0.0.1", 0))
+        self.tcp.listen(128)
+        self.udp_port = self.udp.getsockname()[1]
+        self.tcp_port = self.tcp.getsockname()[1]
+        self.udp_packets = 0
+        self.tcp_connections = 0
+        self._stop = False
+        threading.Thread(target=self._udp_loop, name="bench-udp-sink", daemon=True).start()
+        threading.Thread(target=self._tcp_loop, name="bench-tcp-sink", daemon=True).start()
+
+    def _udp_loop(self):
+        while not self._stop:
+            try:
+                self.udp.recv(65535)
+                self.udp_packets += 1
+            except OSError:
+                return
+
+    def _tcp_loop(self):
+        while not self._stop:
+            try:
+                conn, _ = self.tcp.accept()
+            except OSError:
+                return
+            self.tcp_connections += 1
+            threading.Thread(target=self._drain, args=(conn,), daemon=True).start()
+
+    @staticmethod
+    def _drain(conn):
+        with conn:
+            try:
+                while conn.recv(65535):
+                    pass
+            except OSError:
+                pass
+
+    def close(self):
+        self._stop = True
+        self.udp.close()
+        self.tcp.close()
+
+
+class ThrottledLink:
+    """Loopback TCP proxy in front of a port that models a slow link: added round trip per
+    connection and per response, and a bandwidth cap shared by all connections in each direction"""
+
+    def __init__(self, target_port, rtt=0.2, down_kbps=1000, up_kbps=None):
+        self.target_port = target_port
+        self.rtt = rtt
+        self.down_bps = down_kbps * 1000 / 8
+        self.up_bps = (up_kbps or down_kbps) * 1000 / 8
+        self._free_at = {"up": 0.0, "down": 0.0}
+        self._lock = threading.Lock()
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind(("127.0.0.1", 0))
+        self.listener.listen(128)
+        self.port = self.listener.getsockname()[1]
+        threading.Thread(target=self._accept_loop, name="bench-link", daemon=True).start()
+
+    def _transmit_done(self, direction, nbytes):
+        """Time the last byte of `nbytes` leaves the shared link in `direction`"""
+        rate = self.down_bps if direction == "down" else self.up_bps
+        with self._lock:
+            start = max(time.monotonic(), self._free_at[direction])
+            self._free_at[direction] = start + nbytes / rate
+            return self._free_at[direction]
+
+    def _accept_loop(self):
+        while True:
+            try:
+                client, _ = self.listener.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._connect, args=(client,), daemon=True).start()
+
+    def _connect(self, client):
+        # TCP handshake over the slow link
+        time.sleep(self.rtt)
+        try:
+            upstream = socket.create_connection(("127.0.0.1", self.target_port))
+        except OSError:
+            client.close()
+            return
+        for src, dst, direction in ((client, upstream, "up"), (upstream, client, "down")):
+            threading.Thread(target=self._pump, args=(src, dst, direction), daemon=True).start()
+
+    def _pump(self, src, dst, direction):
+        """Read as fast as the sender writes; a second thread delivers each chunk when the link would"""
+        pending = queue.Queue()
+        threading.Thread(target=self._deliver, args=(pending, dst), daemon=True).start()
+        try:
+            while True:
+                chunk = src.recv(65536)
+                if not chunk:
+                    break
+                pending.put((self._transmit_done(direction, len(chunk)) + self.rtt / 2, chunk))
+        except OSError:
+            pass
+        pending.put((0.0, None))
+
+    @staticmethod
+    def _deliver(pending, dst):
+        while True:
+            deliver_at, chunk = pending.get()
+            delay = deliver_at - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            try:
+                if chunk is None:
+                    dst.shutdown(socket.SHUT_WR)
+                    return
+                dst.sendall(chunk)
+            except OSError:
+                return
+
+    def close(self):
+        self.listener.close()
+
+
+class BenchServer:
+    """The real Routes app on a loopback port, backed by SimulatedPi; admission control is off unless asked
+    for, since one loopback client would trip its per-client rate limits"""
+
+    def __init__(self, write_latency=0.0, server_mode="development", admission=False):
+        logging_setup.setup_logging(level="WARNING")
+        self.pi = SimulatedPi(write_latency=write_latency)
+        self.gpio = GPIOController(pi=self.pi)
+        self.cmd = CommandExecutor(self.gpio)
+        self.routes = Routes(self.gpio, self.cmd, admission=admission)
+        self.app = self.routes.get_app()
+        if server_mode == "threaded":
+            self.server = PooledWSGIServer("127.0.0.1", 0, self.app)
+        else:
+            self.server = make_server("127.0.0.1", 0, self.app, threaded=True)
+            self.server.daemon_threads = True
+        self.port = self.server.server_port
+        self.thread = threading.Thread(target=self.server.serve_forever, name="bench-server", daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+        self.gpio.cleanup()
+
+    def request(self, method, path, body=None, timeout=30):
+        """One request on a fresh connection; returns (status, body bytes)"""
+        status, _, data = self.exchange(method, path, body=body, timeout=timeout)
+        return status, data
+
+    def exchange(self, method, path, body=None, headers=None, timeout=30):
+        """One request on a fresh connection; returns (status, response headers, body bytes)"""
+        conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=timeout)
+        try:
+            headers = dict(headers or {})
+            if body is not None:
+                headers["Content-Type"] = "application/json"
+            conn.request(method, path, body=json.dumps(body) if body is not None else None, headers=headers)
+            resp = conn.getresponse()
+            return resp.status, resp.getheaders(), resp.read()
+        finally:
+            conn.close()
+
+
+def process_stats():
+    """RSS (KiB), thread count and open fds for this process, from /proc"""
+    stats = {"threads": threading.active_count()}
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    stats["rss_kib"] = int(line.split()[1])
+                elif line.startswith("Threads:"):
+                    stats["os_threads"] = int(line.split()[1])
+        stats["fds"] = len(os.listdir("/proc/self/fd"))
+    except OSError:
+        pass
+    return stats
+
+
+def git_revision():
+    """Short commit hash plus a dirty marker, or 'unknown' outside a checkout"""
+    try:
+        rev = subprocess.run(["git", "-C", ROOT, "rev-parse", "--short", "HEAD"],
+                             capture_output=True, text=True, timeout=5).stdout.strip()
+        dirty = subprocess.run(["git", "-C", ROOT, "status", "--porcelain", "--untracked-files=no"],
+                               capture_output=True, text=True, timeout=5).stdout.strip()
+        return (rev or "unknown") + ("-dirty" if dirty else "")
+    except (OSError, subprocess.SubprocessError):
+        return "unknown"
+
+
+def write_results(name, results, out_dir=RESULTS_DIR):
+    """Write results with environment metadata; returns the file path"""
+    os.makedirs(out_dir, exist_ok=True)
+    revision = git_revision()
+    doc = {
+        "suite": name,
+        "revision": revision,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "results": results,
+    }
+    path = os.path.join(out_dir, f"{name}-{time.strftime('%Y%m%d-%H%M%S')}-{revision}.json")
+    with open(path, 'w') as f:
+        json.dump(doc, f, indent=2, sort_keys=True)
+    return path
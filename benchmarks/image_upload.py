@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Bytes written per image upload and image bytes sent per diagram load
+Uploads a mix of new and repeated images into a scratch images folder and compares the bytes written
+and stored with the old handler (saved to uploads/, then copied to static/images under a timestamped
+name), then loads the diagram's images as thumbnails versus the full-size originals
+"""
+
+import argparse
+import http.client
+import os
+import re
+import shutil
+import tempfile
+import time
+import uuid
+
+from harness import BenchServer, write_results
+import routes
+from metrics import METRICS
+
+_IMAGE_REF = re.compile(rb'(?:href|src)="/thumbs/([^"]+)"')
+SOURCE_IMAGES = ("moxa-edr-8010-series-datasheet-v1.jpg", "bd463120-b910-447d-82a5-571217c5db0e.jpg",
+                 "seacure-logo.png")
+
+
+def _multipart(filename, data, component="rpi"):
+    boundary = uuid.uuid4().hex
+    head = (f'--{boundary}\r\nContent-Disposition: form-data; name="component"\r\n\r\n{component}\r\n'
+            f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+            f'Content-Type: application/octet-stream\r\n\r\n')
+    return head.encode() + data + f'\r\n--{boundary}--\r\n'.encode(), boundary
+
+
+def _upload(port, filename, data):
+    body, boundary = _multipart(filename, data)
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    try:
+        conn.request("POST", "/upload-image", body=body,
+                     headers={"Content-Type": f"multipart/form-data; boundary={boundary}"})
+        resp = conn.getresponse()
+        resp.read()
+        return resp.status
+    finally:
+        conn.close()
+
+
+def _disk_usage(directory):
+    return sum(e.stat().st_size for e in os.scandir(directory) if e.is_file())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeats", type=int, default=4, help="times each source image is uploaded")
+    parser.add_argument("--out", default=None, help="results directory (default benchmarks/results)")
+    args = parser.parse_args()
+
+    # Scratch copy of static/images so uploads and thumbnails stay out of the working tree
+    images_dir = routes.STATIC_IMAGES_FOLDER
+    scratch = tempfile.mkdtemp(prefix="image-upload-")
+    for entry in os.scandir(images_dir):
+        if entry.is_file():
+            shutil.copy2(entry.path, scratch)
+    routes.STATIC_IMAGES_FOLDER = scratch
+    routes.THUMBNAIL_FOLDER = os.path.join(scratch, "thumbs")
+    sources = {}
+    for name in SOURCE_IMAGES:
+        with open(os.path.join(scratch, name), "rb") as f:
+            sources[name] = f.read()
+
+    written = METRICS.get("image_upload_bytes_written_total").labels()
+    try:
+        with BenchServer() as server:
+            stored_before, written_before = _disk_usage(scratch), written.value
+            uploads = legacy_written = 0
+            for _ in range(args.repeats):
+                for name, data in sources.items():
+                    assert _upload(server.port, name, data) == 200
+                    uploads += 1
+                    # The old handler wrote every upload twice (uploads/ and static/images) and kept both
+                    legacy_written += 2 * len(data)
+            after_written = written.value - written_before
+            after_stored = _disk_usage(scratch) - stored_before
+
+            # The images a diagram load fetches: thumbnails now, the originals before
+            deadline = time.monotonic() + 30
+            while server.routes.thumbnails.pending() and time.monotonic() < deadline:
+                time.sleep(0.05)
+            _, page = server.request("GET", "/")
+            refs = sorted({m.decode() for m in _IMAGE_REF.findall(page)})
+            thumb_bytes = sum(len(server.request("GET", f"/thumbs/{r}")[1]) for r in refs)
+            original_bytes = sum(len(server.request("GET", f"/static/images/{r}")[1]) for r in refs)
+            thumbnailer = server.routes.thumbnails
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    results = {
+        "uploads": uploads,
+        "distinct_images": len(sources),
+        "before": {"bytes_written": legacy_written, "bytes_stored": legacy_written,
+                   "bytes_written_per_upload": legacy_written // uploads, "diagram_image_bytes": original_bytes},
+        "after": {"bytes_written": after_written, "bytes_stored": after_stored,
+                  "bytes_written_per_upload": after_written // uploads, "diagram_image_bytes": thumb_bytes,
+                  "thumbnail_format": thumbnailer.format if thumbnailer.available else None},
+        "diagram_images": refs,
+    }
+    print(f"{uploads} uploads of {len(sources)} distinct images")
+    print(f"before: {legacy_written // uploads} bytes written per upload, {legacy_written} bytes stored")
+    print(f"after:  {after_written // uploads} bytes written per upload, {after_stored} bytes stored")
+    print(f"diagram images: {original_bytes} bytes full size, {thumb_bytes} bytes as thumbnails ({len(refs)} images)")
+    path = write_results("image_upload", results, args.out) if args.out else write_results("image_upload", results)
+    print(f"results written to {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Operation journal append throughput and history query latency
+Appends a month of synthetic operations (one million by default) to a Journal in a temp directory,
+then times /history-style queries through the segment indexes against a plain scan of every line
+
+    python benchmarks/journal_history.py
+    python benchmarks/journal_history.py --entries 200000 --queries 20
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from harness import summarize, write_results
+from journal import Journal, SEGMENT_PREFIX, SEGMENT_SUFFIX
+
+TYPES = ("snmp_walk", "snmp_interfaces", "snmp_port_status", "snmp_portdown", "snmp_portup",
+         "packet_craft", "packet_raw", "packet_eicar", "flood_start", "flood_stop")
+# Roughly how often each type occurs: reads dominate, floods are rare
+WEIGHTS = (20, 20, 30, 8, 8, 6, 4, 2, 1, 1)
+DAY = 86400
+
+
+def fill(journal, entries, span, targets, rng):
+    """Append `entries` operations spread evenly over the last `span` seconds; returns per-call and total times"""
+    start_ts = time.time() - span
+    types = rng.choices(TYPES, WEIGHTS, k=entries)
+    calls = []
+    start = time.perf_counter()
+    for i in range(entries):
+        target = f"10.0.{rng.randrange(targets) // 250}.{rng.randrange(targets) % 250 + 1}"
+        t = time.perf_counter()
+        journal.append(types[i], target, rng.random() > 0.05, {"ifindex": str(rng.randrange(1, 9))},
+                       {"code": 0}, ts=start_ts + span * i / entries)
+        calls.append(time.perf_counter() - t)
+        if i % 5000 == 4999:
+            # Keep within the writer's queue so nothing is dropped
+            journal.flush(timeout=30)
+    journal.flush(timeout=60)
+    return calls, time.perf_counter() - start
+
+
+def full_scan(directory, since=None, type=None, target=None, limit=200):
+    """The same query without indexes: parse every line of every segment"""
+    found = []
+    for name in sorted(os.listdir(directory)):
+        if not (name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX)):
+            continue
+        with open(os.path.join(directory, name), "rb") as f:
+            for line in f:
+                entry = json.loads(line)
+                if since is not None and entry["ts"] < since:
+                    continue
+                if type is not None and entry["type"] != type:
+                    continue
+                if target is not None and entry["target"] != target:
+                    continue
+                found.append(entry)
+    return found[-limit:]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entries", type=int, default=1000000, help="operations to append")
+    parser.add_argument("--days", type=float, default=30, help="time span the operations cover")
+    parser.add_argument("--targets", type=int, default=2000, help="distinct target addresses")
+    parser.add_argument("--queries", type=int, default=10, help="runs per query")
+    parser.add_argument("--out", default=None, help="results directory (default benchmarks/results)")
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    directory = tempfile.mkdtemp(prefix="bench-journal-")
+    try:
+        # Retention off for the benchmark so all entries stay queryable
+        journal = Journal(directory, max_bytes=1 << 40).start()
+        calls, elapsed = fill(journal, args.entries, args.days * DAY, args.targets, rng)
+        stats = journal.stats()
+        results = {
+            "entries": args.entries, "days": args.days,
+            "append_call_us": summarize(calls, scale=1e6),
+            "append_throughput_per_s": args.entries / elapsed,
+            "segments": stats["segments"], "bytes": stats["bytes"],
+        }
+        print(f"appended {args.entries} entries in {elapsed:.1f}s ({results['append_throughput_per_s']:.0f}/s, "
+              f"call p50 {results['append_call_us']['p50']:.1f} us), {stats['segments']} segments, "
+              f"{stats['bytes'] / 1e6:.0f} MB")
+
+        now = time.time()
+        target = f"10.0.1.{rng.randrange(250) + 1}"
+        queries = {
+            "latest 200": {},
+            "last hour": {"since": now - 3600},
+            "last day, portdown": {"since": now - DAY, "type": "snmp_portdown"},
+            "flood runs, all time": {"type": "flood_start"},
+            "one target, all time": {"target": target},
+            "unknown type": {"type": "snmp_set"},
+        }
+        for name, q in queries.items():
+            indexed, scanned, reads = [], [], 0
+            for _ in range(args.queries):
+                start = time.perf_counter()
+                entries, reads = journal.query(q.get("since"), None, q.get("type"), q.get("target"), 200)
+                indexed.append(time.perf_counter() - start)
+            for _ in range(max(1, args.queries // 5)):
+                start = time.perf_counter()
+                expected = full_scan(directory, q.get("since"), q.get("type"), q.get("target"), 200)
+                scanned.append(time.perf_counter() - start)
+            if [e["seq"] for e in entries] != [e["seq"] for e in expected]:
+                raise RuntimeError(f"{name}: indexed query disagrees with the full scan")
+            results[name] = {"matches": len(entries), "segments_read": reads,
+                             "indexed_ms": summarize(indexed), "full_scan_ms": summarize(scanned)}
+            print(f"{name:24s} {len(entries):3d} entries, {reads:3d}/{stats['segments']} segments, "
+                  f"p50 {results[name]['indexed_ms']['p50']:8.2f} ms vs full scan {results[name]['full_scan_ms']['p50']:8.0f} ms")
+        journal.close()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    path = write_results("journal_history", results, args.out) if args.out else write_results("journal_history", results)
+    print(f"results written to {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+pigpio calls, CPU time and duty accuracy for dimmed LEDs
+Every LED fades to a dim level over --fade seconds and holds it for --hold seconds. Before, with
+on/off writes only, dimming takes software PWM: a Python loop toggling the bank every --pwm-period
+(pigpio's hardware PWM runs at LED_PWM_FREQUENCY) for as long as the LEDs stay dim. After, the
+compositor steps PWM duty cycles during the fade, writes only LEDs whose duty changed, and nothing
+while the level holds. Then a status overlay and an alert flash over the running chaser
+
+    python benchmarks/led_fades.py
+    python benchmarks/led_fades.py --level 64 --hold 5 --pwm-period 0.005
+"""
+
+import argparse
+import time
+
+from harness import summarize, write_results
+from config import LED_GAMMA, LED_PWM_FREQUENCY, PIN_NAMES
+from gpio_controller import GPIOController, SimulatedPi
+
+EVERYTHING = (1 << len(PIN_NAMES)) - 1
+
+
+def _measure(pi, run):
+    writes, cpu, start = pi.writes, time.process_time(), time.perf_counter()
+    extra = run() or {}
+    return {"writes": pi.writes - writes, "cpu_ms": (time.process_time() - cpu) * 1e3,
+            "seconds": time.perf_counter() - start, **extra}
+
+
+def software_dim(gpio, duty, fade, hold, period):
+    """Ramp to `duty` (0-1) with on/off frames, then hold it; returns the duty actually shown while holding"""
+    errors = []
+    start = time.perf_counter()
+    while True:
+        cycle = time.perf_counter()
+        elapsed = cycle - start
+        if elapsed >= fade + hold:
+            break
+        target = duty * min(1.0, elapsed / fade)
+        gpio._write_frame(EVERYTHING)
+        time.sleep(period * target)
+        lit = time.perf_counter()
+        gpio._write_frame(0)
+        time.sleep(period * (1 - target))
+        if elapsed >= fade:
+            errors.append(abs((lit - cycle) / (time.perf_counter() - cycle) - target))
+    return {"duty_error_pct": summarize(errors, scale=100)}
+
+
+def compositor_dim(gpio, level, fade, hold):
+    gpio.set_brightness("base", dict.fromkeys(PIN_NAMES, level), fade)
+    time.sleep(fade + hold)
+
+
+def overlay_steps(gpio, steps, period):
+    """Writes per chaser step with a status overlay and an alert flash drawn over it"""
+    gpio.set_brightness("status", {PIN_NAMES[-1]: 64})
+    gpio.strobe_error(blinks=steps, on_ms=period * 500, off_ms=period * 500)
+    gpio.start_chaser(period)
+    time.sleep(steps * period)
+    gpio.stop_anim()
+    gpio.clear_layer("status")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--level", type=int, default=128, help="brightness to dim to, 0-255")
+    parser.add_argument("--fade", type=float, default=1.0, help="seconds to reach the level")
+    parser.add_argument("--hold", type=float, default=3.0, help="seconds the level is held")
+    parser.add_argument("--pwm-period", type=float, default=1.0 / LED_PWM_FREQUENCY,
+                        help="software PWM period, seconds (default the hardware PWM frequency)")
+    parser.add_argument("--steps", type=int, default=40, help="chaser steps in the overlay run")
+    parser.add_argument("--out", default=None, help="results directory (default benchmarks/results)")
+    args = parser.parse_args()
+
+    results = {"level": args.level, "fade": args.fade, "hold": args.hold, "pwm_period": args.pwm_period}
+    duty = (args.level / 255) ** LED_GAMMA
+    pi = SimulatedPi()
+    gpio = GPIOController(pi=pi)
+    try:
+        scenarios = (
+            ("software PWM (before)", lambda: software_dim(gpio, duty, args.fade, args.hold, args.pwm_period)),
+            ("compositor (after)", lambda: compositor_dim(gpio, args.level, args.fade, args.hold)),
+        )
+        for name, run in scenarios:
+            gpio.clear_layer("base")
+            gpio._off_all()
+            results[name] = _measure(pi, run)
+            r = results[name]
+            accuracy = (f"  duty off by {r['duty_error_pct']['mean']:.1f} points on average, "
+                        f"{r['duty_error_pct']['max']:.1f} at worst" if "duty_error_pct" in r else "")
+            print(f"{name:28s} {r['writes']:7d} pigpio writes  {r['cpu_ms']:7.1f} ms CPU{accuracy}")
+        gpio.clear_layer("base")
+        gpio._off_all()
+        r = results["overlay on chaser"] = _measure(pi, lambda: overlay_steps(gpio, args.steps, 0.02))
+        r["writes_per_step"] = r["writes"] / args.steps
+        print(f"{'status + alert over chaser':28s} {r['writes_per_step']:7.1f} writes per chaser step "
+              f"({len(PIN_NAMES)} LEDs)")
+    finally:
+        gpio.cleanup()
+
+    path = write_results("led_fades", results, args.out) if args.out else write_results("led_fades", results)
+    print(f"results written to {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Compare request latency of print-based debug output against the queued logging pipeline
+stdout is a pipe drained by a deliberately slow reader, standing in for journald under load
+"""
+
+import io
+import logging
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from flask import Flask, jsonify, request
+import logging_setup
+
+PAYLOAD = {
+    "target_ip": "192.168.127.98", "target_port": 80, "protocol": "tcp",
+    "payload": "GET / HTTP/1.1\r\nHost: target\r\n\r\n" * 8,
+    "source_ip": "", "source_port": 12345, "source_mac": "", "target_mac": "",
+}
+RESULT = {"ok": True, "message": "TCP packet sent to 192.168.127.98:80", "payload_size": 312, "protocol": "TCP"}
+
+
+def _slow_pipe(chunk=4096, delay=0.002):
+    """Return a line-buffered writer whose reader drains `chunk` bytes every `delay` seconds"""
+    r, w = os.pipe()
+
+    def drain():
+        with os.fdopen(r, 'rb', buffering=0) as reader:
+            while reader.read(chunk):
+                time.sleep(delay)
+
+    threading.Thread(target=drain, name="slow-journal", daemon=True).start()
+    return io.TextIOWrapper(os.fdopen(w, 'wb'), line_buffering=True)
+
+
+def _build_app(out):
+    app = Flask(__name__)
+    log = logging.getLogger("routes")
+
+    @app.post("/print")
+    def with_print():
+        data = request.get_json()
+        print(f"DEBUG ROUTE: Received packet craft request: {data}", file=out)
+        print(f"DEBUG CRAFT: Starting craft_and_send_packet with data: {data}", file=out)
+        print(f"DEBUG ROUTE: Packet craft result: {RESULT}", file=out)
+        return jsonify(**RESULT)
+
+    @app.post("/logging")
+    def with_logging():
+        data = request.get_json()
+        log.debug("packet craft request: %s", data)
+        log.debug("craft_and_send_packet: %s", data)
+        log.debug("packet craft result: %s", RESULT)
+        return jsonify(**RESULT)
+
+    return app
+
+
+def _measure(client, path, n):
+    samples = []
+    for _ in range(n):
+        start = time.perf_counter()
+        client.post(path, json=PAYLOAD)
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    return samples[len(samples) // 2] * 1e6, samples[int(len(samples) * 0.99)] * 1e6
+
+
+def main(n=3000):
+    out = _slow_pipe()
+    client = _build_app(out).test_client()
+    rows = [("print (before)",) + _measure(client, "/print", n)]
+
+    logging_setup.setup_logging(level="INFO", stream=out)
+    rows.append(("logging, INFO (after, default)",) + _measure(client, "/logging", n))
+    logging_setup.shutdown_logging()
+
+    logging_setup.setup_logging(level="DEBUG", stream=out)
+    rows.append(("logging, DEBUG (after, verbose)",) + _measure(client, "/logging", n))
+    logging_setup.shutdown_logging()
+
+    print(f"{'mode':34} {'p50 us':>10} {'p99 us':>10}")
+    for name, p50, p99 in rows:
+        print(f"{name:34} {p50:10.1f} {p99:10.1f}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 3000)
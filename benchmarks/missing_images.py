@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Requests and time for a diagram whose images are missing
+Fetches 20 missing image URLs the way a browser does, following redirects, over a throttled link:
+the old redirect to /placeholder/<type> (mounted under /legacy) versus the placeholder served in place,
+plus a revisit where the browser cache already holds the placeholders
+"""
+
+import argparse
+import http.client
+import threading
+import time
+
+from harness import BenchServer, ThrottledLink, summarize, write_results
+
+COMPONENT_TYPES = ("rpi", "switch", "device1", "device2", "device3", "device4", "printer", "camera", "iot", "misc")
+
+
+def _mount_legacy(app):
+    """The pre-change handlers: redirect, then build the SVG string on every request"""
+    from flask import redirect
+    from placeholders import PLACEHOLDER_ICONS, DEFAULT_ICON, _SVG
+
+    def legacy_image(filename):
+        component_type = filename.split('-')[0] if '-' in filename else 'device'
+        return redirect(f'/legacy/placeholder/{component_type}')
+
+    def legacy_placeholder(component_type):
+        svg_content = _SVG.format(icon=PLACEHOLDER_ICONS.get(component_type, DEFAULT_ICON))
+        return svg_content, 200, {'Content-Type': 'image/svg+xml'}
+
+    app.add_url_rule("/legacy/static/images/<path:filename>", "legacy_image", legacy_image)
+    app.add_url_rule("/legacy/placeholder/<component_type>", "legacy_placeholder", legacy_placeholder)
+
+
+class BrowserCache:
+    """Fresh responses (max-age) are reused without a request; stale ones are revalidated"""
+
+    def __init__(self):
+        self.entries = {}
+
+    def fresh(self, path):
+        entry = self.entries.get(path)
+        return entry is not None and entry[0] > time.monotonic()
+
+
+def _fetch(port, path, cache, counts):
+    """GET `path`, following redirects; returns the final body"""
+    while True:
+        if cache is not None and cache.fresh(path):
+            return cache.entries[path][2]
+        headers = {}
+        if cache is not None and path in cache.entries and cache.entries[path][1]:
+            headers["If-None-Match"] = cache.entries[path][1]
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+        try:
+            conn.request("GET", path, headers=headers)
+            resp = conn.getresponse()
+            body = resp.read()
+        finally:
+            conn.close()
+        counts["requests"] += 1
+        counts["bytes"] += len(body)
+        if resp.status in (301, 302, 303, 307, 308):
+            path = resp.getheader("Location")
+            continue
+        if resp.status == 304:
+            body = cache.entries[path][2]
+        if cache is not None and resp.getheader("ETag"):
+            cc = resp.getheader("Cache-Control") or ""
+            max_age = int(cc.split("max-age=")[1].split(",")[0]) if "max-age=" in cc else 0
+            cache.entries[path] = (time.monotonic() + max_age, resp.getheader("ETag"), body)
+        return body
+
+
+def load_diagram(port, prefix, count, cache=None):
+    """Fetch `count` missing images in parallel; returns (seconds, requests, bytes)"""
+    counts = {"requests": 0, "bytes": 0}
+    lock = threading.Lock()
+
+    def fetch(i):
+        local = {"requests": 0, "bytes": 0}
+        _fetch(port, f"{prefix}/static/images/{COMPONENT_TYPES[i % len(COMPONENT_TYPES)]}-missing-{i}.png",
+               cache, local)
+        with lock:
+            counts["requests"] += local["requests"]
+            counts["bytes"] += local["bytes"]
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=fetch, args=(i,)) for i in range(count)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return time.perf_counter() - start, counts["requests"], counts["bytes"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", type=int, default=20, help="missing images on the diagram")
+    parser.add_argument("--rtt", type=float, default=0.3, help="round trip time in seconds")
+    parser.add_argument("--kbps", type=float, default=1000, help="link bandwidth in kbit/s")
+    parser.add_argument("--loads", type=int, default=5, help="diagram loads per mode")
+    parser.add_argument("--out", default=None, help="results directory (default benchmarks/results)")
+    args = parser.parse_args()
+
+    results = {"images": args.images, "rtt_s": args.rtt, "kbps": args.kbps}
+    with BenchServer() as server:
+        _mount_legacy(server.app)
+        link = ThrottledLink(server.port, rtt=args.rtt, down_kbps=args.kbps)
+        modes = (("redirect (before)", "/legacy", False), ("in place (after)", "", False),
+                 ("revisit, redirect (before)", "/legacy", True), ("revisit, in place (after)", "", True))
+        for name, prefix, warm in modes:
+            times = []
+            for _ in range(args.loads):
+                cache = BrowserCache() if warm else None
+                if warm:
+                    load_diagram(link.port, prefix, args.images, cache)
+                elapsed, requests, nbytes = load_diagram(link.port, prefix, args.images, cache)
+                times.append(elapsed)
+            results[name] = {"requests": requests, "bytes": nbytes, "load_ms": summarize(times)}
+            print(f"{name:28s} {requests} requests, {nbytes} bytes, p50 {results[name]['load_ms']['p50']:.0f} ms")
+        link.close()
+
+    path = write_results("missing_images", results, args.out) if args.out else write_results("missing_images", results)
+    print(f"results written to {path}")
+
+
+if __name__ == "__main__":
+    main()
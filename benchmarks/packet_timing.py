@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Where the time of a crafted send goes
+Crafted packets to loopback listeners with injected delays: a TCP service that answers after --reply-delay,
+a TCP port whose accept queue is full so SYNs are dropped (a silently dropping firewall), a closed port,
+and a UDP service that answers after --reply-delay. Before, the result was ok/error after a fixed 3 s
+timeout; after, each result carries stage timings, and /packet/latency holds per-target histograms.
+Checks that each injected delay shows up in the stage it was injected into
+
+    python benchmarks/packet_timing.py
+    python benchmarks/packet_timing.py --reply-delay 0.3 --repeat 20
+"""
+
+import argparse
+import json
+import socket
+import threading
+import time
+
+from harness import BenchServer, summarize, write_results
+
+
+class DelayedService:
+    """Loopback TCP and UDP listeners that reply `delay` seconds after a request arrives"""
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.tcp = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.tcp.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.tcp.bind(("127.0.0.1", 0))
+        self.tcp.listen(64)
+        self.udp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.udp.bind(("127.0.0.1", 0))
+        threading.Thread(target=self._accept_loop, daemon=True).start()
+        threading.Thread(target=self._udp_loop, daemon=True).start()
+
+    def _accept_loop(self):
+        while True:
+            try:
+                conn, _ = self.tcp.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._answer, args=(conn,), daemon=True).start()
+
+    def _answer(self, conn):
+        with conn:
+            try:
+                conn.recv(65536)
+                time.sleep(self.delay)
+                conn.sendall(b"reply")
+                while conn.recv(65536):
+                    pass
+            except OSError:
+                pass
+
+    def _udp_loop(self):
+        while True:
+            try:
+                _, peer = self.udp.recvfrom(65536)
+            except OSError:
+                return
+            threading.Timer(self.delay, self.udp.sendto, (b"reply", peer)).start()
+
+    def close(self):
+        self.tcp.close()
+        self.udp.close()
+
+
+class BlackHole:
+    """A listener whose accept queue is full, so the kernel drops further SYNs without answering"""
+
+    def __init__(self):
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.bind(("127.0.0.1", 0))
+        self.listener.listen(0)
+        self.port = self.listener.getsockname()[1]
+        self.fillers = []
+        for _ in range(4):
+            filler = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            filler.setblocking(False)
+            try:
+                filler.connect(("127.0.0.1", self.port))
+            except BlockingIOError:
+                pass
+            self.fillers.append(filler)
+        time.sleep(0.2)
+
+    def close(self):
+        for sock in self.fillers + [self.listener]:
+            sock.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--reply-delay", type=float, default=0.1, help="seconds the services wait before replying")
+    parser.add_argument("--timeout", type=float, default=1.0, help="send timeout, seconds")
+    parser.add_argument("--repeat", type=int, default=10, help="sends per case")
+    parser.add_argument("--out", default=None, help="results directory (default benchmarks/results)")
+    args = parser.parse_args()
+
+    service = DelayedService(args.reply_delay)
+    hole = BlackHole()
+    tcp_port, udp_port = service.tcp.getsockname()[1], service.udp.getsockname()[1]
+    cases = (
+        ("slow TCP service", {"protocol": "tcp", "target_port": tcp_port}, "response", args.reply_delay),
+        ("dropped SYNs", {"protocol": "tcp", "target_port": hole.port}, "connect", args.timeout),
+        ("closed TCP port", {"protocol": "tcp", "target_port": 1}, "connect", 0.0),
+        ("slow UDP service", {"protocol": "udp", "target_port": udp_port}, "response", args.reply_delay),
+    )
+    results = {"reply_delay": args.reply_delay, "timeout": args.timeout, "repeat": args.repeat}
+    try:
+        with BenchServer() as server:
+            for name, fields, stage, injected in cases:
+                body = dict(fields, target_ip="127.0.0.1", payload="probe", timeout=args.timeout, await_response=True)
+                totals, stage_ms, outcomes = [], [], set()
+                for _ in range(args.repeat):
+                    start = time.perf_counter()
+                    status, data = server.request("POST", "/packet/craft", body)
+                    totals.append(time.perf_counter() - start)
+                    result = json.loads(data)
+                    timing = result["timing"]
+                    stage_ms.append(timing[f"{stage}_ms"] / 1e3)
+                    outcomes.add(timing.get("failed_stage") or timing.get("response") or "ok")
+                # Within 20 ms of the injected delay
+                attributed = abs(summarize(stage_ms)["p50"] - injected * 1e3) < 20
+                results[name] = {"request_ms": summarize(totals), f"{stage}_ms": summarize(stage_ms),
+                                 "outcomes": sorted(outcomes), "attributed": attributed,
+                                 "kernel_timestamps": timing["kernel_timestamps"], "last_timing": timing}
+                print(f"{name:18s} request {summarize(totals)['p50']:7.1f} ms  {stage} {summarize(stage_ms)['p50']:7.1f} ms "
+                      f"(injected {injected * 1e3:.0f})  {'/'.join(sorted(outcomes)):8s} "
+                      f"{'ok' if attributed else 'MISATTRIBUTED'}  kernel timestamps {timing['kernel_timestamps']}")
+            latency = json.loads(server.request("GET", "/packet/latency?target=127.0.0.1")[1])["targets"]
+            results["latency"] = latency
+            for protocol, stages in sorted(latency.get("127.0.0.1", {}).items()):
+                print(f"/packet/latency {protocol}: " + "  ".join(
+                    f"{stage} n={s['count']} p50<={s['p50_ms']} ms" for stage, s in stages.items()))
+    finally:
+        service.close()
+        hole.close()
+
+    path = write_results("packet_timing", results, args.out) if args.out else write_results("packet_timing", results)
+    print(f"results written to {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Time to a correct diagram over a throttled link
+Loads / like a browser would (page, then its CSS/JS/images in parallel, then whatever the script
+still has to fetch) through a proxy that models ship Wi-Fi: without and with the inline bootstrap,
+and a revisit that reuses a browser cache (immutable assets skipped, the rest revalidated)
+
+    python benchmarks/page_load.py                     # 300 ms RTT, 1 Mbit/s
+    python benchmarks/page_load.py --rtt 0.6 --kbps 256
+"""
+
+import argparse
+import gzip
+import http.client
+import re
+import threading
+import time
+
+from harness import BenchServer, ThrottledLink, summarize, write_results
+
+_ASSET = re.compile(rb'(?:href|src)="(/(?:static|thumbs)/[^"]+)"')
+_BOOTSTRAP = b'id="bootstrap-data"'
+# What diagram.js fetches on load when there is no bootstrap
+_DIAGRAM_FETCHES = ("/load-config", "/load-positions")
+
+
+class BrowserCache:
+    """Just enough of a browser HTTP cache: immutable responses are reused, the rest revalidated"""
+
+    def __init__(self):
+        self.immutable = set()
+        self.etags = {}
+        self.bodies = {}
+
+
+def _get(port, path, cache=None, timeout=60):
+    """GET like a browser; returns (body, bytes transferred); served from `cache` when it can be"""
+    if cache is not None and path in cache.immutable:
+        return cache.bodies[path], 0
+    headers = {"Accept-Encoding": "gzip, deflate, br"}
+    if cache is not None and path in cache.etags:
+        headers["If-None-Match"] = cache.etags[path]
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=timeout)
+    try:
+        conn.request("GET", path, headers=headers)
+        resp = conn.getresponse()
+        data = resp.read()
+    finally:
+        conn.close()
+    if resp.status == 304:
+        return cache.bodies[path], len(data)
+    body = gzip.decompress(data) if resp.getheader("Content-Encoding") == "gzip" else data
+    if cache is not None:
+        cache.bodies[path] = body
+        if "immutable" in (resp.getheader("Cache-Control") or ""):
+            cache.immutable.add(path)
+        elif resp.getheader("ETag"):
+            cache.etags[path] = resp.getheader("ETag")
+    return body, len(data)
+
+
+def _parallel(port, paths, sizes, cache=None):
+    """Fetch `paths` concurrently, as a browser does within its per-host connection limit"""
+    def fetch(path):
+        sizes[path] = _get(port, path, cache)[1]
+
+    threads = [threading.Thread(target=fetch, args=(p,)) for p in paths]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+
+def load_page(port, use_bootstrap, cache=None):
+    """One page load; returns (seconds to correct diagram, requests sent, bytes transferred)"""
+    sizes = {}
+    start = time.perf_counter()
+    page, sizes["/"] = _get(port, "/", cache)
+    _parallel(port, [p.decode() for p in _ASSET.findall(page)], sizes, cache)
+    if not (use_bootstrap and _BOOTSTRAP in page):
+        _parallel(port, _DIAGRAM_FETCHES, sizes, cache)
+    requests = sum(1 for path in sizes if not (cache and path in cache.immutable and sizes[path] == 0))
+    return time.perf_counter() - start, requests, sum(sizes.values())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rtt", type=float, default=0.3, help="round trip time in seconds")
+    parser.add_argument("--kbps", type=float, default=1000, help="link bandwidth in kbit/s")
+    parser.add_argument("--loads", type=int, default=5, help="page loads per mode")
+    parser.add_argument("--out", default=None, help="results directory (default benchmarks/results)")
+    args = parser.parse_args()
+
+    results = {"rtt_s": args.rtt, "kbps": args.kbps}
+    with BenchServer() as server:
+        link = ThrottledLink(server.port, rtt=args.rtt, down_kbps=args.kbps)
+        modes = (("fetch after script", False, False), ("inline bootstrap", True, False),
+                 ("revisit, warm cache", True, True))
+        for name, use_bootstrap, warm in modes:
+            times = []
+            for _ in range(args.loads):
+                cache = BrowserCache() if warm else None
+                if warm:
+                    load_page(link.port, use_bootstrap, cache)
+                elapsed, requests, nbytes = load_page(link.port, use_bootstrap, cache)
+                times.append(elapsed)
+            results[name] = {"requests": requests, "bytes": nbytes, "time_to_correct_ms": summarize(times)}
+            print(f"{name:20s} {requests} requests, {nbytes} bytes, "
+                  f"p50 {results[name]['time_to_correct_ms']['p50']:.0f} ms")
+        link.close()
+
+    path = write_results("page_load", results, args.out) if args.out else write_results("page_load", results)
+    print(f"results written to {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+pigpio writes and latency for manual pin control
+The old hand-written /on<N> handler (mounted under /legacy: stop_anim, then all-off, then one write,
+each pin a separate pigpio call) versus the table-driven /on<N> alias and /pins, which write one frame
+with a pigpio bank call per level; lighting several pins took one old request per pin
+
+    python benchmarks/pin_writes.py
+    python benchmarks/pin_writes.py --write-latency 0.0002 --repeats 500
+"""
+
+import argparse
+import time
+
+from harness import BenchServer, summarize, write_results
+
+
+def _mount_legacy(app, gpio):
+    """The pre-change handler: per-pin writes, and the pins cleared twice before the one that is lit"""
+    from flask import jsonify
+    from config import PIN_TABLE
+
+    pins = {name: (pin, active_low) for name, pin, active_low in PIN_TABLE}
+
+    def off_all():
+        for _, pin, active_low in PIN_TABLE:
+            gpio._set(pin, active_low, False)
+
+    def legacy_on(name):
+        pin, active_low = pins[name]
+        with gpio.anim_lock:
+            gpio._halt_anim()
+            off_all()
+        off_all()
+        gpio._set(pin, active_low, True)
+        return jsonify(ok=True)
+
+    app.add_url_rule("/legacy/on<name>", "legacy_on", legacy_on)
+
+
+def measure(server, paths, repeats):
+    """Issue `paths` in order, `repeats` times; returns requests, writes and latency per round"""
+    writes_before = server.pi.writes
+    latencies = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for path in paths:
+            status, body = server.request("GET", path)
+            if status != 200:
+                raise RuntimeError(f"{path}: {status} {body[:200]!r}")
+        latencies.append(time.perf_counter() - start)
+    return {
+        "requests": len(paths),
+        "writes": (server.pi.writes - writes_before) / repeats,
+        "latency_ms": summarize(latencies),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--write-latency", type=float, default=0.0001,
+                        help="seconds per simulated pigpio write (a pigpiod socket round trip)")
+    parser.add_argument("--repeats", type=int, default=200, help="rounds per scenario")
+    parser.add_argument("--out", default=None, help="results directory (default benchmarks/results)")
+    args = parser.parse_args()
+
+    three = ("17", "27", "22")
+    results = {"write_latency_s": args.write_latency, "repeats": args.repeats}
+    with BenchServer(write_latency=args.write_latency) as server:
+        from config import PIN_NAMES
+        _mount_legacy(server.app, server.gpio)
+        scenarios = (
+            ("one pin, /legacy/on17 (before)", ["/legacy/on17"]),
+            ("one pin, /on17 alias (after)", ["/on17"]),
+            ("one pin, /pins (after)", ["/pins?on=17"]),
+            ("three pins, /legacy/on<N> x3 (before)", [f"/legacy/on{name}" for name in three]),
+            ("three pins, /pins (after)", [f"/pins?on={','.join(three)}"]),
+            ("all pins, /legacy/on<N> x16 (before)", [f"/legacy/on{name}" for name in PIN_NAMES]),
+            ("all pins, /pins (after)", [f"/pins?on={','.join(PIN_NAMES)}"]),
+        )
+        for name, paths in scenarios:
+            results[name] = measure(server, paths, args.repeats)
+            r = results[name]
+            print(f"{name:40s} {r['requests']:2d} requests {r['writes']:5.1f} writes "
+                  f"p50 {r['latency_ms']['p50']:.2f} ms")
+
+    path = write_results("pin_writes", results, args.out) if args.out else write_results("pin_writes", results)
+    print(f"results written to {path}")
+
+
+if __name__ == "__main__":
+    main()
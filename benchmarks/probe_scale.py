@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Reachability probes for hundreds of devices
+--targets loopback addresses (127.0.1.x...) probed every --interval seconds for --duration seconds.
+Before: one thread per device making a blocking TCP connect each interval. After: probes.py, one asyncio
+thread with a shared ICMP socket (or TCP connects where ICMP sockets are not allowed). Reports threads,
+CPU per probe and how far each probe drifted from its schedule. ICMP needs net.ipv4.ping_group_range to
+include the running group
+
+    python benchmarks/probe_scale.py
+    python benchmarks/probe_scale.py --targets 500 --duration 20
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import threading
+import time
+
+from harness import summarize, write_results
+from probes import ProbeEngine
+
+
+def addresses(count):
+    return [f"127.0.{1 + i // 250}.{1 + i % 250}" for i in range(count)]
+
+
+def process_threads():
+    with open("/proc/self/status") as f:
+        return next(int(line.split()[1]) for line in f if line.startswith("Threads:"))
+
+
+class ThreadPerTarget:
+    """The obvious design: a thread per device, sleeping between blocking connects"""
+
+    def __init__(self, hosts, interval, timeout, port=22):
+        self.interval = interval
+        self.timeout = timeout
+        self.port = port
+        self.times = {host: [] for host in hosts}
+        self.answered = 0
+        self._stop = threading.Event()
+        self._threads = [threading.Thread(target=self._loop, args=(host,), daemon=True) for host in hosts]
+
+    def _loop(self, host):
+        import socket
+        next_at = time.monotonic()
+        while not self._stop.is_set():
+            self.times[host].append(time.monotonic())
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            try:
+                sock.connect((host, self.port))
+                self.answered += 1
+            except ConnectionRefusedError:
+                self.answered += 1
+            except OSError:
+                pass
+            finally:
+                sock.close()
+            next_at = max(next_at + self.interval, time.monotonic())
+            self._stop.wait(next_at - time.monotonic())
+
+    def start(self):
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def close(self):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join()
+
+
+class TimedEngine(ProbeEngine):
+    """ProbeEngine noting when each probe result came in"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.times = {}
+        self.answered = 0
+
+    def _record(self, device, rtt, method):
+        self.times.setdefault(device.key, []).append(time.monotonic())
+        self.answered += rtt is not None
+        super()._record(device, rtt, method)
+
+
+def drift(times, interval):
+    """Seconds each probe came later than one interval after the previous one"""
+    return [max(0.0, b - a - interval) for series in times.values() for a, b in zip(series, series[1:])]
+
+
+def run(probe, args):
+    cpu = time.process_time()
+    probe.start()
+    time.sleep(1.0)
+    threads = process_threads()
+    time.sleep(args.duration - 1.0)
+    probe.close()
+    cpu = time.process_time() - cpu
+    probes = sum(len(series) for series in probe.times.values())
+    return {"threads": threads, "probes": probes, "answered": probe.answered,
+            "expected": int(args.targets * args.duration / args.interval), "cpu_s": cpu,
+            "cpu_pct": cpu / args.duration * 100, "cpu_us_per_probe": cpu / max(probes, 1) * 1e6,
+            "drift_ms": summarize(drift(probe.times, args.interval))}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--targets", type=int, default=300, help="devices probed")
+    parser.add_argument("--interval", type=float, default=1.0, help="seconds between probes of one device")
+    parser.add_argument("--timeout", type=float, default=1.0, help="probe timeout, seconds")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds each design runs")
+    parser.add_argument("--out", default=None, help="results directory (default benchmarks/results)")
+    args = parser.parse_args()
+
+    hosts = addresses(args.targets)
+    baseline_threads = process_threads()
+    with tempfile.TemporaryDirectory() as tmp:
+        config_path = os.path.join(tmp, "app_config.json")
+        with open(config_path, "w") as f:
+            json.dump({"components": {f"device{i}": {"name": f"Device {i}", "ip": host}
+                                      for i, host in enumerate(hosts)}}, f)
+        engine = TimedEngine(config_path, extra=[], interval=args.interval, timeout=args.timeout)
+        results = {"targets": args.targets, "interval": args.interval, "duration": args.duration,
+                   "baseline_threads": baseline_threads}
+        for name, probe in (("thread per device (before)", ThreadPerTarget(hosts, args.interval, args.timeout)),
+                            ("probes.py (after)", engine)):
+            r = results[name] = run(probe, args)
+            print(f"{name:28s} {r['threads']:4d} threads  {r['probes']:5d}/{r['expected']} probes "
+                  f"({r['answered']} answered)  CPU {r['cpu_pct']:5.1f}% ({r['cpu_us_per_probe']:5.0f} us/probe)  "
+                  f"drift p50 {r['drift_ms']['p50']:5.2f} p99 {r['drift_ms']['p99']:6.2f} ms")
+        status = engine.status()
+        results["engine"] = {"icmp_error": engine.icmp_error,
+                             "methods": sorted({d["method"] for d in status.values() if d["method"]}),
+                             "up": sum(d["state"] == "up" for d in status.values())}
+        print(f"probes.py: {results['engine']['up']}/{args.targets} up via {'/'.join(results['engine']['methods'])}"
+              + (f"; {engine.icmp_error}" if engine.icmp_error else ""))
+
+    path = write_results("probe_scale", results, args.out) if args.out else write_results("probe_scale", results)
+    print(f"results written to {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+End-to-end benchmark suite for the LED server
+Writes a JSON result file per run; compare two runs with benchmarks/compare.py
+
+    python benchmarks/run.py                 # full suite incl. 10-minute soak
+    python benchmarks/run.py --quick         # short durations, 60s soak
+    python benchmarks/run.py --only sse,snmp
+"""
+
+import argparse
+import json
+import resource
+import selectors
+import socket
+import statistics
+import threading
+import time
+
+from harness import (BenchServer, LoopbackSink, install_snmp_agent, process_stats,
+                     summarize, write_results)
+
+SUITES = ("throughput", "sse", "animation", "snmp", "craft", "soak")
+
+
+def bench_throughput(server, path, clients=8, duration=5.0):
+    """Closed-loop RPS and latency for one GET path"""
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker():
+        local = []
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                status, _ = server.request("GET", path)
+                if status != 200:
+                    errors[0] += 1
+            except OSError:
+                errors[0] += 1
+            local.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=worker, name=f"bench-client-{i}") for i in range(clients)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    return {"rps": len(latencies) / elapsed, "errors": errors[0], "clients": clients,
+            "latency_ms": summarize(latencies)}
+
+
+def _open_sse(port, count):
+    socks = []
+    for _ in range(count):
+        s = socket.create_connection(("127.0.0.1", port), timeout=10)
+        s.sendall(b"GET /events HTTP/1.1\r\nHost: bench\r\nAccept: text/event-stream\r\n\r\n")
+        s.setblocking(False)
+        socks.append(s)
+    return socks
+
+
+def _read_events(sel, buffers, on_event, deadline):
+    """Pump every stream until on_event has returned True for all of them or the deadline passes"""
+    pending = set(buffers)
+    while pending and time.perf_counter() < deadline:
+        for key, _ in sel.select(timeout=0.05):
+            sock = key.fileobj
+            try:
+                chunk = sock.recv(65536)
+            except BlockingIOError:
+                continue
+            if not chunk:
+                pending.discard(sock)
+                continue
+            buffers[sock] += chunk
+            while b"\n\n" in buffers[sock]:
+                event, buffers[sock] = buffers[sock].split(b"\n\n", 1)
+                for line in event.split(b"\n"):
+                    if line.startswith(b"data: ") and sock in pending:
+                        try:
+                            data = json.loads(line[6:])
+                        except ValueError:
+                            continue
+                        if on_event(sock, data):
+                            pending.discard(sock)
+    return len(pending)
+
+
+def bench_sse_fanout(server, clients, rounds=5):
+    """Time from a pin change to each subscriber seeing it on /events"""
+    socks = _open_sse(server.port, clients)
+    sel = selectors.DefaultSelector()
+    buffers = {}
+    for s in socks:
+        sel.register(s, selectors.EVENT_READ)
+        buffers[s] = b""
+    # Wait until every subscriber has received its first event
+    missed_connect = _read_events(sel, buffers, lambda s, d: True, time.perf_counter() + 30)
+
+    latencies = []
+    missed = 0
+    for r in range(rounds):
+        pin = "17" if r % 2 == 0 else "27"
+        server.request("GET", f"/on{pin}")
+        changed_at = time.perf_counter()
+
+        def seen(sock, data, pin=pin):
+            if data.get("pins", {}).get(pin) == 1:
+                latencies.append(time.perf_counter() - changed_at)
+                return True
+            return False
+
+        missed += _read_events(sel, buffers, seen, changed_at + 10)
+
+    for s in socks:
+        sel.unregister(s)
+        s.close()
+    return {"clients": clients, "rounds": rounds, "missed": missed + missed_connect,
+            "latency_ms": summarize(latencies)}
+
+
+def bench_snmp_walk(server, iterations=20):
+    """Round trip of /snmp/walk against the stand-in agent"""
+    latencies = []
+    failures = 0
+    for _ in range(iterations):
+        start = time.perf_counter()
+        status, body = server.request("GET", "/snmp/walk?target=127.0.0.1&community=public")
+        latencies.append(time.perf_counter() - start)
+        if status != 200 or not json.loads(body).get("ok"):
+            failures += 1
+    return {"iterations": iterations, "failures": failures, "latency_ms": summarize(latencies)}
+
+
+def bench_animation(gpio, step_period, duration=3.0):
+    """Achieved frame rate and jitter of the chaser animation"""
+    stamps = []
+    apply_states = gpio._apply_states
+
+    def recording_apply(*states):
+        stamps.append(time.perf_counter())
+        apply_states(*states)
+
+    gpio._apply_states = recording_apply
+    try:
+        gpio.start_chaser(step_period)
+        time.sleep(duration)
+        gpio.stop_anim()
+    finally:
+        del gpio._apply_states
+    intervals = [b - a for a, b in zip(stamps, stamps[1:])]
+    if not intervals:
+        return {"frames": len(stamps)}
+    errors = [abs(i - step_period) for i in intervals]
+    return {
+        "target_fps": 1.0 / step_period,
+        "achieved_fps": len(intervals) / (stamps[-1] - stamps[0]),
+        "frames": len(stamps),
+        "interval_ms": summarize(intervals),
+        "jitter_ms": statistics.pstdev(intervals) * 1e3,
+        "abs_error_ms": summarize(errors),
+    }
+
+
+def bench_craft(server, sink, protocol, iterations=200):
+    """Latency of /packet/craft to the loopback sink"""
+    port = sink.tcp_port if protocol == "tcp" else sink.udp_port
+    body = {"target_ip": "127.0.0.1", "target_port": port, "protocol": protocol, "payload": "bench" * 20,
+            "source_port": 0}
+    latencies = []
+    failures = 0
+    for _ in range(iterations):
+        start = time.perf_counter()
+        status, resp = server.request("POST", "/packet/craft", body=body)
+        latencies.append(time.perf_counter() - start)
+        if status != 200 or not json.loads(resp).get("ok"):
+            failures += 1
+    return {"iterations": iterations, "failures": failures, "latency_ms": summarize(latencies)}
+
+
+def bench_soak(server, duration, sample_every=10.0):
+    """Mixed load for `duration` seconds, sampling memory, threads and fds"""
+    stop = threading.Event()
+    counts = {"requests": 0, "errors": 0, "sse_sessions": 0}
+
+    def poller(path, pause):
+        while not stop.is_set():
+            try:
+                status, _ = server.request("GET", path)
+                counts["requests"] += 1
+                if status != 200:
+                    counts["errors"] += 1
+            except OSError:
+                counts["errors"] += 1
+            stop.wait(pause)
+
+    def sse_churn():
+        while not stop.is_set():
+            socks = _open_sse(server.port, 5)
+            counts["sse_sessions"] += 5
+            stop.wait(5.0)
+            for s in socks:
+                s.close()
+
+    def demo():
+        while not stop.is_set():
+            try:
+                server.request("POST", "/demo/packet", body={})
+            except OSError:
+                counts["errors"] += 1
+            stop.wait(2.0)
+
+    workers = [threading.Thread(target=poller, args=("/status", 0.05), name="soak-status"),
+               threading.Thread(target=poller, args=("/status", 0.05), name="soak-status-2"),
+               threading.Thread(target=poller, args=("/on22", 0.2), name="soak-pin"),
+               threading.Thread(target=sse_churn, name="soak-sse"),
+               threading.Thread(target=demo, name="soak-demo")]
+    for w in workers:
+        w.start()
+
+    samples = []
+    start = time.perf_counter()
+    while time.perf_counter() - start < duration:
+        sample = process_stats()
+        sample["t"] = round(time.perf_counter() - start, 1)
+        samples.append(sample)
+        time.sleep(min(sample_every, max(0.0, duration - (time.perf_counter() - start))))
+    stop.set()
+    for w in workers:
+        w.join(timeout=10)
+    samples.append(dict(process_stats(), t=round(time.perf_counter() - start, 1)))
+
+    rss = [s["rss_kib"] for s in samples if "rss_kib" in s]
+    threads = [s["threads"] for s in samples]
+    return {
+        "duration_s": duration,
+        "requests": counts["requests"],
+        "errors": counts["errors"],
+        "sse_sessions": counts["sse_sessions"],
+        "rss_kib_start": rss[0] if rss else None,
+        "rss_kib_end": rss[-1] if rss else None,
+        "rss_kib_max": max(rss) if rss else None,
+        "threads_start": threads[0],
+        "threads_end": threads[-1],
+        "threads_max": max(threads),
+        "samples": samples,
+    }
+
+
+def _raise_fd_limit():
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--quick", action="store_true", help="short durations for a smoke run")
+    parser.add_argument("--only", default=",".join(SUITES), help="comma-separated subset of " + ",".join(SUITES))
+    parser.add_argument("--sse-clients", default="10,100,500", help="subscriber counts for the SSE fan-out test")
+    parser.add_argument("--soak-seconds", type=float, default=None, help="soak duration (default 600, 60 with --quick)")
+    parser.add_argument("--snmp-delay", type=float, default=0.02, help="stand-in agent response delay in seconds")
+    parser.add_argument("--out", default=None, help="results directory (default benchmarks/results)")
+    args = parser.parse_args()
+
+    only = {s.strip() for s in args.only.split(",") if s.strip()}
+    duration = 2.0 if args.quick else 5.0
+    soak = args.soak_seconds if args.soak_seconds is not None else (60.0 if args.quick else 600.0)
+    _raise_fd_limit()
+    install_snmp_agent(args.snmp_delay)
+
+    results = {}
+    with BenchServer() as server:
+        if "throughput" in only:
+            for path in ("/status", "/on17"):
+                results[f"throughput {path}"] = bench_throughput(server, path, duration=duration)
+                print(f"throughput {path}: {results[f'throughput {path}']['rps']:.0f} req/s")
+        if "sse" in only:
+            for n in (int(c) for c in args.sse_clients.split(",")):
+                res = bench_sse_fanout(server, n, rounds=3 if args.quick else 5)
+                results[f"sse fanout {n}"] = res
+                print(f"sse fanout {n}: p99 {res['latency_ms'].get('p99', 0):.1f} ms, missed {res['missed']}")
+        if "animation" in only:
+            for step in (0.067, 0.01):
+                res = bench_animation(server.gpio, step, duration=duration)
+                results[f"animation {1 / step:.0f}Hz"] = res
+                print(f"animation {1 / step:.0f}Hz: {res.get('achieved_fps', 0):.1f} fps, "
+                      f"jitter {res.get('jitter_ms', 0):.2f} ms")
+        if "snmp" in only:
+            results["snmp walk"] = bench_snmp_walk(server, iterations=5 if args.quick else 20)
+            # Let the walk's success animations finish before the next suite touches the LEDs
+            time.sleep(1.5)
+            print(f"snmp walk: p50 {results['snmp walk']['latency_ms']['p50']:.1f} ms")
+        if "craft" in only:
+            sink = LoopbackSink()
+            for proto in ("tcp", "udp"):
+                results[f"craft {proto}"] = bench_craft(server, sink, proto, iterations=50 if args.quick else 200)
+                print(f"craft {proto}: p50 {results[f'craft {proto}']['latency_ms']['p50']:.2f} ms")
+            results["craft sink"] = {"udp_packets": sink.udp_packets, "tcp_connections": sink.tcp_connections}
+            sink.close()
+        if "soak" in only and soak > 0:
+            results["soak"] = bench_soak(server, soak)
+            print(f"soak {soak:.0f}s: rss {results['soak']['rss_kib_start']} -> {results['soak']['rss_kib_end']} KiB, "
+                  f"threads {results['soak']['threads_start']} -> {results['soak']['threads_end']}")
+
+    path = write_results("e2e", results, args.out) if args.out else write_results("e2e", results)
+    print(f"results written to {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Step timing of a scripted demo: port down, crafted packet, EICAR test, port up
+Before, the steps are requests to the existing routes issued at their offsets by a client (as clicking
+through the pages does, minus the human). After, the same steps run as a scenario: targets resolved,
+the SNMP agent warmed and MACs looked up before the clock starts, then each step started by the
+server's scheduler. The stand-in SNMP agent adds --first-contact seconds to the first call it gets,
+standing in for ARP, agent engine discovery and a cold tool start. Reports per-step lateness (start
+behind schedule) and run time
+
+    python benchmarks/scenario_timing.py
+    python benchmarks/scenario_timing.py --first-contact 0.5 --spacing 1.0
+"""
+
+import argparse
+import json
+import shutil
+import tempfile
+import time
+
+from harness import BenchServer, LoopbackSink, install_snmp_agent, summarize, write_results
+
+
+def steps(sink, spacing):
+    """(offset, route request, scenario step) per demo step"""
+    craft = {"target_ip": "127.0.0.1", "target_port": sink.udp_port, "protocol": "udp", "payload": "demo"}
+    eicar = {"target_ip": "127.0.0.1", "target_port": sink.tcp_port, "protocol": "tcp"}
+    return [
+        (0.0, ("GET", "/snmp/portdown?target=127.0.0.1&ifindex=3", None),
+         {"op": "snmp_portdown", "ifindex": "3", "cue": {"layer": "status", "levels": {"17": 255}}}),
+        (spacing, ("POST", "/packet/craft", craft), dict(craft, op="packet_craft")),
+        (2 * spacing, ("POST", "/packet/eicar-test", eicar), dict(eicar, op="packet_eicar")),
+        (3 * spacing, ("GET", "/snmp/portup?target=127.0.0.1&ifindex=3", None),
+         {"op": "snmp_portup", "ifindex": "3", "cue": {"layer": "status", "clear": True}}),
+    ]
+
+
+def by_hand(server, plan):
+    """Requests at their offsets from the client; lateness and run time per step, seconds"""
+    lateness, run = [], []
+    start = time.perf_counter()
+    for at, (method, path, body), _ in plan:
+        delay = start + at - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        began = time.perf_counter()
+        lateness.append(began - start - at)
+        status, data = server.request(method, path, body)
+        if status != 200 or not json.loads(data).get("ok"):
+            raise RuntimeError(f"{path}: {status} {data[:200]!r}")
+        run.append(time.perf_counter() - began)
+    return lateness, run
+
+
+def scenario(server, plan, directory):
+    """The plan as a scenario; lateness and run time per step as the server measured them, seconds"""
+    with open(f"{directory}/bench.json", "w") as f:
+        json.dump({"name": "bench", "target": "127.0.0.1",
+                   "steps": [dict(step, at=at) for at, _, step in plan]}, f)
+    status, data = server.request("POST", "/scenarios/bench/start")
+    if status != 200:
+        raise RuntimeError(f"start: {status} {data[:200]!r}")
+    while True:
+        time.sleep(0.05)
+        run = json.loads(server.request("GET", "/scenarios/status")[1])["run"]
+        if run["state"] not in ("preparing", "running"):
+            break
+    if run["state"] != "done" or not all(step.get("ok") for step in run["steps"]):
+        raise RuntimeError(f"scenario {run['state']}: {run}")
+    return ([step["lateness_ms"] / 1e3 for step in run["steps"]], [step["ms"] / 1e3 for step in run["steps"]],
+            run["prepared"]["ms"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--snmp-delay", type=float, default=0.02, help="stand-in SNMP agent delay per call, seconds")
+    parser.add_argument("--first-contact", type=float, default=0.3, help="extra delay of the first SNMP call, seconds")
+    parser.add_argument("--spacing", type=float, default=0.5, help="seconds between steps")
+    parser.add_argument("--out", default=None, help="results directory (default benchmarks/results)")
+    args = parser.parse_args()
+
+    results = {"snmp_delay": args.snmp_delay, "first_contact": args.first_contact, "spacing": args.spacing}
+    directory = tempfile.mkdtemp(prefix="bench-scenarios-")
+    sink = LoopbackSink()
+    try:
+        with BenchServer() as server:
+            server.cmd.scenarios.directory = directory
+            plan = steps(sink, args.spacing)
+            for name in ("by hand (before)", "scenario (after)"):
+                # A fresh agent each run, so both pay the first contact
+                bindir = install_snmp_agent(args.snmp_delay, args.first_contact)
+                try:
+                    if name.startswith("by hand"):
+                        lateness, run = by_hand(server, plan)
+                        prepared = None
+                    else:
+                        lateness, run, prepared = scenario(server, plan, directory)
+                finally:
+                    shutil.rmtree(bindir, ignore_errors=True)
+                results[name] = {"lateness_ms": summarize(lateness), "step_ms": summarize(run),
+                                 "per_step_ms": [round(r * 1e3, 1) for r in run], "prepare_ms": prepared}
+                print(f"{name:18s} step run time " + " ".join(f"{r * 1e3:6.1f}" for r in run) +
+                      f" ms  lateness max {max(lateness) * 1e3:6.2f} ms" +
+                      (f"  (prepared in {prepared:.0f} ms before the start)" if prepared is not None else ""))
+    finally:
+        sink.close()
+        shutil.rmtree(directory, ignore_errors=True)
+
+    path = write_results("scenario_timing", results, args.out) if args.out else write_results("scenario_timing", results)
+    print(f"results written to {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+/status throughput and tail latency under concurrent clients, per HTTP server mode
+Werkzeug's development server (a thread per connection) versus the pooled server (wsgi_server.py).
+Both close the connection after each response, so every request is on a fresh connection; the clients
+run in a separate process so they do not share the server's GIL
+
+    python benchmarks/server_modes.py                 # 50 clients, 10 s per mode
+    python benchmarks/server_modes.py --clients 100
+"""
+
+import argparse
+import http.client
+import multiprocessing
+import threading
+import time
+
+from harness import BenchServer, summarize, write_results
+
+
+def _client_process(port, path, clients, duration, out):
+    """Closed-loop clients; puts (latencies, errors, elapsed) on `out`"""
+    latencies, errors = [], [0]
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker():
+        local = []
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+            try:
+                conn.request("GET", path)
+                resp = conn.getresponse()
+                resp.read()
+                if resp.status != 200:
+                    errors[0] += 1
+            except (OSError, http.client.HTTPException):
+                errors[0] += 1
+            finally:
+                conn.close()
+            local.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=worker) for _ in range(clients)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    out.put((latencies, errors[0], time.perf_counter() - start))
+
+
+def run_load(port, path, clients, duration):
+    ctx = multiprocessing.get_context("spawn")
+    out = ctx.Queue()
+    proc = ctx.Process(target=_client_process, args=(port, path, clients, duration, out))
+    proc.start()
+    latencies, errors, elapsed = out.get()
+    proc.join()
+    return {"rps": len(latencies) / elapsed, "errors": errors, "clients": clients,
+            "latency_ms": summarize(latencies)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=50, help="concurrent clients")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per mode")
+    parser.add_argument("--path", default="/status", help="path to request")
+    parser.add_argument("--out", default=None, help="results directory (default benchmarks/results)")
+    args = parser.parse_args()
+
+    results = {"path": args.path}
+    for mode in ("development", "threaded"):
+        with BenchServer(server_mode=mode) as server:
+            run_load(server.port, args.path, 4, 1.0)  # warm-up
+            results[mode] = run_load(server.port, args.path, args.clients, args.duration)
+        lat = results[mode]["latency_ms"]
+        print(f"{mode:12s} {results[mode]['rps']:7.0f} req/s  p50 {lat['p50']:6.1f} ms  p99 {lat['p99']:6.1f} ms  "
+              f"errors {results[mode]['errors']}")
+
+    path = write_results("server_modes", results, args.out) if args.out else write_results("server_modes", results)
+    print(f"results written to {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Server import time and time to first response after a cold start
+Import time of app.py (python -X importtime). Then app.py is launched as a fresh process against a
+stand-in pigpio that connects either at once or only after --pigpiod-delay seconds (pigpiod still
+starting after a power cycle), timing the first 200 from /healthz, the dashboard page and /readyz.
+"before" reproduces the previous startup in the same tree: psutil, netifaces and Pillow imported
+up front, the GPIO controller built synchronously (the server exits if pigpiod is not up), and every
+asset minified on each start
+
+    python benchmarks/startup_time.py
+    python benchmarks/startup_time.py --runs 5 --pigpiod-delay 5
+"""
+
+import argparse
+import http.client
+import os
+import re
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from harness import ROOT, write_results
+
+LAUNCHER = """
+import os, sys, time, runpy
+sys.path.insert(0, {root!r})
+import config
+config.HOST, config.PORT, config.SERVER_WORKERS = "127.0.0.1", {port}, 1
+config.JOURNAL_DIR, config.GPIO_LOCK_FILE, config.ASSET_CACHE_DIR = {journal!r}, {lock!r}, {cache!r}
+config.STARTUP_RETRY_INTERVAL = 0.5
+import pigpio
+from gpio_controller import SimulatedPi
+up_at = {spawned!r} + {delay!r}
+
+def pi(*args, **kwargs):
+    fake = SimulatedPi()
+    fake.connected = time.time() >= up_at
+    return fake
+
+pigpio.pi = pi
+if {before!r}:
+    import psutil, netifaces
+    from PIL import Image, features
+    import assets, cluster, startup
+    startup.start_controller = cluster.build_controller
+    assets.AssetPipeline._minified = lambda self, raw, ext, minify: minify(raw.decode("utf-8"))
+runpy.run_path(os.path.join({root!r}, "app.py"), run_name="__main__")
+"""
+
+PATHS = ("/healthz", "/", "/readyz")
+OPTIONAL = ("psutil", "netifaces", "PIL")
+
+
+def import_time(runs):
+    """Median cumulative import time of app (ms) and which optional modules it loaded"""
+    totals, loaded = [], set()
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app"], cwd=ROOT,
+                             capture_output=True, text=True).stderr
+        for line in out.splitlines():
+            match = re.match(r"import time:\s+\d+ \|\s+(\d+) \|( *)(\S+)", line)
+            if not match:
+                continue
+            if match.group(3) == "app" and len(match.group(2)) == 1:
+                totals.append(int(match.group(1)) / 1e3)
+            if match.group(3).split(".")[0] in OPTIONAL:
+                loaded.add(match.group(3).split(".")[0])
+    return statistics.median(totals), sorted(loaded)
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _status(port, path):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=2)
+    try:
+        conn.request("GET", path)
+        response = conn.getresponse()
+        response.read()
+        return response.status
+    except OSError:
+        return None
+    finally:
+        conn.close()
+
+
+def launch(before, delay, cache, timeout):
+    """Seconds from spawn to the first 200 of each path; None if never (the server exited or timed out)"""
+    scratch = tempfile.mkdtemp(prefix="bench-startup-")
+    port = _free_port()
+    spawned = time.time()
+    script = LAUNCHER.format(root=ROOT, port=port, journal=os.path.join(scratch, "journal"),
+                             lock=os.path.join(scratch, "gpio.lock"), cache=cache, spawned=spawned,
+                             delay=delay, before=before)
+    start = time.monotonic()
+    proc = subprocess.Popen([sys.executable, "-c", script], cwd=ROOT,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    first = dict.fromkeys(PATHS)
+    try:
+        while time.monotonic() - start < timeout and None in first.values():
+            if proc.poll() is not None:
+                break
+            for path in PATHS:
+                if first[path] is None and _status(port, path) == 200:
+                    first[path] = time.monotonic() - start
+            time.sleep(0.005)
+    finally:
+        exited = proc.poll() is not None
+        proc.terminate()
+        try:
+            proc.wait(10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+        shutil.rmtree(scratch, ignore_errors=True)
+    return first, exited
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3, help="launches per scenario (median reported)")
+    parser.add_argument("--pigpiod-delay", type=float, default=3.0, help="seconds until pigpiod accepts, late case")
+    parser.add_argument("--timeout", type=float, default=15.0, help="seconds to wait for a launch")
+    parser.add_argument("--out", default=None, help="results directory (default benchmarks/results)")
+    args = parser.parse_args()
+
+    imported_ms, loaded = import_time(args.runs)
+    results = {"import_app_ms": imported_ms, "optional_modules_at_import": loaded}
+    print(f"import app: {imported_ms:.0f} ms; optional modules loaded at import: {', '.join(loaded) or 'none'}")
+
+    cache = tempfile.mkdtemp(prefix="bench-asset-cache-")
+    try:
+        # Warm the asset cache once, as any earlier start on the Pi would have
+        launch(False, 0.0, cache, args.timeout)
+        for before in (True, False):
+            for delay in (0.0, args.pigpiod_delay):
+                name = f"{'before' if before else 'after'}, pigpiod {'ready' if not delay else f'{delay:.0f}s late'}"
+                runs = [launch(before, delay, cache, args.timeout) for _ in range(args.runs)]
+                scenario = {"exited": sum(exited for _, exited in runs)}
+                for path in PATHS:
+                    times = [first[path] for first, _ in runs if first[path] is not None]
+                    scenario[path] = statistics.median(times) * 1e3 if len(times) == len(runs) else None
+                results[name] = scenario
+                cells = "  ".join(f"{path} {'-' if scenario[path] is None else f'{scenario[path]:6.0f} ms':>9s}"
+                                  for path in PATHS)
+                print(f"{name:26s} {cells}" + (f"  (exited {scenario['exited']}/{args.runs})"
+                                               if scenario["exited"] else ""))
+    finally:
+        shutil.rmtree(cache, ignore_errors=True)
+
+    path = write_results("startup_time", results, args.out) if args.out else write_results("startup_time", results)
+    print(f"results written to {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Command-to-frame latency and command rate: WebSocket control channel versus HTTP /pins
+Each command lights a different pin set; latency runs from sending the command to the pigpio bank
+write that shows it, and to the reply. HTTP is measured with a fresh connection per request (the server
+closes each connection after its response); /ws in both encodings. The rate
+is closed-loop with several clients at once. Last, how long a change made elsewhere takes to reach
+a connected client (/ws status push) against the once-a-second /events stream
+
+    python benchmarks/ws_commands.py
+    python benchmarks/ws_commands.py --commands 2000 --clients 8 --seconds 5
+"""
+
+import argparse
+import http.client
+import json
+import random
+import threading
+import time
+
+from harness import BenchServer, summarize, write_results
+import websocket
+from ws_control import MESSAGE, OP_PINS, REPLY, PROTOCOL_BINARY, PROTOCOL_JSON
+from config import PIN_NAMES, WS_STATUS_INTERVAL
+
+
+class FrameClock:
+    """Timestamps the last bank write on the simulated Pi"""
+
+    def __init__(self, pi):
+        self.last = 0.0
+        for name in ("set_bank_1", "clear_bank_1"):
+            setattr(pi, name, self._timed(getattr(pi, name)))
+
+    def _timed(self, write):
+        def timed(bits):
+            result = write(bits)
+            self.last = time.perf_counter()
+            return result
+        return timed
+
+
+def masks():
+    """Endless pin masks, each different from the one before"""
+    i = 0
+    while True:
+        i += 1
+        yield (i * 40503) & ((1 << len(PIN_NAMES)) - 1) or 1
+
+
+def _names(mask):
+    return ",".join(name for i, name in enumerate(PIN_NAMES) if mask >> i & 1)
+
+
+class HttpTransport:
+    def __init__(self, port):
+        self.port = port
+        self.conn = None
+
+    def send(self, mask):
+        self.conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=30)
+        try:
+            self.conn.request("GET", f"/pins?on={_names(mask)}")
+            response = self.conn.getresponse()
+            body = response.read()
+        finally:
+            self.conn.close()
+            self.conn = None
+        if response.status != 200:
+            raise RuntimeError(f"/pins: {response.status} {body[:200]!r}")
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+
+
+class WsTransport:
+    def __init__(self, port, protocol):
+        self.ws = websocket.connect("127.0.0.1", port, "/ws", protocol)
+        self.binary = protocol == PROTOCOL_BINARY
+        self.tag = 0
+
+    def _reply(self):
+        """Next command reply, skipping status pushes and events"""
+        while True:
+            message = self.ws.receive()
+            if message is None:
+                raise RuntimeError("/ws closed")
+            if self.binary:
+                if isinstance(message, bytes):
+                    op, tag, _ = MESSAGE.unpack(message)
+                    if tag == self.tag:
+                        if op != OP_PINS | REPLY:
+                            raise RuntimeError(f"/ws rejected command: op {op:#x}")
+                        return
+            elif "event" not in message:
+                reply = json.loads(message)
+                if reply.get("id") == self.tag:
+                    if not reply["ok"]:
+                        raise RuntimeError(f"/ws rejected command: {reply}")
+                    return
+
+    def send(self, mask):
+        self.tag = self.tag % 255 + 1
+        if self.binary:
+            self.ws.send(MESSAGE.pack(OP_PINS, self.tag, mask))
+        else:
+            self.ws.send(json.dumps({"op": "pins", "on": _names(mask).split(","), "id": self.tag}))
+        self._reply()
+
+    def close(self):
+        self.ws.close()
+        self.ws.abort()
+
+
+TRANSPORTS = {
+    "http /pins": lambda port: HttpTransport(port),
+    "ws json": lambda port: WsTransport(port, PROTOCOL_JSON),
+    "ws binary": lambda port: WsTransport(port, PROTOCOL_BINARY),
+}
+
+
+def latency(server, clock, make, commands):
+    transport = make(server.port)
+    to_frame, to_reply = [], []
+    try:
+        for _, mask in zip(range(commands), masks()):
+            start = time.perf_counter()
+            transport.send(mask)
+            to_reply.append(time.perf_counter() - start)
+            to_frame.append(clock.last - start)
+    finally:
+        transport.close()
+    return {"to_frame_ms": summarize(to_frame), "to_reply_ms": summarize(to_reply)}
+
+
+def rate(server, make, clients, seconds):
+    counts = [0] * clients
+    errors = []
+    deadline = time.monotonic() + seconds
+
+    def client(i):
+        try:
+            transport = make(server.port)
+            try:
+                for mask in masks():
+                    if time.monotonic() >= deadline:
+                        break
+                    transport.send(mask)
+                    counts[i] += 1
+            finally:
+                transport.close()
+        except Exception as e:
+            errors.append(repr(e))
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    start = time.monotonic()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.monotonic() - start
+    return {"commands_per_s": sum(counts) / elapsed, "errors": len(errors)}
+
+
+def push_delay(server, changes):
+    """Time from a pin change made through another path until the /ws client is told"""
+    ws = websocket.connect("127.0.0.1", server.port, "/ws", PROTOCOL_BINARY)
+    samples = []
+    try:
+        ws.receive()  # initial status
+        for _, mask in zip(range(changes), masks()):
+            # Land changes at random points of the status poll
+            time.sleep(random.uniform(0, WS_STATUS_INTERVAL))
+            start = time.perf_counter()
+            server.gpio._set_frame(mask)
+            while True:
+                op, tag, lit = MESSAGE.unpack(ws.receive())
+                if tag == 0 and lit == mask:
+                    break
+            samples.append(time.perf_counter() - start)
+    finally:
+        ws.close()
+        ws.abort()
+    return summarize(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--commands", type=int, default=1000, help="commands per latency run")
+    parser.add_argument("--clients", type=int, default=4, help="concurrent clients for the rate runs")
+    parser.add_argument("--seconds", type=float, default=3.0, help="length of each rate run")
+    parser.add_argument("--changes", type=int, default=50, help="changes for the status push run")
+    parser.add_argument("--write-latency", type=float, default=0.0001, help="simulated pigpio call time, seconds")
+    parser.add_argument("--out", default=None, help="results directory (default benchmarks/results)")
+    args = parser.parse_args()
+
+    results = {"commands": args.commands, "clients": args.clients, "write_latency": args.write_latency}
+    with BenchServer(write_latency=args.write_latency, server_mode="threaded") as server:
+        clock = FrameClock(server.pi)
+        for name, make in TRANSPORTS.items():
+            results[name] = latency(server, clock, make, args.commands)
+            results[name].update(rate(server, make, args.clients, args.seconds))
+            r = results[name]
+            print(f"{name:28s} to frame p50 {r['to_frame_ms']['p50']:6.3f} ms  p99 {r['to_frame_ms']['p99']:6.3f} ms  "
+                  f"to reply p50 {r['to_reply_ms']['p50']:6.3f} ms  {r['commands_per_s']:7.0f} commands/s"
+                  + (f"  ({r['errors']} client errors)" if r["errors"] else ""))
+        results["status push"] = push_delay(server, args.changes)
+        print(f"status push to /ws client p50 {results['status push']['p50']:.1f} ms, "
+              f"max {results['status push']['max']:.1f} ms (poll every {WS_STATUS_INTERVAL * 1e3:.0f} ms; "
+              f"/events sends status once a second)")
+
+    path = write_results("ws_commands", results, args.out) if args.out else write_results("ws_commands", results)
+    print(f"results written to {path}")
+
+
+if __name__ == "__main__":
+    main()
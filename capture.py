@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Reply capture for crafted packets
+An AF_PACKET socket with a memory-mapped TPACKET_V3 receive ring and a classic BPF filter compiled for
+the sent flow's 5-tuple: the kernel drops every other packet and writes the flow's into ring blocks,
+which are read in place, one poll per block rather than one recv per packet. Linux only, needs CAP_NET_RAW
+"""
+
+import logging
+import math
+import mmap
+import os
+import re
+import select
+import socket
+import struct
+import time
+import uuid
+from collections import namedtuple
+from config import *
+from metrics import METRICS
+
+log = logging.getLogger(__name__)
+
+_CAPTURES = METRICS.counter("packet_captures_total", "Reply captures of crafted packets", ("result",))
+_CAPTURED = METRICS.counter("packet_capture_packets_total", "Packets captured for crafted flows")
+
+# linux/if_packet.h, linux/if_ether.h, linux/if_arp.h
+SOL_PACKET = 263
+PACKET_RX_RING = 5
+PACKET_STATISTICS = 6
+PACKET_VERSION = 10
+TPACKET_V3 = 2
+TP_STATUS_KERNEL = 0
+TP_STATUS_USER = 1
+PACKET_OUTGOING = 4
+ETH_P_ALL = 0x0003
+ARPHRD_LOOPBACK = 772
+SO_ATTACH_FILTER = 26
+
+# Ring geometry: _BLOCKS blocks of _BLOCK_SIZE; a partly filled block is handed over after _RETIRE_MS
+_BLOCK_SIZE = 1 << 16
+_BLOCKS = 8
+_FRAME_SIZE = 2048
+_RETIRE_MS = 5
+_MAX_WINDOW = 10.0  # seconds; longest capture a request may ask for
+
+# Classic BPF opcodes (linux/filter.h)
+_LD_W_ABS, _LD_H_ABS, _LD_B_ABS = 0x20, 0x28, 0x30
+_LD_W_IND, _LD_H_IND, _LD_B_IND = 0x40, 0x48, 0x50
+_LDX_B_MSH = 0xB1
+_JEQ_K, _JSET_K = 0x15, 0x45
+_RET_K = 0x06
+
+_IP = 14  # IPv4 header offset behind the Ethernet header
+_PROTOCOLS = {"tcp": socket.IPPROTO_TCP, "udp": socket.IPPROTO_UDP}
+_TCP_FLAGS = ((0x02, "S"), (0x10, "A"), (0x08, "P"), (0x01, "F"), (0x04, "R"), (0x20, "U"))
+_CAPTURE_ID = re.compile(r"[0-9a-f]{16}")
+
+Flow = namedtuple("Flow", "proto local_ip local_port remote_ip remote_port")
+
+
+def _address(ip):
+    return struct.unpack("!I", socket.inet_aton(ip))[0]
+
+
+def _direction(proto, src, sport, dst, dport):
+    """Checks matching one direction of the flow; an address of None matches any"""
+    checks = [(_LD_H_ABS, 12, 0x0800, _JEQ_K), (_LD_B_ABS, _IP + 9, proto, _JEQ_K),
+              (_LD_H_ABS, _IP + 6, 0x1FFF, _JSET_K)]
+    if src is not None:
+        checks.append((_LD_W_ABS, _IP + 12, src, _JEQ_K))
+    if dst is not None:
+        checks.append((_LD_W_ABS, _IP + 16, dst, _JEQ_K))
+    return checks + [(_LDX_B_MSH, _IP, None, None), (_LD_H_IND, _IP, sport, _JEQ_K), (_LD_H_IND, _IP + 2, dport, _JEQ_K)]
+
+
+def _assemble(alternatives, snaplen):
+    """Program accepting snaplen bytes of a packet passing every check of any alternative. A check is
+    (load opcode, offset, value, test): _JEQ_K fails unless equal, _JSET_K fails if any bit is set"""
+    program, starts, jumps = [], [], []
+    for checks in alternatives:
+        starts.append(len(program))
+        for op, k, value, test in checks:
+            program.append([op, 0, 0, k])
+            if test is not None:
+                jumps.append((len(program), len(starts)))
+                program.append([test, 0, 0, value])
+        program.append([_RET_K, 0, 0, snaplen])
+    starts.append(len(program))
+    program.append([_RET_K, 0, 0, 0])
+    for pc, alternative in jumps:
+        # A failed check goes on to the next alternative, after the last one to the drop
+        program[pc][1 if program[pc][0] == _JSET_K else 2] = starts[alternative] - pc - 1
+    return [tuple(instruction) for instruction in program]
+
+
+def compile_filter(flow, snaplen=CAPTURE_SNAPLEN):
+    """Classic BPF for Ethernet-framed IPv4: the flow's packets both ways, and ICMP errors quoting it"""
+    proto = _PROTOCOLS[flow.proto]
+    local = _address(flow.local_ip) if flow.local_ip not in (None, "", "0.0.0.0") else None
+    remote = _address(flow.remote_ip)
+    icmp = [(_LD_H_ABS, 12, 0x0800, _JEQ_K), (_LD_B_ABS, _IP + 9, socket.IPPROTO_ICMP, _JEQ_K),
+            (_LDX_B_MSH, _IP, None, None), (_LD_B_IND, _IP + 8 + 9, proto, _JEQ_K),
+            (_LD_W_IND, _IP + 8 + 16, remote, _JEQ_K),
+            # The quoted header is taken to have no options
+            (_LD_H_IND, _IP + 8 + 20, flow.local_port, _JEQ_K), (_LD_H_IND, _IP + 8 + 22, flow.remote_port, _JEQ_K)]
+    return _assemble([_direction(proto, local, flow.local_port, remote, flow.remote_port),
+                      _direction(proto, remote, flow.remote_port, local, flow.local_port), icmp], snaplen)
+
+
+def attach_filter(sock, program):
+    """Attach a classic BPF program (compile_filter) to a socket"""
+    import ctypes
+    code = ctypes.create_string_buffer(b"".join(struct.pack("HBBI", *instruction) for instruction in program))
+    sock.setsockopt(socket.SOL_SOCKET, SO_ATTACH_FILTER, struct.pack("HP", len(program), ctypes.addressof(code)))
+
+
+def route_source(address):
+    """Local address the kernel sends to `address` from"""
+    probe = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        probe.connect((address, 9))
+        return probe.getsockname()[0]
+    finally:
+        probe.close()
+
+
+def describe(data, length, flow):
+    """Summary of one captured packet of the flow"""
+    try:
+        ihl = (data[_IP] & 0x0F) * 4
+        proto, ttl = data[_IP + 9], data[_IP + 8]
+        src, dst = socket.inet_ntoa(data[_IP + 12:_IP + 16]), socket.inet_ntoa(data[_IP + 16:_IP + 20])
+        l4 = _IP + ihl
+        if proto == socket.IPPROTO_ICMP:
+            return {"dir": "icmp", "proto": "icmp", "src": src, "dst": dst, "len": length, "ttl": ttl,
+                    "type": data[l4], "code": data[l4 + 1]}
+        sport, dport = struct.unpack_from("!HH", data, l4)
+        info = {"dir": "out" if sport == flow.local_port and dst == flow.remote_ip else "in", "proto": flow.proto,
+                "src": f"{src}:{sport}", "dst": f"{dst}:{dport}", "len": length, "ttl": ttl}
+        ip_length = struct.unpack_from("!H", data, _IP + 2)[0]
+        if proto == socket.IPPROTO_TCP:
+            flags = data[l4 + 13]
+            info["flags"] = "".join(letter for bit, letter in _TCP_FLAGS if flags & bit)
+            info["payload"] = ip_length - ihl - (data[l4 + 12] >> 4) * 4
+        else:
+            info["payload"] = ip_length - ihl - 8
+        return info
+    except (IndexError, struct.error):
+        return {"dir": "?", "len": length, "error": "truncated"}
+
+
+def write_pcap(path, packets, snaplen=CAPTURE_SNAPLEN):
+    """Write (sec, nsec, original length, bytes) packets as a nanosecond-resolution Ethernet pcap file"""
+    with open(path + ".tmp", "wb") as f:
+        f.write(struct.pack("<IHHiIII", 0xA1B23C4D, 2, 4, 0, 0, snaplen, 1))
+        for sec, nsec, length, data in packets:
+            f.write(struct.pack("<IIII", sec, nsec, len(data), length))
+            f.write(data)
+    os.replace(path + ".tmp", path)
+
+
+def pcap_path(capture_id, directory=CAPTURE_DIR):
+    """Path of a stored capture, or None"""
+    if not _CAPTURE_ID.fullmatch(capture_id or ""):
+        return None
+    path = os.path.join(directory, f"{capture_id}.pcap")
+    return path if os.path.isfile(path) else None
+
+
+def _prune(directory, keep):
+    files = sorted((entry.stat().st_mtime, entry.path) for entry in os.scandir(directory) if entry.name.endswith(".pcap"))
+    for _, path in files[:max(0, len(files) - keep)]:
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+
+class Capture:
+    """One crafted flow's capture: arm() with the sending socket before anything is sent, finish() after"""
+
+    def __init__(self, interface=CAPTURE_INTERFACE, window=CAPTURE_WINDOW, max_packets=CAPTURE_MAX_PACKETS,
+                 snaplen=CAPTURE_SNAPLEN, directory=CAPTURE_DIR):
+        self.interface = interface or None
+        window = float(window)
+        if not math.isfinite(window):
+            raise ValueError(f"capture window must be finite, not {window}")
+        self.window = min(max(window, 0.0), _MAX_WINDOW)
+        self.max_packets = max_packets
+        self.snaplen = snaplen
+        self.directory = directory
+        self.flow = None
+        self.error = None
+        self.polls = 0
+        self._sock = self._ring = self._held = None
+        self._block = 0
+        self._packets = []  # (sec, nsec, original length, bytes)
+        self._summaries = []
+
+    def arm(self, sock, proto, remote_ip, remote_port, hold=False):
+        """Bind `sock` if the system has not yet, so the flow is known before it sends, then open the ring.
+        `hold` keeps the socket open until finish() so replies reach it rather than drawing ICMP errors"""
+        try:
+            remote_ip = socket.gethostbyname(remote_ip)
+            local_ip, local_port = sock.getsockname()[:2]
+            if not local_port:
+                sock.bind((local_ip if local_ip != "0.0.0.0" else route_source(remote_ip), 0))
+                local_ip, local_port = sock.getsockname()[:2]
+            self.flow = Flow(proto, local_ip, local_port, remote_ip, int(remote_port))
+            self._open()
+            if hold:
+                self._held = sock.dup()
+        except PermissionError:
+            self.error = "Packet capture needs CAP_NET_RAW (run as root, or setcap cap_net_raw+ep on the Python binary)"
+        except AttributeError:
+            self.error = "Packet capture needs Linux (AF_PACKET)"
+        except OSError as e:
+            self.error = f"Packet capture unavailable: {e}"
+        if self.error:
+            log.info("%s", self.error)
+
+    def _open(self):
+        # Bound to an interface the socket receives nothing until bind(), after the filter is in place; on
+        # every interface, what arrives before the filter stays in the receive queue, which is never read
+        sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, 0 if self.interface else socket.htons(ETH_P_ALL))
+        try:
+            attach_filter(sock, compile_filter(self.flow, self.snaplen))
+            sock.setsockopt(SOL_PACKET, PACKET_VERSION, TPACKET_V3)
+            frames = _BLOCK_SIZE // _FRAME_SIZE * _BLOCKS
+            sock.setsockopt(SOL_PACKET, PACKET_RX_RING,
+                            struct.pack("7I", _BLOCK_SIZE, _BLOCKS, _FRAME_SIZE, frames, _RETIRE_MS, 0, 0))
+            self._ring = mmap.mmap(sock.fileno(), _BLOCK_SIZE * _BLOCKS)
+            if self.interface:
+                sock.bind((self.interface, ETH_P_ALL))
+        except BaseException:
+            if self._ring is not None:
+                self._ring.close()
+                self._ring = None
+            sock.close()
+            raise
+        self._sock = sock
+
+    def _read_block(self, offset):
+        ring = self._ring
+        count, first = struct.unpack_from("II", ring, offset + 12)
+        frame = offset + first
+        for _ in range(count):
+            next_offset, sec, nsec, snaplen, length, _, mac = struct.unpack_from("IIIIIIH", ring, frame)
+            hatype, pkttype = struct.unpack_from("HB", ring, frame + 56)
+            # Loopback shows every packet twice, going out and coming in
+            if not (pkttype == PACKET_OUTGOING and hatype == ARPHRD_LOOPBACK):
+                data = ring[frame + mac:frame + mac + snaplen]
+                self._packets.append((sec, nsec, length, data))
+                self._summaries.append(describe(data, length, self.flow))
+            frame += next_offset
+        struct.pack_into("I", ring, offset + 8, TP_STATUS_KERNEL)
+        self._block = (self._block + 1) % _BLOCKS
+
+    def _ended(self):
+        """A TCP exchange is over once it is reset or both sides have sent FIN"""
+        if self.flow.proto != "tcp":
+            return False
+        flags = {(s["dir"], c) for s in self._summaries for c in s.get("flags", "")}
+        return ("in", "R") in flags or ("out", "R") in flags or {("in", "F"), ("out", "F")} <= flags
+
+    def _collect(self):
+        # The last block may still be filling at the deadline; give the kernel one retire timeout to hand it over
+        deadline = time.monotonic() + self.window + 2 * _RETIRE_MS / 1000
+        poller = select.poll()
+        poller.register(self._sock, select.POLLIN | select.POLLERR)
+        while len(self._packets) < self.max_packets and not self._ended():
+            offset = self._block * _BLOCK_SIZE
+            if struct.unpack_from("I", self._ring, offset + 8)[0] & TP_STATUS_USER:
+                self._read_block(offset)
+                continue
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            self.polls += 1
+            poller.poll(remaining * 1000)
+
+    def finish(self):
+        """Collect until the window closes, max_packets arrive or a TCP exchange ends; the summary dict"""
+        if self.error or self.flow is None:
+            self.close()
+            _CAPTURES.labels("unavailable").inc()
+            return {"ok": False, "error": self.error or "Nothing was sent"}
+        try:
+            self._collect()
+            _, drops, _ = struct.unpack("3I", self._sock.getsockopt(SOL_PACKET, PACKET_STATISTICS, 12))
+        finally:
+            self.close()
+        packets = self._packets[:self.max_packets]
+        summaries = self._summaries[:len(packets)]
+        if packets:
+            start = packets[0][0] * 10 ** 9 + packets[0][1]
+            for (sec, nsec, _, _), summary in zip(packets, summaries):
+                summary["ms"] = round((sec * 10 ** 9 + nsec - start) / 1e6, 3)
+        replies = [s for s in summaries if s["dir"] in ("in", "icmp")]
+        capture_id = uuid.uuid4().hex[:16]
+        result = {"ok": True, "id": capture_id, "interface": self.interface or "any",
+                  "filter": f"{self.flow.proto} {self.flow.local_ip}:{self.flow.local_port} <-> "
+                            f"{self.flow.remote_ip}:{self.flow.remote_port}",
+                  "count": len(packets), "replies": len(replies),
+                  "first_reply_ms": replies[0]["ms"] if replies else None,
+                  "dropped": drops, "packets": summaries, "pcap": None}
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            write_pcap(os.path.join(self.directory, f"{capture_id}.pcap"), packets, self.snaplen)
+            _prune(self.directory, CAPTURE_KEEP)
+            result["pcap"] = f"/packet/capture/{capture_id}.pcap"
+        except OSError as e:
+            log.warning("Could not store capture %s: %s", capture_id, e)
+        _CAPTURES.labels("ok").inc()
+        _CAPTURED.inc(len(packets))
+        return result
+
+    def close(self):
+        for attr in ("_ring", "_sock", "_held"):
+            resource = getattr(self, attr)
+            if resource is not None:
+                resource.close()
+                setattr(self, attr, None)
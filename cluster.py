@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Cluster mode for Raspberry Pi LED Server
+Drives the LED panels of several boards from one server through each board's pigpiod (pigpio's
+remote host/port support). Frames fan out to every board at once, a slow or unreachable board
+only delays itself, and status aggregates what each board last confirmed
+"""
+
+import logging
+import threading
+import time
+import pigpio
+from config import *
+from event_bus import EVENTS
+from gpio_controller import GPIOController
+from metrics import METRICS
+
+log = logging.getLogger(__name__)
+
+_ONLINE = METRICS.gauge("cluster_board_online", "1 while a cluster board is connected", ("board",))
+_FRAMES = METRICS.counter("cluster_frames_written_total", "Frames written to a cluster board", ("board",))
+_SKIPPED = METRICS.counter("cluster_frames_skipped_total",
+                           "Frames superseded before a busy board could take them", ("board",))
+_WRITE_SECONDS = METRICS.histogram("cluster_board_write_seconds", "pigpio round trip per frame write", ("board",))
+
+_BOARD_ERRORS = (pigpio.error, OSError)
+
+
+def connect_pigpio(board):
+    """pigpio connection to a board's daemon; returns None if it cannot be reached"""
+    pi = pigpio.pi(board["host"], board.get("port", 8888), show_errors=False)
+    if not pi.connected:
+        return None
+    # pigpio waits forever for a reply; a bounded wait lets a board that stalls mid-call drop out
+    sock = getattr(getattr(pi, "sl", None), "s", None)
+    if sock is not None:
+        sock.settimeout(CLUSTER_TIMEOUT)
+    return pi
+
+
+class Board:
+    """One board and the sender thread that brings its pins to the cluster's latest frame"""
+
+    def __init__(self, cluster, config, connect):
+        self.cluster = cluster
+        self.config = config
+        self.name = config.get("name") or config.get("host")
+        self._connect = connect
+        self.pi = None
+        self.online = False
+        self.error = None
+        self.latency = 0.0  # estimated delay from starting a frame write until the board shows it, seconds
+        self.confirmed = None  # bank 1 levels the board last acknowledged
+        self.generation = 0  # cluster frame generation last written
+        self.mode_generation = 0
+        self._m_online = _ONLINE.labels(self.name)
+        self._m_frames = _FRAMES.labels(self.name)
+        self._m_skipped = _SKIPPED.labels(self.name)
+        self._m_write = _WRITE_SECONDS.labels(self.name)
+        self.thread = threading.Thread(target=self._run, name=f"cluster-{self.name}", daemon=True)
+
+    def status(self):
+        levels = self.confirmed or 0
+        return {
+            "online": self.online,
+            "error": self.error,
+            "latency_ms": round(self.latency * 1e3, 2),
+            "pins": {name: levels >> pin & 1 for name, pin, _ in PIN_TABLE},
+        }
+
+    def _set_online(self, online, error=None):
+        self.error = error
+        if online == self.online:
+            return
+        self.online = online
+        self._m_online.set(1 if online else 0)
+        if online:
+            log.info("Cluster board %s connected", self.name)
+        else:
+            log.warning("Cluster board %s offline: %s", self.name, error)
+        EVENTS.publish("board", {"board": self.name, "online": online, "error": error})
+
+    def _drop(self, error):
+        if self.pi is not None:
+            try:
+                self.pi.stop()
+            except Exception:
+                pass
+        self.pi = None
+        self.confirmed = None
+        self.mode_generation = 0
+        self._set_online(False, str(error) or type(error).__name__)
+
+    def _run(self):
+        cluster = self.cluster
+        while not cluster.stopping:
+            if self.pi is None:
+                try:
+                    self.pi = self._connect(self.config)
+                except Exception as e:
+                    self.pi = None
+                    self._set_online(False, str(e))
+                if self.pi is None:
+                    if self.error is None:
+                        self._set_online(False, "unreachable")
+                    cluster.wait_stopping(CLUSTER_RECONNECT_INTERVAL)
+                    continue
+            try:
+                if self.mode_generation != cluster.mode_generation:
+                    self._apply_modes()
+                frame = cluster.next_frame(self, CLUSTER_POLL_INTERVAL)
+                if frame is None:
+                    # Idle: the poll doubles as a heartbeat and picks up changes made on the board itself
+                    self.confirmed = self.pi.read_bank_1()
+                    self._set_online(True)
+                    continue
+                self._write(*frame)
+                self._set_online(True)
+            except _BOARD_ERRORS as e:
+                self._drop(e)
+                cluster.wait_stopping(CLUSTER_RECONNECT_INTERVAL)
+
+    def _apply_modes(self):
+        generation, modes = self.cluster.modes_snapshot()
+        for pin, mode in modes.items():
+            try:
+                self.pi.set_mode(pin, mode)
+            except pigpio.error:
+                log.warning("Cluster board %s cannot control GPIO %s (reserved?)", self.name, pin)
+        self.mode_generation = generation
+
+    def _write(self, generation, levels, managed, issued):
+        if generation - self.generation > 1:
+            self._m_skipped.inc(generation - self.generation - 1)
+        if CLUSTER_ALIGN:
+            # Hold faster boards back so the frame lands on every board at about the same time
+            delay = issued + self.cluster.max_latency() - self.latency - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        changed = managed if self.confirmed is None else (levels ^ self.confirmed) & managed
+        start = time.perf_counter()
+        if changed & ~levels:
+            self.pi.clear_bank_1(changed & ~levels)
+        if changed & levels:
+            self.pi.set_bank_1(changed & levels)
+        elapsed = time.perf_counter() - start
+        if changed:
+            self._m_write.observe(elapsed)
+            # The frame shows when the last call arrives, one half round trip before its reply
+            calls = (1 if changed & ~levels else 0) + (1 if changed & levels else 0)
+            shown = elapsed - elapsed / calls / 2
+            self.latency = shown if not self.latency else 0.8 * self.latency + 0.2 * shown
+        confirmed = self.confirmed if self.confirmed is not None else 0
+        self.confirmed = (confirmed & ~managed) | (levels & managed)
+        self.generation = generation
+        self._m_frames.inc()
+
+
+class ClusterPi:
+    """pigpio.pi() stand-in that mirrors bank 1 writes to every board in CLUSTER_BOARDS.
+    Calls only record the desired levels and return at once; each board's thread writes them"""
+
+    def __init__(self, boards=CLUSTER_BOARDS, connect=connect_pigpio):
+        self.connected = True
+        self.stopping = False
+        self.mode_generation = 0
+        self._modes = {}
+        self._levels = 0  # desired bank 1 levels
+        self._managed = 0  # bank 1 bits the cluster has written
+        self._generation = 0
+        self._issued = 0.0
+        self._cond = threading.Condition()
+        self._stopped = threading.Event()
+        self.boards = [Board(self, board, connect) for board in boards]
+        for board in self.boards:
+            board.thread.start()
+
+    def _update(self, set_bits=0, clear_bits=0):
+        with self._cond:
+            self._levels = (self._levels | set_bits) & ~clear_bits
+            self._managed |= set_bits | clear_bits
+            self._generation += 1
+            self._issued = time.monotonic()
+            self._cond.notify_all()
+
+    def next_frame(self, board, timeout):
+        """Latest frame newer than the board's, waiting up to `timeout`; None if nothing changed"""
+        with self._cond:
+            if self._generation == board.generation and board.confirmed is not None:
+                self._cond.wait(timeout)
+            if self.stopping or (self._generation == board.generation and board.confirmed is not None):
+                return None
+            return self._generation, self._levels, self._managed, self._issued
+
+    def modes_snapshot(self):
+        with self._cond:
+            return self.mode_generation, dict(self._modes)
+
+    def max_latency(self):
+        return max((board.latency for board in self.boards if board.online), default=0.0)
+
+    def wait_stopping(self, timeout):
+        self._stopped.wait(timeout)
+
+    # pigpio.pi interface used by GPIOController
+    def set_mode(self, gpio, mode):
+        with self._cond:
+            self._modes[gpio] = mode
+            self.mode_generation += 1
+            self._cond.notify_all()
+
+    def write(self, gpio, level):
+        if level:
+            self._update(set_bits=1 << gpio)
+        else:
+            self._update(clear_bits=1 << gpio)
+
+    def set_bank_1(self, bits):
+        self._update(set_bits=bits)
+
+    def clear_bank_1(self, bits):
+        self._update(clear_bits=bits)
+
+    def read_bank_1(self):
+        """Levels confirmed by the boards that are online, combined: a pin reads 1 if any board has it lit"""
+        levels = 0
+        for board in self.boards:
+            if board.online and board.confirmed is not None:
+                levels |= board.confirmed
+        return levels
+
+    def read(self, gpio):
+        return self.read_bank_1() >> gpio & 1
+
+    def flush(self, timeout=CLUSTER_TIMEOUT):
+        """Wait until every online board has written the latest frame; returns False on timeout"""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            generation = self._generation
+            if all(board.generation >= generation for board in self.boards if board.online):
+                return True
+            time.sleep(0.005)
+        return False
+
+    def stop(self):
+        """Let online boards take the final frame (normally all off), then disconnect"""
+        self.flush()
+        with self._cond:
+            self.stopping = True
+            self._stopped.set()
+            self._cond.notify_all()
+        for board in self.boards:
+            board.thread.join(CLUSTER_TIMEOUT)
+            if board.pi is not None:
+                board.pi.stop()
+        self.connected = False
+
+
+class ClusterController(GPIOController):
+    """GPIOController whose frames, animations and status span every board in CLUSTER_BOARDS"""
+
+    def __init__(self, boards=CLUSTER_BOARDS, connect=connect_pigpio):
+        super().__init__(pi=ClusterPi(boards, connect))
+
+    def get_status(self):
+        status = super().get_status()
+        status["boards"] = {board.name: board.status() for board in self.pi.boards}
+        return status
+
+
+def build_controller(owner_fd=None):
+    """ClusterController when CLUSTER_BOARDS lists boards, else the local GPIOController"""
+    if CLUSTER_BOARDS:
+        log.info("Cluster mode: %d boards (%s)", len(CLUSTER_BOARDS),
+                 ", ".join(board.get("name") or board["host"] for board in CLUSTER_BOARDS))
+        return ClusterController()
+    return GPIOController(owner_fd=owner_fd)
@@ -5,6 +5,8 @@ Command Executor for Raspberry Pi LED Server
 Handles shell commands like ping and SNMP operations
 """
 
+import logging
+import math
 import subprocess
 import shlex
 import threading
@@ -12,26 +14,175 @@ import time
 import socket
 import struct
 import binascii
-import psutil
-import netifaces
+from functools import wraps
 from config import *
+from metrics import METRICS
+from event_bus import EVENTS
+from capture import Capture
+from send_timing import SendLatency, SendTiming
+from interfaces import InterfaceInventory
+from scenarios import ScenarioError, ScenarioRunner
+from telemetry import RateTelemetry, PACKETS, BYTES, ERRORS
+
+log = logging.getLogger(__name__)
+
+_SUBPROCESS_SPAWNS = METRICS.counter("subprocess_spawns_total", "External commands spawned", ("program",))
+_SNMP_REQUESTS = METRICS.counter("snmp_requests_total", "SNMP command round trips", ("command", "result"))
+_SNMP_LATENCY = METRICS.histogram("snmp_roundtrip_seconds", "SNMP command round-trip time", ("command",))
+
+_MAX_PACKET_TIMEOUT = 30.0  # seconds; longest handshake or reply wait a packet request may ask for
+
+# Request and result fields kept out of the journal: bulky output, payloads, and command lines carrying the community
+_UNJOURNALED = ("cmd", "stdout", "stderr", "payload", "community", "message")
+
+
+def _summary(data):
+    """Scalar fields of a request or result dict worth keeping in the journal"""
+    if not isinstance(data, dict):
+        return {}
+    return {k: v for k, v in data.items() if not k.endswith(_UNJOURNALED) and
+            (isinstance(v, (bool, int, float)) or (isinstance(v, str) and len(v) <= 200))}
+
+
+def _journaled(op, *fields):
+    """Record each call in the operation journal. `fields` name the positional arguments (the first is
+    the target); without them the method takes one request dict whose target_ip is the target"""
+    def decorate(method):
+        @wraps(method)
+        def wrapper(self, *args, **kwargs):
+            result = method(self, *args, **kwargs)
+            if fields:
+                params = dict(zip(fields, args))
+                params.update((k, v) for k, v in kwargs.items() if k in fields)
+                target = params.pop(fields[0], None)
+            else:
+                params = _summary(args[0] if args else kwargs)
+                target = params.pop("target_ip", None)
+            outcome = _summary(result)
+            try:
+                self.record_operation(op, target, outcome.pop("ok", None), params, outcome)
+            except Exception as e:
+                log.warning("Journal entry for %s lost: %s", op, e)
+            return result
+        return wrapper
+    return decorate
 
 
 class CommandExecutor:
-    def __init__(self, gpio_controller):
-        """Initialize command executor with GPIO controller reference"""
+    def __init__(self, gpio_controller, journal=None, probes=None):
+        """Initialize command executor with GPIO controller reference, optional operation journal and probe engine"""
         self.gpio = gpio_controller
+        self.journal = journal
+        self.probes = probes
+        self.interfaces = InterfaceInventory().start()
+        self.scenarios = ScenarioRunner(self)
+        self.latency = SendLatency()
+    
+    def record_operation(self, op, target, ok, params, result):
+        """Append one operation to the journal, if there is one"""
+        if self.journal is not None:
+            self.journal.append(op, target, ok, params, result)
+    
+    def query_history(self, since=None, until=None, type=None, target=None, limit=JOURNAL_QUERY_LIMIT):
+        """Journal entries matching the filters, oldest first"""
+        if self.journal is None:
+            return {"ok": False, "error": "Operation journal is disabled"}
+        entries, segments_read = self.journal.query(since, until, type, target, limit)
+        return {"ok": True, "entries": entries, "segments_read": segments_read, "journal": self.journal.stats()}
+    
+    def record_send_timing(self, target, protocol, timing):
+        """Add a crafted send's stage timing to the target's latency histograms"""
+        self.latency.record(target, protocol, timing)
+    
+    def get_send_latency(self, target=None):
+        """Per-target, per-stage latency histograms of crafted sends"""
+        return {"ok": True, "targets": self.latency.query(target)}
+    
+    def get_probe_status(self, device=None, history=False):
+        """Reachability of every probed device, or of one; `history` adds each recent probe's RTT"""
+        if self.probes is None:
+            return {"ok": False, "error": "Reachability probes are disabled"}
+        devices = self.probes.status(device, history)
+        if device is not None and not devices:
+            return {"ok": False, "error": f"Device '{device}' is not probed"}
+        return {"ok": True, "devices": devices, "interval": self.probes.interval, "icmp_error": self.probes.icmp_error}
+    
+    def list_scenarios(self):
+        """Scenario files that can be started, and the current or last run"""
+        return {"ok": True, "scenarios": self.scenarios.list(), "run": self.scenarios.report}
+    
+    def start_scenario(self, name):
+        """Start a scenario from SCENARIO_DIR in the background; progress goes out as "scenario" events"""
+        try:
+            return {"ok": True, "run": self.scenarios.start(name)}
+        except ScenarioError as e:
+            return {"ok": False, "error": str(e)}
+    
+    def stop_scenario(self):
+        """Stop the running scenario after its current step"""
+        stopped = self.scenarios.stop()
+        return {"ok": True, "stopped": stopped, "run": self.scenarios.report}
+    
+    def get_scenario_status(self):
+        """The current or last run, with per-step lateness and run time"""
+        return {"ok": True, "run": self.scenarios.report}
+    
+    @staticmethod
+    def _capture_window(packet_data):
+        """Seconds the requested capture runs, or None when the packet request asks for none; raises
+        ValueError when capture_window is not a finite number 0 or more"""
+        if not packet_data.get('capture'):
+            return None
+        try:
+            window = float(packet_data.get('capture_window', CAPTURE_WINDOW))
+        except (TypeError, ValueError):
+            window = math.nan
+        if not (math.isfinite(window) and window >= 0):
+            raise ValueError(f"capture_window must be a number of seconds, 0 or more, "
+                             f"not {packet_data.get('capture_window')!r}")
+        return window
+    
+    def _capture_for(self, packet_data):
+        """A reply capture when the packet request asks for one ("capture": true), else None"""
+        window = self._capture_window(packet_data)
+        if window is None:
+            return None
+        return Capture(packet_data.get('capture_interface') or CAPTURE_INTERFACE, window)
+    
+    @classmethod
+    def send_options(cls, packet_data):
+        """Timeout (seconds, capped at _MAX_PACKET_TIMEOUT) and whether to wait for a reply, from a packet
+        request; raises ValueError when the timeout is not a positive number or the capture window is invalid"""
+        cls._capture_window(packet_data)
+        try:
+            timeout = float(packet_data.get('timeout', PACKET_TIMEOUT))
+        except (TypeError, ValueError):
+            timeout = math.nan
+        if not timeout > 0:
+            raise ValueError(f"timeout must be a positive number of seconds, not {packet_data.get('timeout')!r}")
+        return {"timeout": min(timeout, _MAX_PACKET_TIMEOUT),
+                "await_response": bool(packet_data.get('await_response'))}
     
     def _run(self, cmd: str, timeout=DEFAULT_TIMEOUT):
         """Execute a shell command with timeout"""
+        argv = shlex.split(cmd)
+        program = argv[0] if argv else ""
+        _SUBPROCESS_SPAWNS.labels(program).inc()
+        start = time.perf_counter()
         try:
-            cp = subprocess.run(shlex.split(cmd), capture_output=True, text=True, timeout=timeout)
-            return cp.returncode, cp.stdout.strip(), cp.stderr.strip()
+            cp = subprocess.run(argv, capture_output=True, text=True, timeout=timeout)
+            result = (cp.returncode, cp.stdout.strip(), cp.stderr.strip())
         except subprocess.TimeoutExpired:
-            return 124, "", f"timeout after {timeout}s"
+            result = (124, "", f"timeout after {timeout}s")
+        if program.startswith("snmp"):
+            _SNMP_LATENCY.labels(program).observe(time.perf_counter() - start)
+            outcome = "ok" if result[0] == 0 else ("timeout" if result[0] == 124 else "error")
+            _SNMP_REQUESTS.labels(program, outcome).inc()
+        return result
     
     
     
+    @_journaled("snmp_walk", "target")
     def snmp_walk(self, target: str, community: str = "public"):
         """Execute SNMP walk with LED visualization"""
         if not target.strip():
@@ -70,7 +221,7 @@ class CommandExecutor:
                     time.sleep(0.067)  # 15Hz = 0.067s per step
                 self.gpio._off_all()
             
-            threading.Thread(target=success_animation, daemon=True).start()
+            threading.Thread(target=success_animation, name="anim-snmp-walk", daemon=True).start()
         else:
             # Flash red LED for error
             self.gpio.strobe_error()
@@ -83,6 +234,7 @@ class CommandExecutor:
             "stderr": err
         }
     
+    @_journaled("snmp_portdown", "target", "ifindex")
     def snmp_portdown(self, target: str, ifindex: str, community: str = "private"):
         """Set SNMP port to down with LED visualization"""
         if not (target.strip() and ifindex.strip().isdigit()):
@@ -125,7 +277,7 @@ class CommandExecutor:
                     time.sleep(0.067)  # 15Hz = 0.067s per step
                 self.gpio._off_all()
             
-            threading.Thread(target=port_down_animation, daemon=True).start()
+            threading.Thread(target=port_down_animation, name="anim-port-down", daemon=True).start()
         else:
             # Error animation
             self.gpio.strobe_error()
@@ -147,6 +299,7 @@ class CommandExecutor:
             "confirm_stderr": gerr
         }
     
+    @_journaled("snmp_portup", "target", "ifindex")
     def snmp_portup(self, target: str, ifindex: str, community: str = "private"):
         """Set SNMP port to up with LED visualization"""
         if not (target.strip() and ifindex.strip().isdigit()):
@@ -189,7 +342,7 @@ class CommandExecutor:
                     time.sleep(0.067)  # 15Hz = 0.067s per step
                 self.gpio._off_all()
             
-            threading.Thread(target=port_up_animation, daemon=True).start()
+            threading.Thread(target=port_up_animation, name="anim-port-up", daemon=True).start()
         else:
             # Error animation
             self.gpio.strobe_error()
@@ -211,6 +364,7 @@ class CommandExecutor:
             "confirm_stderr": gerr
         }
     
+    @_journaled("snmp_port_status", "target", "ifindex")
     def snmp_get_port_status(self, target: str, ifindex: str, community: str = "public"):
         """Get the operational status of a specific port"""
         if not (target.strip() and ifindex.strip()):
@@ -243,6 +397,7 @@ class CommandExecutor:
             "status": status
         }
     
+    @_journaled("snmp_interfaces", "target")
     def snmp_get_interfaces(self, target: str, community: str = "public"):
         """Get list of network interfaces with their status"""
         if not target.strip():
@@ -292,7 +447,7 @@ class CommandExecutor:
                     time.sleep(0.067)  # 15Hz = 0.067s per step
                 self.gpio._off_all()
             
-            threading.Thread(target=success_animation, daemon=True).start()
+            threading.Thread(target=success_animation, name="anim-snmp-interfaces", daemon=True).start()
         
         return {
             "ok": ok,
@@ -313,9 +468,11 @@ class CommandExecutor:
             }
         }
     
+    @_journaled("packet_craft")
     def craft_and_send_packet(self, packet_data):
         """Craft and send a custom packet with specified parameters"""
-        print(f"DEBUG CRAFT: Starting craft_and_send_packet with data: {packet_data}")
+        log.debug("craft_and_send_packet: %s", packet_data)
+        capture = None
         try:
             # Extract packet parameters
             target_ip = packet_data.get('target_ip', '').strip()
@@ -329,14 +486,19 @@ class CommandExecutor:
             
             if not target_ip:
                 return {"ok": False, "error": "Target IP is required"}
+            try:
+                options = self.send_options(packet_data)
+            except ValueError as e:
+                return {"ok": False, "error": str(e)}
             
             self.gpio.stop_anim()
             self.gpio._off_all()
             
+            capture = self._capture_for(packet_data)
             if protocol == 'tcp':
-                result = self._send_tcp_packet(source_ip, source_port, target_ip, target_port, payload, source_mac, target_mac)
+                result = self._send_tcp_packet(source_ip, source_port, target_ip, target_port, payload, source_mac, target_mac, capture, **options)
             elif protocol == 'udp':
-                result = self._send_udp_packet(source_ip, source_port, target_ip, target_port, payload, source_mac, target_mac)
+                result = self._send_udp_packet(source_ip, source_port, target_ip, target_port, payload, source_mac, target_mac, capture, **options)
             else:
                 return {"ok": False, "error": f"Unsupported protocol: {protocol}"}
             
@@ -367,14 +529,18 @@ class CommandExecutor:
                         time.sleep(0.067)  # 15Hz
                     self.gpio._off_all()
                 
-                threading.Thread(target=success_animation, daemon=True).start()
+                threading.Thread(target=success_animation, name="anim-packet-craft", daemon=True).start()
             else:
                 # Error animation
                 self.gpio.strobe_error()
             
+            if capture is not None:
+                result["capture"] = capture.finish()
             return result
             
         except Exception as e:
+            if capture is not None:
+                capture.close()
             self.gpio.strobe_error()
             return {"ok": False, "error": f"Packet crafting failed: {str(e)}"}
     
@@ -389,6 +555,7 @@ class CommandExecutor:
                 # Windows ARP lookup
                 arp_cmd = f"arp -a {target_ip}"
             
+            _SUBPROCESS_SPAWNS.labels("arp").inc()
             result = subprocess.run(arp_cmd, shell=True, capture_output=True, text=True, timeout=5)
             
             if result.returncode == 0:
@@ -411,40 +578,24 @@ class CommandExecutor:
     
     def get_source_mac(self):
         """Get MAC address of the primary network interface"""
-        try:
-            # Get the default gateway interface
-            gateways = netifaces.gateways()
-            default_interface = gateways['default'][netifaces.AF_INET][1]
-            
-            # Get MAC address of the default interface
-            interface_info = netifaces.ifaddresses(default_interface)
-            if netifaces.AF_LINK in interface_info:
-                mac = interface_info[netifaces.AF_LINK][0]['addr'].upper()
-                return {"ok": True, "mac": mac}
-            
-            return {"ok": False, "error": "Could not get source MAC address"}
-            
-        except Exception as e:
-            # Fallback: try to get any available MAC
-            try:
-                for interface in netifaces.interfaces():
-                    if interface.startswith(('eth', 'wlan', 'en', 'wl')):
-                        interface_info = netifaces.ifaddresses(interface)
-                        if netifaces.AF_LINK in interface_info:
-                            mac = interface_info[netifaces.AF_LINK][0]['addr'].upper()
-                            if mac != '00:00:00:00:00:00':
-                                return {"ok": True, "mac": mac}
-                
-                return {"ok": False, "error": "No valid network interface found"}
-            except:
-                return {"ok": False, "error": f"MAC lookup failed: {str(e)}"}
+        mac, error = self.interfaces.source_mac()
+        if mac is None:
+            return {"ok": False, "error": error}
+        return {"ok": True, "mac": mac}
     
-    def _send_tcp_packet(self, src_ip, src_port, dst_ip, dst_port, payload, src_mac='', dst_mac=''):
-        """Send a TCP packet with custom payload (using regular socket, no admin privileges required)"""
+    def _send_tcp_packet(self, src_ip, src_port, dst_ip, dst_port, payload, src_mac='', dst_mac='', capture=None,
+                         timeout=PACKET_TIMEOUT, await_response=False):
+        """Send a TCP packet with custom payload (using regular socket, no admin privileges required); a capture
+        is armed before the connection is opened. The result's timing breaks the send into stages"""
+        timing = SendTiming()
+        sock = None
         try:
+            with timing.stage("resolve"):
+                dst_addr = socket.gethostbyname(dst_ip)
+            
             # Use regular TCP socket instead of raw socket to avoid permission issues
             sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            sock.settimeout(3)  # 3 second timeout (reduced for faster feedback)
+            sock.settimeout(timeout)
             
             # Bind to specific source if provided
             if src_ip and src_port:
@@ -454,8 +605,13 @@ class CommandExecutor:
                     # If binding fails, let system choose source
                     pass
             
-            # Connect and send payload
-            sock.connect((dst_ip, dst_port))
+            if capture is not None:
+                capture.arm(sock, "tcp", dst_addr, dst_port)
+            
+            # Connect (SYN to established) and send payload; kernel timestamps need an established connection
+            with timing.stage("connect"):
+                sock.connect((dst_addr, dst_port))
+            timing.enable_kernel(sock, tcp=True)
             
             # Convert payload to bytes if it's a string
             if isinstance(payload, str):
@@ -463,10 +619,13 @@ class CommandExecutor:
             else:
                 payload_bytes = payload
                 
-            sock.send(payload_bytes)
-            sock.close()
+            timing.send(sock, payload_bytes)
+            if await_response:
+                timing.await_response(sock)
+            # Wait for the peer's ACK of the payload, which the kernel timestamps
+            timing.transmitted(sock, wait_ack=True, timeout=timeout)
             
-            return {
+            result = {
                 "ok": True,
                 "message": f"TCP packet sent to {dst_ip}:{dst_port}",
                 "payload_size": len(payload_bytes),
@@ -475,19 +634,33 @@ class CommandExecutor:
             }
             
         except socket.timeout:
-            return {"ok": False, "error": f"Connection timeout - No service responding on {dst_ip}:{dst_port}. Try port 22 (SSH), 443 (HTTPS), or 80 on a web server."}
+            result = {"ok": False, "error": f"Connection timeout - No SYN-ACK from {dst_ip}:{dst_port} within {timeout}s: the host is down or a firewall is silently dropping. Try port 22 (SSH), 443 (HTTPS), or 80 on a web server."}
         except ConnectionRefusedError:
-            return {"ok": False, "error": f"Connection refused - Port {dst_port} closed on {dst_ip}. The target is reachable but not accepting connections on this port."}
+            result = {"ok": False, "error": f"Connection refused - Port {dst_port} closed on {dst_ip}. The target is reachable but not accepting connections on this port."}
         except socket.gaierror as e:
-            return {"ok": False, "error": f"DNS/Address error: {str(e)}"}
+            result = {"ok": False, "error": f"DNS/Address error: {str(e)}"}
         except Exception as e:
-            return {"ok": False, "error": f"TCP packet send failed: {str(e)}"}
+            result = {"ok": False, "error": f"TCP packet send failed: {str(e)}"}
+        finally:
+            if sock is not None:
+                sock.close()
+        
+        result["timing"] = timing.result()
+        self.record_send_timing(dst_ip, "tcp", result["timing"])
+        return result
     
-    def _send_udp_packet(self, src_ip, src_port, dst_ip, dst_port, payload, src_mac='', dst_mac=''):
-        """Send a UDP packet with custom payload"""
+    def _send_udp_packet(self, src_ip, src_port, dst_ip, dst_port, payload, src_mac='', dst_mac='', capture=None,
+                         timeout=PACKET_TIMEOUT, await_response=False):
+        """Send a UDP packet with custom payload; a capture is armed before it is sent. The result's timing
+        breaks the send into stages"""
+        timing = SendTiming()
+        sock = None
         try:
+            with timing.stage("resolve"):
+                dst_addr = socket.gethostbyname(dst_ip)
+            
             sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-            sock.settimeout(3)  # 3 second timeout
+            sock.settimeout(timeout)
             
             # Bind to specific source if provided
             if src_ip and src_port:
@@ -497,16 +670,26 @@ class CommandExecutor:
                     # If binding fails, let system choose source
                     pass
             
+            timing.enable_kernel(sock, tcp=False)
+            if capture is not None:
+                capture.arm(sock, "udp", dst_addr, dst_port, hold=True)
+            if await_response:
+                # The kernel reports ICMP port unreachable only to a connected UDP socket; without it a
+                # closed port would look like a silent drop
+                sock.connect((dst_addr, dst_port))
+            
             # Convert payload to bytes if it's a string
             if isinstance(payload, str):
                 payload_bytes = payload.encode('utf-8')
             else:
                 payload_bytes = payload
             
-            sock.sendto(payload_bytes, (dst_ip, dst_port))
-            sock.close()
+            timing.send(sock, payload_bytes, None if await_response else (dst_addr, dst_port))
+            if await_response:
+                timing.await_response(sock)
+            timing.transmitted(sock, wait_ack=False, timeout=timeout)
             
-            return {
+            result = {
                 "ok": True,
                 "message": f"UDP packet sent to {dst_ip}:{dst_port}",
                 "payload_size": len(payload_bytes),
@@ -514,16 +697,25 @@ class CommandExecutor:
             }
             
         except socket.timeout:
-            return {"ok": False, "error": f"UDP send timeout to {dst_ip}:{dst_port}"}
+            result = {"ok": False, "error": f"UDP send timeout to {dst_ip}:{dst_port}"}
         except socket.gaierror as e:
-            return {"ok": False, "error": f"DNS/Address error: {str(e)}"}
+            result = {"ok": False, "error": f"DNS/Address error: {str(e)}"}
         except Exception as e:
-            return {"ok": False, "error": f"UDP packet send failed: {str(e)}"}
+            result = {"ok": False, "error": f"UDP packet send failed: {str(e)}"}
+        finally:
+            if sock is not None:
+                sock.close()
+        
+        result["timing"] = timing.result()
+        self.record_send_timing(dst_ip, "udp", result["timing"])
+        return result
     
 
     
+    @_journaled("packet_raw")
     def send_raw_packet(self, packet_data):
         """Send a raw packet from hex string"""
+        capture = None
         try:
             target_ip = packet_data.get('target_ip', '').strip()
             target_port = int(packet_data.get('target_port', 80))
@@ -531,6 +723,10 @@ class CommandExecutor:
             
             if not target_ip or not hex_payload:
                 return {"ok": False, "error": "Target IP and hex payload are required"}
+            try:
+                self._capture_window(packet_data)
+            except ValueError as e:
+                return {"ok": False, "error": str(e)}
             
             # Convert hex string to bytes
             try:
@@ -543,6 +739,9 @@ class CommandExecutor:
             
             # Send raw packet via UDP
             sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            capture = self._capture_for(packet_data)
+            if capture is not None:
+                capture.arm(sock, "udp", target_ip, target_port, hold=True)
             sock.sendto(raw_bytes, (target_ip, target_port))
             sock.close()
             
@@ -572,21 +771,28 @@ class CommandExecutor:
                     time.sleep(0.067)  # 15Hz
                 self.gpio._off_all()
             
-            threading.Thread(target=success_animation, daemon=True).start()
+            threading.Thread(target=success_animation, name="anim-raw-packet", daemon=True).start()
             
-            return {
+            result = {
                 "ok": True,
                 "message": f"Raw packet sent to {target_ip}:{target_port}",
                 "payload_size": len(raw_bytes),
                 "hex_payload": hex_payload
             }
+            if capture is not None:
+                result["capture"] = capture.finish()
+            return result
             
         except Exception as e:
+            if capture is not None:
+                capture.close()
             self.gpio.strobe_error()
             return {"ok": False, "error": f"Raw packet send failed: {str(e)}"}
     
+    @_journaled("packet_eicar")
     def send_eicar_packet(self, packet_data):
         """Send EICAR test string as packet payload"""
+        capture = None
         try:
             target_ip = packet_data.get('target_ip', '').strip()
             target_port = int(packet_data.get('target_port', 80))
@@ -594,6 +800,10 @@ class CommandExecutor:
             
             if not target_ip:
                 return {"ok": False, "error": "Target IP is required"}
+            try:
+                options = self.send_options(packet_data)
+            except ValueError as e:
+                return {"ok": False, "error": str(e)}
             
             # EICAR test string
             eicar_string = "X5O!P%@AP[4\\PZX54(P^)7CC)7}$EICAR-STANDARD-ANTIVIRUS-TEST-FILE!$H+H*"
@@ -601,10 +811,11 @@ class CommandExecutor:
             self.gpio.stop_anim()
             self.gpio._off_all()
             
+            capture = self._capture_for(packet_data)
             if protocol == 'tcp':
-                result = self._send_tcp_packet('', 12345, target_ip, target_port, eicar_string)
+                result = self._send_tcp_packet('', 12345, target_ip, target_port, eicar_string, capture=capture, **options)
             else:
-                result = self._send_udp_packet('', 12345, target_ip, target_port, eicar_string)
+                result = self._send_udp_packet('', 12345, target_ip, target_port, eicar_string, capture=capture, **options)
             
             # Success animation - Same as SNMP port down (1→16 at 15Hz, once)
             if result["ok"]:
@@ -633,17 +844,22 @@ class CommandExecutor:
                         time.sleep(0.067)  # 15Hz
                     self.gpio._off_all()
                 
-                threading.Thread(target=eicar_animation, daemon=True).start()
+                threading.Thread(target=eicar_animation, name="anim-eicar", daemon=True).start()
             else:
                 self.gpio.strobe_error()
             
             result["eicar_payload"] = eicar_string
+            if capture is not None:
+                result["capture"] = capture.finish()
             return result
             
         except Exception as e:
+            if capture is not None:
+                capture.close()
             self.gpio.strobe_error()
             return {"ok": False, "error": f"EICAR packet send failed: {str(e)}"}
     
+    @_journaled("flood_start")
     def start_udp_flood(self, flood_data):
         """Start UDP flood attack targeting ~80Mbps bandwidth"""
         try:
@@ -695,15 +911,22 @@ class CommandExecutor:
                 additional_data = ''.join(random.choices(string.ascii_letters + string.digits + ' .,', k=packet_size - len(payload)))
                 payload += additional_data.encode()
             
-            # Store flood state
+            # Store flood state; packet/byte/error counts live in the telemetry shards
+            if getattr(self, 'flood_telemetry', None) is not None:
+                self.flood_telemetry.stop()
             self.flood_active = True
             self.flood_stats = {
-                'packets_sent': 0,
-                'bytes_sent': 0,
                 'start_time': time.time(),
                 'target_ip': target_ip,
                 'target_port': target_port
             }
+            telemetry = RateTelemetry(
+                history_seconds=FLOOD_HISTORY_SECONDS,
+                on_tick=lambda t: EVENTS.publish("flood", self._flood_snapshot(t)),
+                name="flood-telemetry"
+            )
+            self.flood_telemetry = telemetry
+            telemetry.start()
             
             # LED animation for flood - 100Hz rapid fire
             def led_animation_worker():
@@ -734,12 +957,13 @@ class CommandExecutor:
                             self.gpio._apply_states(*st)
                             time.sleep(0.01)  # 100Hz
                 except Exception as e:
-                    print(f"LED animation error: {e}")
+                    log.error("LED animation error: %s", e)
                 finally:
                     self.gpio._off_all()
             
             def flood_worker():
                 """Worker function to send UDP packets"""
+                counters = telemetry.shard()
                 try:
                     sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
                     sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
@@ -752,7 +976,7 @@ class CommandExecutor:
                             
                         try:
                             # Generate unique payload for each packet (no patterns)
-                            if self.flood_stats['packets_sent'] % 50 == 0:
+                            if counters[PACKETS] % 50 == 0:
                                 # Every 50th packet, generate completely new realistic data
                                 import random
                                 import string
@@ -781,29 +1005,34 @@ class CommandExecutor:
                             else:
                                 sock.sendto(payload, (target_ip, target_port))
                                 
-                            self.flood_stats['packets_sent'] += 1
-                            self.flood_stats['bytes_sent'] += packet_size
+                            counters[PACKETS] += 1
+                            counters[BYTES] += packet_size
                             
                             # Small delay to control bandwidth
                             if delay_between_packets > 0:
                                 time.sleep(delay_between_packets)
                                 
                         except Exception as e:
-                            print(f"Flood packet error: {e}")
+                            counters[ERRORS] += 1
+                            log.warning("Flood packet error: %s", e)
                             continue
                     
                     sock.close()
                         
                 except Exception as e:
-                    print(f"Flood worker error: {e}")
-                    self.flood_active = False
+                    log.error("Flood worker error: %s", e)
+                finally:
+                    # The flood is over once its worker is, duration reached or not; a newer flood keeps its own state
+                    if self.flood_telemetry is telemetry:
+                        self.flood_active = False
+                    telemetry.stop()
             
             # Start LED animation in background thread
-            self.led_animation_thread = threading.Thread(target=led_animation_worker, daemon=True)
+            self.led_animation_thread = threading.Thread(target=led_animation_worker, name="flood-leds", daemon=True)
             self.led_animation_thread.start()
             
             # Start flood in background thread
-            self.flood_thread = threading.Thread(target=flood_worker, daemon=True)
+            self.flood_thread = threading.Thread(target=flood_worker, name="flood-worker", daemon=True)
             self.flood_thread.start()
             
             return {
@@ -819,6 +1048,7 @@ class CommandExecutor:
             self.gpio.strobe_error()
             return {"ok": False, "error": f"UDP flood start failed: {str(e)}"}
     
+    @_journaled("flood_stop")
     def stop_udp_flood(self):
         """Stop the UDP flood attack"""
         try:
@@ -831,17 +1061,22 @@ class CommandExecutor:
                 
             # Calculate final stats
             if hasattr(self, 'flood_stats'):
+                telemetry = self.flood_telemetry
+                telemetry.stop()
+                packets_sent, bytes_sent, errors = telemetry.totals()
                 duration = time.time() - self.flood_stats['start_time']
-                avg_bandwidth = (self.flood_stats['bytes_sent'] * 8) / duration / 1024 / 1024  # Mbps
+                avg_bandwidth = (bytes_sent * 8) / duration / 1024 / 1024  # Mbps
                 
                 stats = {
                     "ok": True,
                     "message": "UDP flood stopped",
-                    "packets_sent": self.flood_stats['packets_sent'],
-                    "bytes_sent": self.flood_stats['bytes_sent'],
+                    "packets_sent": packets_sent,
+                    "bytes_sent": bytes_sent,
+                    "errors": errors,
                     "duration_seconds": round(duration, 2),
                     "average_bandwidth_mbps": round(avg_bandwidth, 2)
                 }
+                EVENTS.publish("flood", self._flood_snapshot(telemetry))
             else:
                 stats = {"ok": True, "message": "No active flood to stop"}
             
@@ -853,26 +1088,31 @@ class CommandExecutor:
         except Exception as e:
             return {"ok": False, "error": f"UDP flood stop failed: {str(e)}"}
     
-    def get_flood_status(self):
+    def _flood_snapshot(self, telemetry, history_seconds=0):
+        """Flood status built from telemetry: totals, instantaneous rate, EWMA and history"""
+        snap = telemetry.snapshot(history_seconds)
+        duration = time.time() - self.flood_stats['start_time']
+        to_mbps = lambda bytes_per_second: round(bytes_per_second * 8 / 1024 / 1024, 2)
+        snap.update({
+            "ok": True,
+            "active": bool(self.flood_active) and telemetry.running,
+            "duration_seconds": round(duration, 2),
+            "current_bandwidth_mbps": to_mbps(snap["current_bytes_per_second"]),
+            "ewma_bandwidth_mbps": to_mbps(snap["ewma_bytes_per_second"]),
+            "average_bandwidth_mbps": to_mbps(snap["bytes_sent"] / duration) if duration > 0 else 0,
+            "target_ip": self.flood_stats['target_ip'],
+            "target_port": self.flood_stats['target_port']
+        })
+        return snap
+    
+    def get_flood_status(self, history_seconds=FLOOD_HISTORY_SECONDS):
         """Get current flood attack status"""
         try:
             if not hasattr(self, 'flood_active') or not self.flood_active:
                 return {"ok": True, "active": False, "message": "No active flood"}
             
             if hasattr(self, 'flood_stats'):
-                duration = time.time() - self.flood_stats['start_time']
-                current_bandwidth = (self.flood_stats['bytes_sent'] * 8) / duration / 1024 / 1024 if duration > 0 else 0
-                
-                return {
-                    "ok": True,
-                    "active": True,
-                    "packets_sent": self.flood_stats['packets_sent'],
-                    "bytes_sent": self.flood_stats['bytes_sent'],
-                    "duration_seconds": round(duration, 2),
-                    "current_bandwidth_mbps": round(current_bandwidth, 2),
-                    "target_ip": self.flood_stats['target_ip'],
-                    "target_port": self.flood_stats['target_port']
-                }
+                return self._flood_snapshot(self.flood_telemetry, history_seconds)
             else:
                 return {"ok": True, "active": True, "message": "Flood active but no stats available"}
                 
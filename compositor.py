@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+LED compositor for Raspberry Pi LED Server
+Every LED has a brightness (0-255) built from layers blended bottom to top in LED_LAYERS order: an
+idle base, the pin frame (/pins and the animations), status overlays and alert flashes. Fades and
+flashes are stepped by one thread at COMPOSITOR_FPS and only LEDs whose composited level changed are
+written, as a PWM duty cycle that pigpio times in hardware
+"""
+
+import threading
+import time
+from config import *
+from metrics import METRICS
+
+_FRAMES = METRICS.counter("led_compositor_frames_total", "Composited LED frames that changed at least one LED")
+
+# The pin frame's place in LED_LAYERS; it is set by the controller, not through set()
+FRAME_LAYER = "frame"
+
+
+class _Cell:
+    """One LED on one layer: a level drawn at an opacity, either of which may be fading"""
+
+    __slots__ = ("level", "alpha", "to_level", "to_alpha", "start", "duration", "blink", "remove")
+
+    def __init__(self, level, alpha, now):
+        self.level = self.to_level = level
+        self.alpha = self.to_alpha = alpha
+        self.start = now
+        self.duration = 0.0
+        self.blink = None  # (on seconds, off seconds, count) while flashing
+        self.remove = False  # drop the cell once its fade ends
+
+    def fade(self, level, alpha, duration, now):
+        """Start moving from where the cell is now towards (level, alpha)"""
+        self.level, self.alpha, _ = self.at(now)
+        self.to_level, self.to_alpha = level, alpha
+        self.start = now
+        self.duration = duration
+        self.blink = None
+
+    def at(self, now):
+        """(level, alpha, moving) at time `now`"""
+        elapsed = now - self.start
+        if self.blink is not None:
+            on, off, count = self.blink
+            if elapsed >= count * (on + off):
+                return self.to_level, 0.0, False
+            return self.to_level, 1.0 if elapsed % (on + off) < on else 0.0, True
+        if elapsed >= self.duration:
+            return self.to_level, self.to_alpha, False
+        f = elapsed / self.duration
+        return (self.level + (self.to_level - self.level) * f,
+                self.alpha + (self.to_alpha - self.alpha) * f, True)
+
+
+class Compositor:
+    """Layered LED brightness. `write(levels, changed)` is called with the composited levels and the indices
+    that changed; `release(levels)` when the last layer cell is gone and the pin frame alone is shown again.
+    `lock` is shared with the controller so frames, layer changes and compositor ticks never interleave"""
+
+    def __init__(self, count, write, release, lock, layers=LED_LAYERS, fps=COMPOSITOR_FPS):
+        self.count = count
+        self.engaged = False  # any layer holds a cell; the controller writes frames through here meanwhile
+        self.levels = [0] * count  # last written level per LED
+        self._write = write
+        self._release = release
+        self._layers = {name: {} for name in layers if name != FRAME_LAYER}
+        self._order = tuple(layers)
+        self._frame = 0
+        self._period = 1.0 / fps
+        self._moving = False
+        self._closed = False
+        self._cond = threading.Condition(lock)
+        self._thread = None
+        self._m_frames = _FRAMES.labels()
+
+    @property
+    def layer_names(self):
+        return tuple(self._layers)
+
+    def show_frame(self, mask):
+        """Record the pin frame; composite it if engaged. Caller holds the lock. True if it was written here"""
+        self._frame = mask
+        if not self.engaged:
+            return False
+        self._render(time.monotonic())
+        return True
+
+    def set(self, layer, levels, fade=0.0):
+        """Draw {LED index: level} on a layer, fading in over `fade` seconds"""
+        with self._cond:
+            now = time.monotonic()
+            cells = self._layers[layer]
+            for i, level in levels.items():
+                cell = cells.get(i)
+                if cell is None:
+                    cell = cells[i] = _Cell(level, 0.0, now)
+                cell.remove = False
+                cell.fade(level, 1.0, fade, now)
+            self._changed(now)
+
+    def clear(self, layer, indices=None, fade=0.0):
+        """Fade LEDs (all by default) out of a layer over `fade` seconds and drop them"""
+        with self._cond:
+            now = time.monotonic()
+            cells = self._layers[layer]
+            for i in list(cells) if indices is None else indices:
+                cell = cells.get(i)
+                if cell is not None:
+                    cell.fade(cell.to_level, 0.0, fade, now)
+                    cell.remove = True
+            self._changed(now)
+
+    def flash(self, layer, levels, on, off, count):
+        """Blink {LED index: level} on a layer `count` times, `on`/`off` seconds each, then drop them"""
+        with self._cond:
+            now = time.monotonic()
+            cells = self._layers[layer]
+            for i, level in levels.items():
+                cell = cells[i] = _Cell(level, 1.0, now)
+                cell.blink = (on, off, count)
+                cell.remove = True
+            self._changed(now)
+
+    def snapshot(self):
+        """{layer: {LED index: {"level", "alpha"}}} as drawn now"""
+        with self._cond:
+            now = time.monotonic()
+            result = {}
+            for name, cells in self._layers.items():
+                result[name] = {}
+                for i, cell in cells.items():
+                    level, alpha, _ = cell.at(now)
+                    result[name][i] = {"level": round(level), "alpha": round(alpha, 3)}
+            return result
+
+    def _changed(self, now):
+        if not self.engaged and any(self._layers.values()):
+            # Take over from the digital frame: start from what the pins show, so only differences are written
+            self.engaged = True
+            self.levels = [255 if self._frame >> i & 1 else 0 for i in range(self.count)]
+        if self.engaged:
+            self._render(now)
+        if self._moving:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="led-compositor", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def _composite(self, now):
+        """Levels per LED at `now`; drops finished cells and notes whether anything is still moving"""
+        out = [0.0] * self.count
+        moving = False
+        for name in self._order:
+            if name == FRAME_LAYER:
+                frame = self._frame
+                for i in range(self.count):
+                    if frame >> i & 1:
+                        out[i] = 255.0
+                continue
+            cells = self._layers[name]
+            done = []
+            for i, cell in cells.items():
+                level, alpha, cell_moving = cell.at(now)
+                if cell_moving:
+                    moving = True
+                elif cell.remove:
+                    done.append(i)
+                    continue
+                if alpha:
+                    out[i] += (level - out[i]) * alpha
+            for i in done:
+                del cells[i]
+        self._moving = moving
+        return [min(255, max(0, int(v + 0.5))) for v in out]
+
+    def _render(self, now):
+        """Composite and write the LEDs that changed; hands back to the digital frame once every layer is empty"""
+        levels = self._composite(now)
+        changed = [i for i in range(self.count) if levels[i] != self.levels[i]]
+        if changed:
+            self._m_frames.inc()
+            self._write(levels, changed)
+            self.levels = levels
+        if not any(self._layers.values()):
+            self.engaged = False
+            self._release(levels)
+
+    def _run(self):
+        with self._cond:
+            while not self._closed:
+                if not self._moving:
+                    self._cond.wait()
+                    continue
+                self._render(time.monotonic())
+                self._cond.wait(self._period)
+
+    def close(self):
+        """Drop every layer, show the pin frame alone again and stop the compositor thread"""
+        with self._cond:
+            for cells in self._layers.values():
+                cells.clear()
+            if self.engaged:
+                self._render(time.monotonic())
+            self._closed = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(1.0)
@@ -42,6 +42,27 @@ PIN_14_ACTIVE_LOW = False
 PIN_15_ACTIVE_LOW = False
 PIN_16_ACTIVE_LOW = False
 
+# Pin table in LED order: (name used by /on<name>, /pins and /status, BCM GPIO, active-low)
+PIN_TABLE = (
+    ("17", PIN_1, PIN_1_ACTIVE_LOW),
+    ("27", PIN_2, PIN_2_ACTIVE_LOW),
+    ("22", PIN_3, PIN_3_ACTIVE_LOW),
+    ("10", PIN_4, PIN_4_ACTIVE_LOW),
+    ("9", PIN_5, PIN_5_ACTIVE_LOW),
+    ("5", PIN_6, PIN_6_ACTIVE_LOW),
+    ("6", PIN_7, PIN_7_ACTIVE_LOW),
+    ("26", PIN_8, PIN_8_ACTIVE_LOW),
+    ("16", PIN_9, PIN_9_ACTIVE_LOW),
+    ("14", PIN_10, PIN_10_ACTIVE_LOW),
+    ("18", PIN_11, PIN_11_ACTIVE_LOW),
+    ("23", PIN_12, PIN_12_ACTIVE_LOW),
+    ("24", PIN_13, PIN_13_ACTIVE_LOW),
+    ("25", PIN_14, PIN_14_ACTIVE_LOW),
+    ("20", PIN_15, PIN_15_ACTIVE_LOW),
+    ("21", PIN_16, PIN_16_ACTIVE_LOW),
+)
+PIN_NAMES = tuple(name for name, _, _ in PIN_TABLE)
+
 # Legacy aliases for backward compatibility
 PIN_R = PIN_1   # RGB red (active-HIGH)
 PIN_X = PIN_2   # LED (active-HIGH)
@@ -58,10 +79,65 @@ B_ACTIVE_LOW = PIN_5_ACTIVE_LOW
 C_ACTIVE_LOW = PIN_6_ACTIVE_LOW
 D_ACTIVE_LOW = PIN_7_ACTIVE_LOW
 
+# GPIO backend: "pigpio" drives real pins via pigpiod, "simulated" keeps pin state in memory
+GPIO_BACKEND = "pigpio"
+
+# Cluster mode (cluster.py): drive the LED panels of several boards from this server through their
+# pigpiod, e.g. [{"name": "left", "host": "10.0.0.21"}, {"name": "right", "host": "10.0.0.22", "port": 8888}].
+# Start pigpiod on each board so it accepts remote connections (no -l). Empty drives only the local pins.
+CLUSTER_BOARDS = []
+CLUSTER_TIMEOUT = 2.0  # seconds a board may take to answer before it is marked offline
+CLUSTER_RECONNECT_INTERVAL = 2.0  # seconds between reconnection attempts to an offline board
+CLUSTER_POLL_INTERVAL = 1.0  # seconds between heartbeat reads of an idle board
+CLUSTER_ALIGN = True  # hold frames back on faster boards so a frame lands everywhere at once
+
 # Server configuration
 PORT = 5050
 HOST = "0.0.0.0"
 
+# HTTP server: "threaded" is a bounded worker pool serving one request per connection (wsgi_server.py),
+# "development" is Werkzeug's development server (one thread per connection)
+SERVER_MODE = "threaded"
+SERVER_THREADS = 24  # worker threads; each open /events stream holds one
+SERVER_BACKLOG = 64  # connections queued by the kernel while every worker is busy
+SERVER_REQUEST_TIMEOUT = 30.0  # seconds to receive a request, and per blocked socket send
+
+# Admission control (admission.py): routes under a lane's prefixes run at most `concurrency` at a time, with up
+# to `queue` more waiting at most `wait` seconds (then 503), and each client gets `rate` requests per second in
+# bursts of `burst` (then 429). Other routes (/status, /events, pages) are never held back. The lanes together
+# hold at most the sum of concurrency + queue worker threads; ADMISSION_RESERVED of SERVER_THREADS are kept
+# clear of them. With SERVER_WORKERS > 1 the limits apply per worker
+ADMISSION_ENABLED = True
+ADMISSION_RESERVED = 8
+ADMISSION_LANES = {
+    "snmp": {"prefixes": ("/snmp/",), "concurrency": 2, "queue": 2, "wait": 10.0, "rate": 0.5, "burst": 4},
+    "packet": {"prefixes": ("/packet/craft", "/packet/send-raw", "/packet/eicar-test", "/packet/get-target-mac",
+                            "/dos/start-flood"),
+               "concurrency": 3, "queue": 3, "wait": 5.0, "rate": 2.0, "burst": 6},
+    "animation": {"prefixes": ("/wave/", "/demo/packet"), "concurrency": 1, "queue": 2, "wait": 10.0, "rate": 1.0,
+                  "burst": 3},
+    "upload": {"prefixes": ("/upload-image",), "concurrency": 1, "queue": 1, "wait": 10.0, "rate": 0.5, "burst": 4},
+    "profile": {"prefixes": ("/admin/profile",), "concurrency": 1, "queue": 0, "wait": 0.0, "rate": 0.2, "burst": 2},
+}
+
+# WebSocket control channel (/ws): each open connection holds a server worker thread, like /events
+WS_STATUS_INTERVAL = 0.05  # seconds between LED status checks, shared by all clients; changes are pushed to each
+WS_PING_INTERVAL = 20.0  # seconds between pings; a client silent for two intervals is disconnected
+WS_MAX_MESSAGE_BYTES = 64 * 1024
+
+# The server answers before the hardware is up (startup.py): until the GPIO controller connects, LED status
+# reads all-off and commands are refused, and /readyz returns 503. Connecting is retried at this interval
+STARTUP_RETRY_INTERVAL = 2.0  # seconds
+
+# Only one process may drive the pins; a second server on the same Pi exits at startup
+GPIO_LOCK_FILE = "/tmp/led-server-gpio.lock"
+
+# SERVER_WORKERS > 1 forks that many web worker processes sharing the port; the pins and long-running
+# operations (animations, UDP flood) then live in gpio_daemon.py, reached over GPIO_DAEMON_SOCKET
+SERVER_WORKERS = 1
+GPIO_DAEMON_SOCKET = "/tmp/led-server-gpio.sock"
+GPIO_DAEMON_TIMEOUT = 30.0  # seconds a daemon call may take; one-shot waves get their run time on top
+
 # Animation settings
 DEFAULT_WAVE_SPEED = 1.0  # Hz
 DEFAULT_STEP_PERIOD = 0.16  # seconds
@@ -71,8 +147,86 @@ DEFAULT_ROUNDTRIP_PERIOD = 0.14  # seconds
 DEFAULT_TIMEOUT = 6  # seconds
 PING_TIMEOUT = 3  # seconds
 SNMP_TIMEOUT = 8  # seconds
+PACKET_TIMEOUT = 3  # seconds a crafted TCP/UDP send waits for the handshake, and for a reply when asked to
+PACKET_LATENCY_TARGETS = 64  # targets with their own send timing histograms (/packet/latency); the rest count as "other"
+
+# Config persistence (app_config.json, component_positions.json): changes are written after
+# CONFIG_WRITE_DEBOUNCE seconds of quiet, and at least every CONFIG_WRITE_MAX_DELAY seconds while they keep coming
+CONFIG_WRITE_DEBOUNCE = 2.0
+CONFIG_WRITE_MAX_DELAY = 10.0
+
+# Static asset pipeline: minified, precompressed, fingerprinted CSS/JS/fonts served with immutable caching.
+# Minified and compressed variants are cached in ASSET_CACHE_DIR so restarts skip both
+ASSET_PIPELINE = True
+ASSET_CACHE_DIR = ".asset-cache"  # relative to the server directory
+
+# Operation journal (journal.py): every executor operation is appended to JSON-lines segments of
+# JOURNAL_SEGMENT_BYTES in JOURNAL_DIR; the oldest segments are deleted beyond JOURNAL_MAX_BYTES
+JOURNAL_DIR = "journal"  # relative to the server directory; None disables the journal
+JOURNAL_SEGMENT_BYTES = 4 * 1024 * 1024
+JOURNAL_MAX_BYTES = 64 * 1024 * 1024
+JOURNAL_QUEUE_SIZE = 10000  # entries waiting for the writer before new ones are dropped
+JOURNAL_QUERY_LIMIT = 200  # default and maximum entries returned by /history
+
+# Reply capture (capture.py): packet requests with "capture": true record the sent flow's packets, and ICMP
+# errors about it, on a memory-mapped ring for CAPTURE_WINDOW seconds after sending. Needs Linux and CAP_NET_RAW
+CAPTURE_INTERFACE = None  # default interface to capture on; None captures on every interface
+CAPTURE_WINDOW = 1.0  # seconds; a TCP capture ends early once the connection is reset or closed
+CAPTURE_MAX_PACKETS = 64
+CAPTURE_SNAPLEN = 2048  # bytes kept per packet
+CAPTURE_DIR = "/tmp/led-server-captures"  # pcap files served at /packet/capture/<id>.pcap, shared by workers
+CAPTURE_KEEP = 50  # newest pcap files kept
+
+# Reachability probes (probes.py): every device on the diagram with an address, plus PROBE_TARGETS, is probed
+# every PROBE_INTERVAL seconds from one asyncio thread, answering within PING_TIMEOUT. ICMP echo where
+# net.ipv4.ping_group_range allows unprivileged ICMP sockets, else (or when a device ignores ICMP) a TCP connect
+# to PROBE_TCP_PORTS, where a refused connection still counts as an answer
+PROBE_ENABLED = True
+PROBE_TARGETS = []  # extra targets, e.g. [{"name": "gateway", "host": "192.168.1.1"}, {"host": "nas.local", "port": 445}]
+PROBE_INTERVAL = 1.0  # seconds
+PROBE_TCP_PORTS = (22, 80, 443)
+PROBE_HISTORY = 60  # results kept per device for loss and RTT statistics
+PROBE_DOWN_AFTER = 3  # consecutive losses before a device is reported down; one answer brings it back up
+
+# Demo scenarios (scenarios.py): scripted CommandExecutor steps with LED cues, started from /scenarios
+SCENARIO_DIR = "scenarios"  # relative to the server directory; .json files, or .yaml with PyYAML
+
+# Image catalog: static/images is watched with inotify; elsewhere it is rescanned every IMAGE_POLL_INTERVAL seconds
+IMAGE_POLL_INTERVAL = 5.0
+
+# Image uploads are capped at IMAGE_MAX_UPLOAD_BYTES; raster images larger than THUMBNAIL_MAX_SIZE px
+# get a diagram-sized variant at /thumbs/<name> when Pillow is installed
+IMAGE_MAX_UPLOAD_BYTES = 8 * 1024 * 1024
+THUMBNAIL_MAX_SIZE = 400
+
+# Missing images are answered with a placeholder SVG in place; browsers reuse it for PLACEHOLDER_MAX_AGE
+# seconds before revalidating, so an image added later under the same name shows up within that window
+PLACEHOLDER_MAX_AGE = 3600
+
+# Flood telemetry settings
+FLOOD_HISTORY_SECONDS = 120  # per-second samples kept for /dos/flood-status
+
+# LED brightness layers (compositor.py), blended bottom to top; "frame" is the on/off pin frame set by /pins
+# and the animations. The error strobe flashes on the top layer. LEDs are dimmed with pigpio's PWM
+LED_LAYERS = ("base", "frame", "status", "alert")
+COMPOSITOR_FPS = 60  # steps per second while a fade or flash is running
+LED_PWM_FREQUENCY = 800  # Hz
+LED_GAMMA = 2.2  # perceived brightness to duty cycle
 
 # LED animation settings
 ERROR_BLINKS = 3
 ERROR_ON_MS = 120
 ERROR_OFF_MS = 120
+
+# Logging settings
+LOG_LEVEL = "INFO"  # root level; DEBUG logs full request bodies
+LOG_LEVELS = {"werkzeug": "WARNING"}  # per-logger overrides, e.g. {"command_executor": "DEBUG"}
+LOG_FORMAT = "text"  # "text" for humans, "json" for log shipping
+LOG_QUEUE_SIZE = 10000  # records buffered for the writer thread before dropping
+LOG_RATE_LIMIT = 5  # identical warnings/errors allowed per interval
+LOG_RATE_INTERVAL = 10.0  # seconds
+
+# Live profiler (/admin/profile, /admin/threads) - off by default, enable only for diagnosis
+PROFILER_ENABLED = False
+PROFILER_DEFAULT_HZ = 100  # stack samples per second
+PROFILER_MAX_SECONDS = 60  # longest profile a single request may run
@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Config store for Raspberry Pi LED Server
+Keeps app_config.json and component_positions.json in memory as pre-serialized responses with ETags,
+and writes changes back to the SD card behind a debounce window with atomic replace
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from config import *
+from metrics import METRICS
+
+log = logging.getLogger(__name__)
+
+_WRITES = METRICS.counter("config_writes_total", "Config documents written to disk", ("document",))
+_UPDATES = METRICS.counter("config_updates_total", "Config document updates accepted", ("document",))
+
+
+def _dumps(data):
+    return json.dumps(data, separators=(",", ":"))
+
+
+class JSONDocument:
+    def __init__(self, path, key):
+        """Initialize document; `key` names the field the data is served under ("config", "positions")"""
+        self.path = path
+        self.key = key
+        self.name = os.path.basename(path)
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._signature = None
+        self._data = {}
+        self._body = b""
+        self._etag = ""
+        # Monotonic times of the first and latest unwritten change, None when disk is current
+        self._dirty_since = None
+        self._changed_at = None
+        self._version = 0
+        self._render({})
+
+    def _stat_signature(self):
+        """(mtime_ns, size, inode) of the file on disk, or None if it does not exist"""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return st.st_mtime_ns, st.st_size, st.st_ino
+
+    def _render(self, data):
+        self._data = data
+        self._body = _dumps({"ok": True, self.key: data}).encode("utf-8")
+        self._etag = hashlib.sha1(self._body).hexdigest()
+
+    def _refresh(self):
+        """Reload from disk if the file changed since the last read; pending writes win over disk"""
+        if self._dirty_since is not None:
+            return
+        signature = self._stat_signature()
+        if signature == self._signature:
+            return
+        with self._lock:
+            signature = self._stat_signature()
+            if signature == self._signature or self._dirty_since is not None:
+                return
+            if signature is None:
+                data = {}
+            else:
+                with open(self.path, "r") as f:
+                    data = json.load(f)
+            self._render(data)
+            self._signature = signature
+            log.debug("Loaded %s (etag %s)", self.path, self._etag)
+
+    def get(self):
+        """Current (body bytes, etag); raises if the file on disk is not valid JSON"""
+        self._refresh()
+        return self._body, self._etag
+
+    def data(self):
+        """Current parsed document"""
+        self._refresh()
+        return self._data
+
+    def update(self, changes, replace=False):
+        """Merge top-level entries into the document (a None value removes the entry), or replace it whole"""
+        self._refresh()
+        with self._lock:
+            if replace:
+                data = dict(changes)
+            else:
+                data = dict(self._data)
+                for key, value in changes.items():
+                    if value is None:
+                        data.pop(key, None)
+                    else:
+                        data[key] = value
+            self._render(data)
+            self._version += 1
+            now = time.monotonic()
+            if self._dirty_since is None:
+                self._dirty_since = now
+            self._changed_at = now
+        _UPDATES.labels(self.name).inc()
+
+    def due_at(self, debounce, max_delay):
+        """Monotonic time the pending change should be written, or None if nothing is pending"""
+        if self._dirty_since is None:
+            return None
+        return min(self._changed_at + debounce, self._dirty_since + max_delay)
+
+    def retry_later(self, now):
+        """Push a pending change whose write failed back by a full window, rather than spinning on it"""
+        with self._lock:
+            if self._dirty_since is not None:
+                self._dirty_since = self._changed_at = now
+
+    def flush(self):
+        """Write pending changes: compact JSON to a temp file, fsync, then rename over the original"""
+        with self._write_lock:
+            with self._lock:
+                if self._dirty_since is None:
+                    return False
+                payload = _dumps(self._data)
+                version = self._version
+            # Updates keep landing in memory while the SD card syncs
+            directory = os.path.dirname(self.path) or "."
+            tmp_path = os.path.join(directory, f".{self.name}.{os.getpid()}.tmp")
+            with open(tmp_path, "w") as f:
+                f.write(payload)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+            # Persist the rename itself so a power cut cannot resurrect the old file
+            try:
+                dir_fd = os.open(directory, os.O_RDONLY)
+            except OSError:
+                dir_fd = None
+            if dir_fd is not None:
+                try:
+                    os.fsync(dir_fd)
+                except OSError:
+                    pass
+                finally:
+                    os.close(dir_fd)
+            with self._lock:
+                self._signature = self._stat_signature()
+                if self._version == version:
+                    self._dirty_since = None
+                    self._changed_at = None
+        _WRITES.labels(self.name).inc()
+        log.debug("Wrote %s (%d bytes)", self.path, len(payload))
+        return True
+
+
+class ConfigStore:
+    def __init__(self, base_dir, debounce=CONFIG_WRITE_DEBOUNCE, max_delay=CONFIG_WRITE_MAX_DELAY):
+        """Initialize the dashboard configuration and component position documents"""
+        self.config = JSONDocument(os.path.join(base_dir, "app_config.json"), "config")
+        self.positions = JSONDocument(os.path.join(base_dir, "component_positions.json"), "positions")
+        self.documents = (self.config, self.positions)
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self._wake = threading.Condition()
+        self._closed = False
+        self._writer = None
+
+    def document(self, key):
+        """The document served under `key` ("config" or "positions")"""
+        for document in self.documents:
+            if document.key == key:
+                return document
+        raise KeyError(key)
+
+    def get_document(self, key, etag=None):
+        """{"etag"} when the caller's copy `etag` is current, else {"etag", "body"}; for web workers"""
+        body, current = self.document(key).get()
+        if current == etag:
+            return {"etag": current}
+        return {"etag": current, "body": body.decode("utf-8")}
+
+    def update_document(self, key, changes, replace=False):
+        """update() by document key; for web workers"""
+        self.update(self.document(key), changes, replace)
+        return True
+
+    def update(self, document, changes, replace=False):
+        """Apply a change in memory and schedule the write-behind"""
+        document.update(changes, replace=replace)
+        with self._wake:
+            if self._writer is None and not self._closed:
+                self._writer = threading.Thread(target=self._write_loop, name="config-writer", daemon=True)
+                self._writer.start()
+            self._wake.notify()
+
+    def _write_loop(self):
+        while True:
+            with self._wake:
+                while not self._closed:
+                    pending = [d.due_at(self.debounce, self.max_delay) for d in self.documents]
+                    pending = [due for due in pending if due is not None]
+                    delay = min(pending) - time.monotonic() if pending else None
+                    if delay is not None and delay <= 0:
+                        break
+                    self._wake.wait(delay)
+                if self._closed:
+                    return
+            # fsync on an SD card can take a while; write without holding up update()
+            now = time.monotonic()
+            for document in self.documents:
+                due = document.due_at(self.debounce, self.max_delay)
+                if due is not None and due <= now:
+                    try:
+                        document.flush()
+                    except OSError as e:
+                        log.error("Writing %s failed: %s", document.path, e)
+                        document.retry_later(now)
+
+    def flush(self):
+        """Write every pending change now"""
+        for document in self.documents:
+            try:
+                document.flush()
+            except OSError as e:
+                log.error("Writing %s failed: %s", document.path, e)
+
+    def close(self):
+        """Stop the writer and flush what is pending"""
+        with self._wake:
+            self._closed = True
+            self._wake.notify()
+        if self._writer is not None:
+            self._writer.join(timeout=5.0)
+        self.flush()
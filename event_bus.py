@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Event bus for Raspberry Pi LED Server
+In-process publish/subscribe feeding the /events Server-Sent Events stream
+"""
+
+import queue
+import threading
+from metrics import METRICS
+
+_PUBLISHED = METRICS.counter("events_published_total", "Events published on the event bus", ("event",))
+_DROPPED = METRICS.counter("events_dropped_total", "Events dropped for slow subscribers")
+
+
+class EventBus:
+    def __init__(self, queue_size=256):
+        """Initialize bus; each subscriber gets its own bounded queue"""
+        self.queue_size = queue_size
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self):
+        """Register a subscriber and return its queue of (event, data) tuples"""
+        q = queue.Queue(maxsize=self.queue_size)
+        with self._lock:
+            self._subscribers.add(q)
+        return q
+
+    def unsubscribe(self, q):
+        """Remove a subscriber queue"""
+        with self._lock:
+            self._subscribers.discard(q)
+
+    def subscriber_count(self):
+        return len(self._subscribers)
+
+    def publish(self, event, data):
+        """Deliver to every subscriber without blocking; a full queue loses its oldest event"""
+        _PUBLISHED.labels(event).inc()
+        with self._lock:
+            subscribers = list(self._subscribers)
+        item = (event, data)
+        for q in subscribers:
+            try:
+                q.put_nowait(item)
+            except queue.Full:
+                _DROPPED.inc()
+                try:
+                    q.get_nowait()
+                    q.put_nowait(item)
+                except (queue.Empty, queue.Full):
+                    pass
+
+
+# Process-wide bus shared by routes and background workers
+EVENTS = EventBus()
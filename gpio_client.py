@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+GPIO client for Raspberry Pi LED Server
+Drop-in stand-ins for GPIOController, CommandExecutor and ConfigStore that forward pin, flood and
+configuration operations to the GPIO daemon, so several web worker processes can share one set of LEDs
+"""
+
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from config import *
+from command_executor import CommandExecutor
+from event_bus import EVENTS
+from startup import READINESS
+from gpio_daemon import (FADE, FLASH, MASK, OP_ALL_OFF, OP_APPLY, OP_CALL, OP_CHASER, OP_LAYER_CLEAR,
+                         OP_LAYER_FLASH, OP_LAYER_SET, OP_LAYERS, OP_ROUNDTRIP, OP_SET_PINS, OP_STATUS,
+                         OP_STOP_ANIM, OP_STROBE, OP_SUBSCRIBE, OP_WAVE, PERIOD, STATUS_OK, STROBE, pack_levels,
+                         read_frame, send_frame)
+
+log = logging.getLogger(__name__)
+
+_PIN_INDEX = {name: i for i, name in enumerate(PIN_NAMES)}
+
+# Steps the daemon plays before answering a one-shot wave: one per pin, and a roundtrip goes out, holds and comes back
+_WAVE_STEPS = len(PIN_NAMES)
+_ROUNDTRIP_STEPS = 2 * len(PIN_NAMES)
+
+
+class GPIOClient:
+    """GPIOController interface backed by the GPIO daemon; one connection per calling thread"""
+
+    def __init__(self, socket_path=GPIO_DAEMON_SOCKET, timeout=GPIO_DAEMON_TIMEOUT):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self._local = threading.local()
+        self._relay = None
+        self._closed = False
+        READINESS.add("gpio", self.ready_state)
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.socket_path)
+        return sock
+
+    def _call(self, op, arg=0, payload=b"", timeout=None):
+        """One request/response on this thread's connection; reconnects once if the daemon restarted.
+        `timeout` replaces the client's for a call known to run longer"""
+        for attempt in (0, 1):
+            sock = getattr(self._local, "sock", None)
+            try:
+                if sock is None:
+                    sock = self._local.sock = self._connect()
+                if timeout is not None:
+                    sock.settimeout(timeout)
+                try:
+                    send_frame(sock, op, arg, payload)
+                    status, value, body = read_frame(sock)
+                finally:
+                    if timeout is not None:
+                        sock.settimeout(self.timeout)
+                break
+            except (ConnectionError, BrokenPipeError, FileNotFoundError, socket.timeout) as e:
+                if sock is not None:
+                    sock.close()
+                self._local.sock = None
+                if attempt or isinstance(e, socket.timeout):
+                    raise ConnectionError(f"GPIO daemon unavailable: {e}") from e
+        if status != STATUS_OK:
+            raise RuntimeError(f"GPIO daemon: {body.decode('utf-8', 'replace')}")
+        return value, body
+
+    def get_status(self):
+        degraded, body = self._call(OP_STATUS)
+        mask = MASK.unpack(body[:MASK.size])[0]
+        end = MASK.size + len(PIN_NAMES)
+        status = {"pins": {name: mask >> i & 1 for i, name in enumerate(PIN_NAMES)},
+                  "brightness": dict(zip(PIN_NAMES, body[MASK.size:end]))}
+        if degraded:
+            status["degraded"] = body[end:].decode("utf-8", "replace")
+        return status
+
+    def ready_state(self):
+        """Ready once the daemon answers with its pins up"""
+        try:
+            status = self.get_status()
+        except ConnectionError as e:
+            return False, str(e)
+        return "degraded" not in status, status.get("degraded")
+
+    def set_pins(self, names):
+        mask = 0
+        for name in names:
+            index = _PIN_INDEX.get(name)
+            if index is None:
+                return False
+            mask |= 1 << index
+        refused, _ = self._call(OP_SET_PINS, 0, MASK.pack(mask))
+        return not refused
+
+    def turn_on_pin(self, pin_name):
+        return self.set_pins((pin_name,))
+
+    def _off_all(self):
+        self._call(OP_ALL_OFF)
+
+    def _apply_states(self, *states):
+        mask = 0
+        for i, on in enumerate(states):
+            if on:
+                mask |= 1 << i
+        self._call(OP_APPLY, 0, MASK.pack(mask))
+
+    def stop_anim(self):
+        self._call(OP_STOP_ANIM)
+
+    def wave_once(self, step_period=DEFAULT_STEP_PERIOD):
+        # The daemon answers once the wave has played, so the wait grows with it
+        self._call(OP_WAVE, 0, PERIOD.pack(step_period), self.timeout + _WAVE_STEPS * step_period)
+
+    def roundtrip_wave(self, step_period=DEFAULT_ROUNDTRIP_PERIOD):
+        self._call(OP_ROUNDTRIP, 0, PERIOD.pack(step_period), self.timeout + _ROUNDTRIP_STEPS * step_period)
+
+    def start_chaser(self, step_period):
+        return bool(self._call(OP_CHASER, 0, PERIOD.pack(step_period))[0])
+
+    def strobe_error(self, blinks=ERROR_BLINKS, on_ms=ERROR_ON_MS, off_ms=ERROR_OFF_MS):
+        self._call(OP_STROBE, 0, STROBE.pack(blinks, int(on_ms), int(off_ms)))
+
+    def _layer_index(self, layer, levels):
+        """Index of the layer in LED_LAYERS; None for an unknown layer, pin or level"""
+        if layer not in LED_LAYERS or any(name not in _PIN_INDEX or not 0 <= level <= 255
+                                          for name, level in levels.items()):
+            return None
+        return LED_LAYERS.index(layer)
+
+    def set_brightness(self, layer, levels, fade=0.0):
+        index = self._layer_index(layer, levels)
+        if index is None:
+            return False
+        mask, data = pack_levels(levels)
+        return not self._call(OP_LAYER_SET, index, FADE.pack(fade, mask) + data)[0]
+
+    def clear_layer(self, layer, names=None, fade=0.0):
+        names = PIN_NAMES if names is None else names
+        index = self._layer_index(layer, dict.fromkeys(names, 0))
+        if index is None:
+            return False
+        mask, _ = pack_levels(dict.fromkeys(names, 0))
+        return not self._call(OP_LAYER_CLEAR, index, FADE.pack(fade, mask))[0]
+
+    def flash(self, layer, levels, on_ms=ERROR_ON_MS, off_ms=ERROR_OFF_MS, count=ERROR_BLINKS):
+        index = self._layer_index(layer, levels)
+        if index is None or not 0 < on_ms <= 0xFFFF or not 0 <= off_ms <= 0xFFFF or not 1 <= count <= 0xFF:
+            return False
+        mask, data = pack_levels(levels)
+        return not self._call(OP_LAYER_FLASH, index, FLASH.pack(int(on_ms), int(off_ms), count, mask) + data)[0]
+
+    def layers(self):
+        return json.loads(self._call(OP_LAYERS)[1])
+
+    def call(self, method, *args):
+        """Run a CommandExecutor method inside the daemon and return its result"""
+        return json.loads(self._call(OP_CALL, 0, json.dumps([method, list(args)]).encode("utf-8"))[1])
+
+    def relay_events(self, bus=EVENTS):
+        """Republish the daemon's events (flood telemetry) on this process's bus"""
+        self._relay = threading.Thread(target=self._relay_loop, args=(bus,), name="gpio-events", daemon=True)
+        self._relay.start()
+        return self
+
+    def _relay_loop(self, bus):
+        while not self._closed:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                sock.connect(self.socket_path)
+                send_frame(sock, OP_SUBSCRIBE, 0)
+                while True:
+                    event, data = json.loads(read_frame(sock)[2])
+                    bus.publish(event, data)
+            except OSError as e:
+                sock.close()
+                if not self._closed:
+                    log.warning("GPIO event relay lost (%s); reconnecting", e)
+                    time.sleep(1.0)
+
+    def wait_ready(self, timeout=10.0):
+        """Block until the daemon answers, e.g. right after starting it"""
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                return self.get_status()
+            except ConnectionError:
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.05)
+
+    def cleanup(self):
+        """Drop this thread's connection; the pins belong to the daemon and are left as they are"""
+        self._closed = True
+        sock = getattr(self._local, "sock", None)
+        if sock is not None:
+            sock.close()
+            self._local.sock = None
+
+
+class CommandClient(CommandExecutor):
+    """CommandExecutor whose flood state, scenarios, journal, send latency histograms and reachability probes live in
+    the daemon; SNMP and packet commands still run locally"""
+
+    def start_udp_flood(self, flood_data):
+        return self.gpio.call("start_udp_flood", flood_data)
+
+    def stop_udp_flood(self):
+        return self.gpio.call("stop_udp_flood")
+
+    def get_flood_status(self, history_seconds=FLOOD_HISTORY_SECONDS):
+        return self.gpio.call("get_flood_status", history_seconds)
+
+    def record_operation(self, op, target, ok, params, result):
+        self.gpio.call("record_operation", op, target, ok, params, result)
+
+    def query_history(self, since=None, until=None, type=None, target=None, limit=JOURNAL_QUERY_LIMIT):
+        return self.gpio.call("query_history", since, until, type, target, limit)
+
+    def record_send_timing(self, target, protocol, timing):
+        self.gpio.call("record_send_timing", target, protocol, timing)
+
+    def get_send_latency(self, target=None):
+        return self.gpio.call("get_send_latency", target)
+
+    def get_probe_status(self, device=None, history=False):
+        return self.gpio.call("get_probe_status", device, history)
+
+    def list_scenarios(self):
+        return self.gpio.call("list_scenarios")
+
+    def start_scenario(self, name):
+        return self.gpio.call("start_scenario", name)
+
+    def stop_scenario(self):
+        return self.gpio.call("stop_scenario")
+
+    def get_scenario_status(self):
+        return self.gpio.call("get_scenario_status")
+
+
+class RemoteDocument:
+    """JSONDocument interface for a document held by the daemon's ConfigStore; keeps the last copy and
+    fetches the body again only when the daemon's ETag differs"""
+
+    def __init__(self, client, key, path):
+        self.client = client
+        self.key = key
+        self.path = path
+        self.name = os.path.basename(path)
+        self._lock = threading.Lock()
+        self._body = b""
+        self._etag = None
+        self._data = None
+
+    def get(self):
+        """Current (body bytes, etag); raises ValueError if the daemon cannot read the document"""
+        try:
+            reply = self.client.call("get_document", self.key, self._etag)
+        except RuntimeError as e:
+            raise ValueError(str(e)) from e
+        with self._lock:
+            if "body" in reply:
+                self._body, self._etag, self._data = reply["body"].encode("utf-8"), reply["etag"], None
+            return self._body, self._etag
+
+    def data(self):
+        """Current parsed document"""
+        body, _ = self.get()
+        with self._lock:
+            if self._data is None or self._data[0] is not body:
+                self._data = (body, json.loads(body)[self.key])
+            return self._data[1]
+
+
+class RemoteConfigStore:
+    """ConfigStore interface whose documents and write-behind live in the daemon, so a save in one worker is
+    seen by every worker at once and concurrent merges do not overwrite each other"""
+
+    def __init__(self, client, base_dir=os.path.dirname(os.path.abspath(__file__))):
+        self.client = client
+        self.config = RemoteDocument(client, "config", os.path.join(base_dir, "app_config.json"))
+        self.positions = RemoteDocument(client, "positions", os.path.join(base_dir, "component_positions.json"))
+        self.documents = (self.config, self.positions)
+
+    def update(self, document, changes, replace=False):
+        self.client.call("update_document", document.key, changes, replace)
+
+    def flush(self):
+        """Nothing to do here; the daemon writes and flushes on shutdown"""
+
+    def close(self):
+        """Nothing to do here; the daemon writes and flushes on shutdown"""
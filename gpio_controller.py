@@ -5,16 +5,118 @@ GPIO Controller for Raspberry Pi LED Server
 Handles all LED operations and GPIO management
 """
 
+import fcntl
+import logging
+import os
 import pigpio
 import time
 import threading
 from config import *
+from compositor import Compositor
+from metrics import METRICS
+
+log = logging.getLogger(__name__)
+
+_GPIO_CALLS = METRICS.counter("gpio_calls_total", "pigpio calls issued by the controller", ("op",))
+_ANIMATION_FRAMES = METRICS.counter("led_animation_frames_total", "LED frames applied by animations")
+
+
+class SimulatedPi:
+    """In-memory stand-in for pigpio.pi() used for development and benchmarks"""
+
+    def __init__(self, write_latency=0.0):
+        self.connected = True
+        self.write_latency = write_latency
+        self.levels = {}
+        self.modes = {}
+        self.duty = {}  # gpio -> PWM duty cycle while PWM is on
+        self.frequency = {}
+        self.writes = 0
+        self.reads = 0
+        self._lock = threading.Lock()
+
+    def set_mode(self, gpio, mode):
+        self.modes[gpio] = mode
+
+    def write(self, gpio, level):
+        if self.write_latency:
+            time.sleep(self.write_latency)
+        with self._lock:
+            self.levels[gpio] = level
+            # As with pigpio, a plain write switches PWM off
+            self.duty.pop(gpio, None)
+            self.writes += 1
+
+    def set_PWM_dutycycle(self, gpio, dutycycle):
+        if self.write_latency:
+            time.sleep(self.write_latency)
+        with self._lock:
+            self.duty[gpio] = dutycycle
+            self.levels[gpio] = 1 if dutycycle else 0
+            self.writes += 1
+
+    def get_PWM_dutycycle(self, gpio):
+        return self.duty.get(gpio, 0)
+
+    def set_PWM_frequency(self, gpio, frequency):
+        self.frequency[gpio] = frequency
+        return frequency
+
+    def read(self, gpio):
+        self.reads += 1
+        return self.levels.get(gpio, 0)
+
+    def _write_bank(self, bits, level):
+        if self.write_latency:
+            time.sleep(self.write_latency)
+        with self._lock:
+            for gpio in range(32):
+                if bits >> gpio & 1:
+                    self.levels[gpio] = level
+            self.writes += 1
+
+    def set_bank_1(self, bits):
+        self._write_bank(bits, 1)
+
+    def clear_bank_1(self, bits):
+        self._write_bank(bits, 0)
+
+    def read_bank_1(self):
+        self.reads += 1
+        return sum(1 << gpio for gpio, level in self.levels.items() if level and gpio < 32)
+
+    def stop(self):
+        self.connected = False
+
+
+def claim_gpio(lock_path=GPIO_LOCK_FILE):
+    """Take the process-wide GPIO ownership lock; returns its fd, or exits if another process holds it"""
+    fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        with open(lock_path) as f:
+            owner = f.read().strip() or "another process"
+        os.close(fd)
+        raise SystemExit(f"GPIO is already owned by pid {owner} ({lock_path}); run a single server process")
+    os.ftruncate(fd, 0)
+    os.write(fd, str(os.getpid()).encode())
+    return fd
 
 
 class GPIOController:
-    def __init__(self):
-        """Initialize GPIO controller and set up pins"""
-        self.pi = pigpio.pi()
+    def __init__(self, pi=None, owner_fd=None):
+        """Initialize GPIO controller and set up pins; owner_fd is a GPIO lock already taken with claim_gpio()"""
+        self._owner_fd = owner_fd
+        if pi is not None:
+            self.pi = pi
+        elif GPIO_BACKEND == "simulated":
+            log.warning("GPIO_BACKEND is 'simulated' - no physical LEDs will change")
+            self.pi = SimulatedPi()
+        else:
+            if self._owner_fd is None:
+                self._owner_fd = claim_gpio()
+            self.pi = pigpio.pi(show_errors=False)
         if not self.pi.connected:
             raise SystemExit("pigpiod not running. Start with: sudo systemctl enable --now pigpiod")
         
@@ -22,61 +124,112 @@ class GPIOController:
         self.anim_stop = threading.Event()
         self.anim_lock = threading.Lock()
         
+        # Pre-bound metric children keep the per-call cost to a lock and an add
+        self._m_write = _GPIO_CALLS.labels("write")
+        self._m_read = _GPIO_CALLS.labels("read")
+        self._m_write_bank = _GPIO_CALLS.labels("write_bank")
+        self._m_read_bank = _GPIO_CALLS.labels("read_bank")
+        self._m_set_mode = _GPIO_CALLS.labels("set_mode")
+        self._m_frames = _ANIMATION_FRAMES.labels()
+        
+        # Precomputed from PIN_TABLE: LED index by name, GPIO bit per LED, and the bank bits of
+        # active-low LEDs; pins all in bank 1 (GPIO 0-31) are written together, one call per level
+        self._pin_index = {name: i for i, name in enumerate(PIN_NAMES)}
+        self._pin_bits = tuple(1 << gpio for _, gpio, _ in PIN_TABLE)
+        self._all_bits = sum(set(self._pin_bits))
+        self._active_low_bits = sum({1 << gpio for _, gpio, active_low in PIN_TABLE if active_low})
+        self._bank = all(gpio < 32 for _, gpio, _ in PIN_TABLE)
+        self._frame_lock = threading.Lock()
+        
+        # Brightness layers: LEDs go to PWM while any layer is drawn and back to plain writes after.
+        # Backends without PWM (cluster boards) show LEDs at half brightness or more as lit
+        self._pwm = hasattr(self.pi, "set_PWM_dutycycle")
+        self._pwm_duty = {}  # LED index -> duty cycle last written, for LEDs currently driven by PWM
+        self._gamma = tuple(round(255 * (level / 255) ** LED_GAMMA) for level in range(256))
+        self._m_pwm = _GPIO_CALLS.labels("pwm")
+        self.compositor = Compositor(len(PIN_TABLE), self._write_levels, self._release_levels, self._frame_lock)
+        
         self._setup_pins()
         self._off_all()
     
     def _setup_pins(self):
         """Set up GPIO pins as outputs, handling reserved pins gracefully"""
-        pins = [PIN_1, PIN_2, PIN_3, PIN_4, PIN_5, PIN_6, PIN_7, PIN_8, PIN_9, PIN_10, PIN_11, PIN_12, PIN_13, PIN_14, PIN_15, PIN_16]
-        for pin in pins:
+        for _, pin, _ in PIN_TABLE:
             try:
+                self._m_set_mode.inc()
                 self.pi.set_mode(pin, pigpio.OUTPUT)
+                if self._pwm:
+                    self.pi.set_PWM_frequency(pin, LED_PWM_FREQUENCY)
             except pigpio.error:
-                print(f"[warn] cannot control GPIO {pin} (reserved?)")
+                log.warning("cannot control GPIO %s (reserved?)", pin)
     
     def _set(self, pin, active_low, on: bool):
         """Set a GPIO pin to on/off state considering active low/high configuration"""
         # on=True -> LED emits light
         level = 0 if (on and active_low) else (1 if on else (1 if active_low else 0))
+        self._m_write.inc()
         self.pi.write(pin, level)
     
+    def _write_frame(self, mask):
+        """Light exactly the LEDs whose bits are set in `mask` (bit i = PIN_TABLE[i]), all others off"""
+        with self._frame_lock:
+            if self.compositor.show_frame(mask):
+                return
+            self._write_digital(mask)
+    
+    def _write_digital(self, mask):
+        """Write `mask` with plain level writes; caller holds _frame_lock"""
+        if not self._bank:
+            for i, (_, pin, active_low) in enumerate(PIN_TABLE):
+                self._set(pin, active_low, bool(mask >> i & 1))
+            return
+        lit = 0
+        for i, bit in enumerate(self._pin_bits):
+            if mask >> i & 1:
+                lit |= bit
+        high = (lit ^ self._active_low_bits) & self._all_bits
+        low = self._all_bits & ~high
+        if low:
+            self._m_write_bank.inc()
+            self.pi.clear_bank_1(low)
+        if high:
+            self._m_write_bank.inc()
+            self.pi.set_bank_1(high)
+    
+    def _write_levels(self, levels, changed):
+        """Compositor output: PWM duty for each changed LED; caller holds _frame_lock"""
+        if not self._pwm:
+            self._write_digital(sum(1 << i for i, level in enumerate(levels) if level >= 128))
+            return
+        for i in changed:
+            duty = self._gamma[levels[i]]
+            # Dim levels share duty cycles after gamma; a level change that keeps the duty costs no call
+            if self._pwm_duty.get(i) == duty:
+                continue
+            _, pin, active_low = PIN_TABLE[i]
+            self._m_pwm.inc()
+            self.pi.set_PWM_dutycycle(pin, 255 - duty if active_low else duty)
+            self._pwm_duty[i] = duty
+    
+    def _release_levels(self, levels):
+        """Layers are empty again: plain writes for the LEDs left in PWM (each fully on or off by now)"""
+        for i in sorted(self._pwm_duty):
+            _, pin, active_low = PIN_TABLE[i]
+            self._set(pin, active_low, levels[i] >= 128)
+        self._pwm_duty.clear()
+    
     def _off_all(self):
         """Turn off all LEDs"""
-        self._set(PIN_1, PIN_1_ACTIVE_LOW, False)
-        self._set(PIN_2, PIN_2_ACTIVE_LOW, False)
-        self._set(PIN_3, PIN_3_ACTIVE_LOW, False)
-        self._set(PIN_4, PIN_4_ACTIVE_LOW, False)
-        self._set(PIN_5, PIN_5_ACTIVE_LOW, False)
-        self._set(PIN_6, PIN_6_ACTIVE_LOW, False)
-        self._set(PIN_7, PIN_7_ACTIVE_LOW, False)
-        self._set(PIN_8, PIN_8_ACTIVE_LOW, False)
-        self._set(PIN_9, PIN_9_ACTIVE_LOW, False)
-        self._set(PIN_10, PIN_10_ACTIVE_LOW, False)
-        self._set(PIN_11, PIN_11_ACTIVE_LOW, False)
-        self._set(PIN_12, PIN_12_ACTIVE_LOW, False)
-        self._set(PIN_13, PIN_13_ACTIVE_LOW, False)
-        self._set(PIN_14, PIN_14_ACTIVE_LOW, False)
-        self._set(PIN_15, PIN_15_ACTIVE_LOW, False)
-        self._set(PIN_16, PIN_16_ACTIVE_LOW, False)
+        self._write_frame(0)
     
-    def _apply_states(self, p1, p2, p3, p4, p5, p6, p7, p8, p9, p10, p11, p12, p13, p14, p15, p16):
-        """Apply states to all LEDs at once"""
-        self._set(PIN_1, PIN_1_ACTIVE_LOW, p1)
-        self._set(PIN_2, PIN_2_ACTIVE_LOW, p2)
-        self._set(PIN_3, PIN_3_ACTIVE_LOW, p3)
-        self._set(PIN_4, PIN_4_ACTIVE_LOW, p4)
-        self._set(PIN_5, PIN_5_ACTIVE_LOW, p5)
-        self._set(PIN_6, PIN_6_ACTIVE_LOW, p6)
-        self._set(PIN_7, PIN_7_ACTIVE_LOW, p7)
-        self._set(PIN_8, PIN_8_ACTIVE_LOW, p8)
-        self._set(PIN_9, PIN_9_ACTIVE_LOW, p9)
-        self._set(PIN_10, PIN_10_ACTIVE_LOW, p10)
-        self._set(PIN_11, PIN_11_ACTIVE_LOW, p11)
-        self._set(PIN_12, PIN_12_ACTIVE_LOW, p12)
-        self._set(PIN_13, PIN_13_ACTIVE_LOW, p13)
-        self._set(PIN_14, PIN_14_ACTIVE_LOW, p14)
-        self._set(PIN_15, PIN_15_ACTIVE_LOW, p15)
-        self._set(PIN_16, PIN_16_ACTIVE_LOW, p16)
+    def _apply_states(self, *states):
+        """Apply states to all LEDs at once, one bool per LED in PIN_TABLE order"""
+        self._m_frames.inc()
+        mask = 0
+        for i, on in enumerate(states):
+            if on:
+                mask |= 1 << i
+        self._write_frame(mask)
     
     def wave_once(self, step_period=DEFAULT_STEP_PERIOD):
         """Execute a single left-to-right wave animation"""
@@ -152,12 +305,8 @@ class GPIOController:
         self._off_all()
     
     def strobe_error(self, blinks=ERROR_BLINKS, on_ms=ERROR_ON_MS, off_ms=ERROR_OFF_MS):
-        """Flash red LED to indicate error"""
-        for _ in range(blinks):
-            self._set(PIN_1, PIN_1_ACTIVE_LOW, True)
-            time.sleep(on_ms/1000.0)
-            self._set(PIN_1, PIN_1_ACTIVE_LOW, False)
-            time.sleep(off_ms/1000.0)
+        """Flash red LED to indicate error, on the top layer; returns at once and the compositor times the blinks"""
+        self.flash(LED_LAYERS[-1], {PIN_NAMES[0]: 255}, on_ms, off_ms, blinks)
     
     def chaser(self, step_period=0.5):
         """Continuous chaser animation"""
@@ -191,74 +340,108 @@ class GPIOController:
             if self.anim_thread and self.anim_thread.is_alive():
                 return False
             self.anim_stop.clear()
-            self.anim_thread = threading.Thread(target=self.chaser, args=(step_period,), daemon=True)
+            self.anim_thread = threading.Thread(target=self.chaser, args=(step_period,), name="anim-chaser", daemon=True)
             self.anim_thread.start()
             return True
     
+    def _halt_anim(self):
+        """Stop the animation thread, if any; caller holds anim_lock"""
+        self.anim_stop.set()
+        if self.anim_thread and self.anim_thread.is_alive():
+            self.anim_thread.join(timeout=0.5)
+        self.anim_thread = None
+    
     def stop_anim(self):
         """Stop any running animation"""
         with self.anim_lock:
-            self.anim_stop.set()
-            if self.anim_thread and self.anim_thread.is_alive():
-                self.anim_thread.join(timeout=0.5)
-            self.anim_thread = None
+            self._halt_anim()
             self._off_all()
     
+    def _set_frame(self, mask):
+        """Stop any animation and show `mask` (bit i = PIN_TABLE[i]) as a single frame"""
+        with self.anim_lock:
+            self._halt_anim()
+            self._write_frame(mask)
+    
+    def set_pins(self, names):
+        """Light exactly the named pins, all others off, in one frame; False (nothing changed) for an unknown name"""
+        mask = 0
+        for name in names:
+            index = self._pin_index.get(name)
+            if index is None:
+                return False
+            mask |= 1 << index
+        self._set_frame(mask)
+        return True
+    
     def turn_on_pin(self, pin_name):
         """Turn on a specific pin by name"""
-        pin_map = {
-            '17': (PIN_1, PIN_1_ACTIVE_LOW),
-            '27': (PIN_2, PIN_2_ACTIVE_LOW),
-            '22': (PIN_3, PIN_3_ACTIVE_LOW),
-            '10': (PIN_4, PIN_4_ACTIVE_LOW),
-            '9': (PIN_5, PIN_5_ACTIVE_LOW),
-            '5': (PIN_6, PIN_6_ACTIVE_LOW),
-            '6': (PIN_7, PIN_7_ACTIVE_LOW),
-            '26': (PIN_8, PIN_8_ACTIVE_LOW),
-            '16': (PIN_9, PIN_9_ACTIVE_LOW),
-            '14': (PIN_10, PIN_10_ACTIVE_LOW),
-            '18': (PIN_11, PIN_11_ACTIVE_LOW),
-            '23': (PIN_12, PIN_12_ACTIVE_LOW),
-            '24': (PIN_13, PIN_13_ACTIVE_LOW),
-            '25': (PIN_14, PIN_14_ACTIVE_LOW),
-            '20': (PIN_15, PIN_15_ACTIVE_LOW),
-            '21': (PIN_16, PIN_16_ACTIVE_LOW),
-        }
-        
-        if pin_name in pin_map:
-            pin, active_low = pin_map[pin_name]
-            self.stop_anim()
-            self._off_all()
-            self._set(pin, active_low, True)
-            return True
-        return False
+        return self.set_pins((pin_name,))
+    
+    def _layer_levels(self, layer, levels):
+        """{pin name: level} as {LED index: level}; None for an unknown layer or pin, or a level outside 0-255"""
+        if layer not in self.compositor.layer_names:
+            return None
+        indexed = {}
+        for name, level in levels.items():
+            index = self._pin_index.get(name)
+            if index is None or not 0 <= level <= 255:
+                return None
+            indexed[index] = level
+        return indexed
+    
+    def set_brightness(self, layer, levels, fade=0.0):
+        """Draw {pin name: level 0-255} on a layer, fading over `fade` seconds; False for an unknown layer or pin"""
+        indexed = self._layer_levels(layer, levels)
+        if indexed is None:
+            return False
+        self.compositor.set(layer, indexed, max(0.0, fade))
+        return True
+    
+    def clear_layer(self, layer, names=None, fade=0.0):
+        """Fade the named pins (all by default) out of a layer; False for an unknown layer or pin"""
+        indexed = self._layer_levels(layer, dict.fromkeys(PIN_NAMES if names is None else names, 0))
+        if indexed is None:
+            return False
+        self.compositor.clear(layer, indexed, max(0.0, fade))
+        return True
+    
+    def flash(self, layer, levels, on_ms=ERROR_ON_MS, off_ms=ERROR_OFF_MS, count=ERROR_BLINKS):
+        """Blink {pin name: level} on a layer `count` times; False for an unknown layer or pin"""
+        indexed = self._layer_levels(layer, levels)
+        if indexed is None or on_ms <= 0 or off_ms < 0 or count < 1:
+            return False
+        self.compositor.flash(layer, indexed, on_ms / 1000.0, off_ms / 1000.0, count)
+        return True
+    
+    def layers(self):
+        """{layer: {pin name: {"level", "alpha"}}} for every layer but the pin frame"""
+        return {layer: {PIN_NAMES[i]: cell for i, cell in cells.items()}
+                for layer, cells in self.compositor.snapshot().items()}
     
     def get_status(self):
-        """Get current status of all pins"""
-        return {
-            "pins": {
-                "17": self.pi.read(PIN_1),
-                "27": self.pi.read(PIN_2),
-                "22": self.pi.read(PIN_3),
-                "10": self.pi.read(PIN_4),
-                "9": self.pi.read(PIN_5),
-                "5": self.pi.read(PIN_6),
-                "6": self.pi.read(PIN_7),
-                "26": self.pi.read(PIN_8),
-                "16": self.pi.read(PIN_9),
-                "14": self.pi.read(PIN_10),
-                "18": self.pi.read(PIN_11),
-                "23": self.pi.read(PIN_12),
-                "24": self.pi.read(PIN_13),
-                "25": self.pi.read(PIN_14),
-                "20": self.pi.read(PIN_15),
-                "21": self.pi.read(PIN_16),
-            }
-        }
+        """Get current status of all pins, with each LED's brightness (0-255)"""
+        if self.compositor.engaged:
+            # PWM pins read back whatever part of the cycle they are in; report what was composited
+            levels = self.compositor.levels
+            return {"pins": {name: int(levels[i] > 0) for i, name in enumerate(PIN_NAMES)},
+                    "brightness": dict(zip(PIN_NAMES, levels))}
+        if self._bank:
+            self._m_read_bank.inc()
+            levels = self.pi.read_bank_1()
+            pins = {name: levels >> pin & 1 for name, pin, _ in PIN_TABLE}
+        else:
+            self._m_read.inc(len(PIN_TABLE))
+            pins = {name: self.pi.read(pin) for name, pin, _ in PIN_TABLE}
+        return {"pins": pins, "brightness": {name: 255 if on else 0 for name, on in pins.items()}}
     
     def cleanup(self):
         """Clean up GPIO resources"""
+        self.compositor.close()
         self.stop_anim()
         self._off_all()
         if self.pi.connected:
             self.pi.stop()
+        if self._owner_fd is not None:
+            os.close(self._owner_fd)
+            self._owner_fd = None
@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+GPIO daemon for Raspberry Pi LED Server
+Sole owner of the pins and of long-running operations (animations, UDP flood); web worker
+processes drive it over a Unix socket with a compact binary protocol (see gpio_client.py)
+
+    python gpio_daemon.py            # normally started by app.py when SERVER_WORKERS > 1
+"""
+
+import json
+import logging
+import os
+import signal
+import socketserver
+import struct
+import sys
+import threading
+from config import *
+from event_bus import EVENTS
+from metrics import METRICS
+
+log = logging.getLogger(__name__)
+
+# Frames are a 4-byte header and an optional payload.
+# Request:  op (B), arg (B), payload length (I)
+# Response: status (B), value (B), payload length (I); status 0 is success, 1 an error message
+HEADER = struct.Struct("!BBI")
+STATUS_OK = 0
+STATUS_ERROR = 1
+
+OP_STATUS = 1       # -> payload !H bitmask of pin levels, bit i = PIN_NAMES[i], then one brightness byte
+                    #    per pin; value 1 and the reason after those while the pins are not ready (degraded)
+OP_SET_PINS = 2     # payload !H bitmask of LEDs to light, all others off; stops any animation;
+                    #    -> value 1 if refused because the pins are not ready
+OP_ALL_OFF = 3
+OP_APPLY = 4        # payload !H bitmask of LEDs to light
+OP_STOP_ANIM = 5
+OP_WAVE = 6         # payload !f step period
+OP_ROUNDTRIP = 7    # payload !f step period
+OP_CHASER = 8       # payload !f step period; -> value 1 if started
+OP_STROBE = 9       # payload !BHH blinks, on ms, off ms
+OP_CALL = 10        # payload JSON [method, args]; -> JSON result (flood operations, the journal, config documents)
+OP_SUBSCRIBE = 11   # the connection turns into a stream of JSON [event, data] frames
+OP_LAYER_SET = 12   # arg layer (index in LED_LAYERS); payload !fH fade seconds, mask, then one level byte per
+                    #    LED in the mask; -> value 1 if refused
+OP_LAYER_CLEAR = 13 # arg layer; payload !fH fade seconds, mask of LEDs to clear; -> value 1 if refused
+OP_LAYER_FLASH = 14 # arg layer; payload !HHBH on ms, off ms, count, mask, then levels as OP_LAYER_SET
+OP_LAYERS = 15      # -> JSON {layer: {pin: {"level", "alpha"}}}
+
+PERIOD = struct.Struct("!f")
+MASK = struct.Struct("!H")
+STROBE = struct.Struct("!BHH")
+FADE = struct.Struct("!fH")
+FLASH = struct.Struct("!HHBH")
+
+
+def pack_levels(levels):
+    """{pin name: level} as (mask, level bytes in LED order)"""
+    mask, data = 0, bytearray()
+    for i, name in enumerate(PIN_NAMES):
+        if name in levels:
+            mask |= 1 << i
+            data.append(levels[name])
+    return mask, bytes(data)
+
+
+def unpack_levels(mask, data):
+    names = [name for i, name in enumerate(PIN_NAMES) if mask >> i & 1]
+    return dict(zip(names, data))
+
+# Executor methods web workers may call through OP_CALL
+REMOTE_METHODS = {"start_udp_flood", "stop_udp_flood", "get_flood_status", "record_operation", "query_history",
+                  "record_send_timing", "get_send_latency", "list_scenarios", "start_scenario", "stop_scenario",
+                  "get_scenario_status", "get_probe_status"}
+# ConfigStore methods web workers may call through OP_CALL: one store, so a save is seen by every worker at once
+STORE_METHODS = {"get_document", "update_document"}
+
+_REQUESTS = METRICS.counter("gpio_daemon_requests_total", "Requests handled by the GPIO daemon", ("op",))
+
+
+def read_exact(sock, n):
+    """Read exactly n bytes, or raise ConnectionError if the peer closes first"""
+    buf = bytearray()
+    while len(buf) < n:
+        chunk = sock.recv(n - len(buf))
+        if not chunk:
+            raise ConnectionError("GPIO socket closed")
+        buf += chunk
+    return bytes(buf)
+
+
+def send_frame(sock, first, second, payload=b""):
+    sock.sendall(HEADER.pack(first, second, len(payload)) + payload)
+
+
+def read_frame(sock):
+    """Returns (first, second, payload)"""
+    first, second, length = HEADER.unpack(read_exact(sock, HEADER.size))
+    return first, second, read_exact(sock, length) if length else b""
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        daemon = self.server.daemon
+        sock = self.request
+        while True:
+            try:
+                op, arg, payload = read_frame(sock)
+            except ConnectionError:
+                return
+            if op == OP_SUBSCRIBE:
+                daemon.stream_events(sock)
+                return
+            try:
+                value, body = daemon.dispatch(op, arg, payload)
+                send_frame(sock, STATUS_OK, value, body)
+            except ConnectionError:
+                return
+            except Exception as e:
+                log.error("GPIO daemon op %d failed: %s", op, e)
+                send_frame(sock, STATUS_ERROR, 0, str(e).encode("utf-8")[:65535])
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    # Every web worker thread holds a connection; a Unix socket refuses connects (EAGAIN) past the backlog
+    request_queue_size = 128
+
+
+class GPIODaemon:
+    def __init__(self, gpio, cmd, socket_path=GPIO_DAEMON_SOCKET, store=None):
+        """Initialize daemon around an owned GPIOController, CommandExecutor and ConfigStore"""
+        self.gpio = gpio
+        self.cmd = cmd
+        self.store = store
+        self.socket_path = socket_path
+        self.server = None
+        self._m_ops = {}
+
+    def dispatch(self, op, arg, payload):
+        """Run one request; returns (value byte, response payload)"""
+        counter = self._m_ops.get(op)
+        if counter is None:
+            counter = self._m_ops[op] = _REQUESTS.labels(op)
+        counter.inc()
+        gpio = self.gpio
+        if op == OP_STATUS:
+            status = gpio.get_status()
+            pins = status["pins"]
+            mask = 0
+            for i, name in enumerate(PIN_NAMES):
+                if pins[name]:
+                    mask |= 1 << i
+            body = MASK.pack(mask) + bytes(status["brightness"][name] for name in PIN_NAMES)
+            if "degraded" in status:
+                return 1, body + str(status["degraded"]).encode("utf-8")
+            return 0, body
+        if op == OP_SET_PINS:
+            if gpio._set_frame(MASK.unpack(payload)[0]) is False:
+                return 1, b""
+        elif op == OP_ALL_OFF:
+            gpio._off_all()
+        elif op == OP_APPLY:
+            mask = MASK.unpack(payload)[0]
+            gpio._apply_states(*(bool(mask >> i & 1) for i in range(len(PIN_NAMES))))
+        elif op == OP_STOP_ANIM:
+            gpio.stop_anim()
+        elif op == OP_WAVE:
+            gpio.wave_once(PERIOD.unpack(payload)[0])
+        elif op == OP_ROUNDTRIP:
+            gpio.roundtrip_wave(PERIOD.unpack(payload)[0])
+        elif op == OP_CHASER:
+            return int(gpio.start_chaser(PERIOD.unpack(payload)[0])), b""
+        elif op == OP_STROBE:
+            gpio.strobe_error(*STROBE.unpack(payload))
+        elif op == OP_LAYER_SET:
+            fade, mask = FADE.unpack(payload[:FADE.size])
+            return int(not gpio.set_brightness(LED_LAYERS[arg], unpack_levels(mask, payload[FADE.size:]), fade)), b""
+        elif op == OP_LAYER_CLEAR:
+            fade, mask = FADE.unpack(payload)
+            names = [name for i, name in enumerate(PIN_NAMES) if mask >> i & 1]
+            return int(not gpio.clear_layer(LED_LAYERS[arg], names, fade)), b""
+        elif op == OP_LAYER_FLASH:
+            on_ms, off_ms, count, mask = FLASH.unpack(payload[:FLASH.size])
+            levels = unpack_levels(mask, payload[FLASH.size:])
+            return int(not gpio.flash(LED_LAYERS[arg], levels, on_ms, off_ms, count)), b""
+        elif op == OP_LAYERS:
+            return 0, json.dumps(gpio.layers()).encode("utf-8")
+        elif op == OP_CALL:
+            method, args = json.loads(payload)
+            if method in REMOTE_METHODS:
+                target = self.cmd
+            elif method in STORE_METHODS and self.store is not None:
+                target = self.store
+            else:
+                raise ValueError(f"method {method!r} is not callable remotely")
+            return 0, json.dumps(getattr(target, method)(*args)).encode("utf-8")
+        else:
+            raise ValueError(f"unknown op {op}")
+        return 0, b""
+
+    def stream_events(self, sock):
+        """Forward this process's events to a subscribed worker until it disconnects"""
+        q = EVENTS.subscribe()
+        try:
+            while True:
+                event, data = q.get()
+                send_frame(sock, STATUS_OK, 0, json.dumps([event, data]).encode("utf-8"))
+        except OSError:
+            pass
+        finally:
+            EVENTS.unsubscribe(q)
+
+    def start(self):
+        """Bind the socket and serve on a background thread"""
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        # Created owner and group only from the start; a chmod after bind leaves a window in a shared /tmp
+        umask = os.umask(0o117)
+        try:
+            self.server = _Server(self.socket_path, _Handler)
+        finally:
+            os.umask(umask)
+        self.server.daemon = self
+        threading.Thread(target=self.server.serve_forever, name="gpio-daemon", daemon=True).start()
+        log.info("GPIO daemon listening on %s", self.socket_path)
+        return self
+
+    def close(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+        try:
+            os.unlink(self.socket_path)
+        except FileNotFoundError:
+            pass
+
+
+def main():
+    from logging_setup import setup_logging, shutdown_logging
+    from command_executor import CommandExecutor
+    from config_store import ConfigStore
+    from journal import open_journal
+    from probes import start_probes
+    from startup import start_controller
+
+    setup_logging()
+    gpio = start_controller()
+    journal = open_journal()
+    probes = start_probes()
+    store = ConfigStore(os.path.dirname(os.path.abspath(__file__)))
+    daemon = GPIODaemon(gpio, CommandExecutor(gpio, journal, probes), store=store).start()
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+    signal.signal(signal.SIGINT, lambda signum, frame: stop.set())
+    try:
+        stop.wait()
+    finally:
+        daemon.close()
+        if getattr(daemon.cmd, "flood_active", False):
+            daemon.cmd.stop_udp_flood()
+        gpio.cleanup()
+        store.close()
+        if probes is not None:
+            probes.close()
+        if journal is not None:
+            journal.close()
+        log.info("GPIO daemon stopped")
+        shutdown_logging()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Image catalog for Raspberry Pi LED Server
+In-memory index of static/images (size, mtime, hash, MIME type, dimensions) kept current by the
+upload/delete routes and an inotify watcher, with a polling fallback where inotify is unavailable
+"""
+
+import ctypes
+import ctypes.util
+import hashlib
+import logging
+import mimetypes
+import os
+import re
+import select
+import struct
+import threading
+from config import *
+from metrics import METRICS
+
+log = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.svg', '.webp')
+
+_CATALOG_SIZE = METRICS.gauge("image_catalog_entries", "Images indexed in the image catalog")
+_CATALOG_EVENTS = METRICS.counter("image_catalog_updates_total", "Image catalog updates", ("source",))
+
+# inotify(7) constants
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_DELETE = 0x00000200
+_IN_DELETE_SELF = 0x00000400
+_IN_Q_OVERFLOW = 0x00004000
+_IN_IGNORED = 0x00008000
+_IN_CLOEXEC = 0o2000000
+_EVENT_HEADER = struct.Struct("iIII")
+
+_SVG_SIZE = re.compile(rb'<svg[^>]*?\swidth="([\d.]+)(?:px)?"[^>]*?\sheight="([\d.]+)(?:px)?"', re.S)
+_SVG_VIEWBOX = re.compile(rb'<svg[^>]*?\sviewBox="[\d.\-]+[ ,]+[\d.\-]+[ ,]+([\d.]+)[ ,]+([\d.]+)"', re.S)
+
+
+def image_dimensions(data):
+    """(width, height) from the image header, or (None, None) if the format is not recognised"""
+    if data[:8] == b"\x89PNG\r\n\x1a\n" and len(data) >= 24:
+        return struct.unpack(">II", data[16:24])
+    if data[:6] in (b"GIF87a", b"GIF89a") and len(data) >= 10:
+        return struct.unpack("<HH", data[6:10])
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP" and len(data) >= 30:
+        chunk = data[12:16]
+        if chunk == b"VP8 ":
+            w, h = struct.unpack("<HH", data[26:30])
+            return w & 0x3FFF, h & 0x3FFF
+        if chunk == b"VP8L":
+            bits = int.from_bytes(data[21:25], "little")
+            return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+        if chunk == b"VP8X":
+            return int.from_bytes(data[24:27], "little") + 1, int.from_bytes(data[27:30], "little") + 1
+    if data[:2] == b"\xff\xd8":
+        i = 2
+        while i + 9 < len(data):
+            if data[i] != 0xFF:
+                i += 1
+                continue
+            marker = data[i + 1]
+            if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7 or marker == 0xFF:
+                i += 1 if marker == 0xFF else 2
+                continue
+            length = struct.unpack(">H", data[i + 2:i + 4])[0]
+            # Start-of-frame markers carry the dimensions; C4/C8/CC are tables, not frames
+            if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+                h, w = struct.unpack(">HH", data[i + 5:i + 9])
+                return w, h
+            i += 2 + length
+        return None, None
+    head = data[:2048]
+    if b"<svg" in head:
+        match = _SVG_SIZE.search(head)
+        if match is None:
+            match = _SVG_VIEWBOX.search(head)
+        if match:
+            return round(float(match.group(1))), round(float(match.group(2)))
+    return None, None
+
+
+class ImageEntry:
+    __slots__ = ("filename", "size", "mtime", "sha256", "mimetype", "width", "height")
+
+    def __init__(self, filename, size, mtime, sha256, mimetype, width, height):
+        self.filename = filename
+        self.size = size
+        self.mtime = mtime
+        self.sha256 = sha256
+        self.mimetype = mimetype
+        self.width = width
+        self.height = height
+
+    @property
+    def etag(self):
+        return self.sha256[:32]
+
+    def to_dict(self):
+        return {
+            'filename': self.filename,
+            'url': f'/static/images/{self.filename}',
+            'size': self.size,
+            'mtime': self.mtime,
+            'mimetype': self.mimetype,
+            'width': self.width,
+            'height': self.height,
+        }
+
+
+class ImageCatalog:
+    def __init__(self, images_dir, poll_interval=IMAGE_POLL_INTERVAL):
+        """Initialize catalog; call start() to index the directory and begin watching it"""
+        self.images_dir = images_dir
+        self.poll_interval = poll_interval
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._watcher = None
+        self.watch_mode = None
+
+    def _is_image(self, filename):
+        return filename.lower().endswith(IMAGE_EXTENSIONS) and "/" not in filename and not filename.startswith(".")
+
+    def refresh(self, filename, source="route"):
+        """Re-index one file from disk; returns its entry, or None if it is gone"""
+        if not self._is_image(filename):
+            return None
+        path = os.path.join(self.images_dir, filename)
+        try:
+            with open(path, "rb") as f:
+                st = os.fstat(f.fileno())
+                data = f.read()
+        except (FileNotFoundError, IsADirectoryError):
+            self.remove(filename, source)
+            return None
+        width, height = image_dimensions(data)
+        entry = ImageEntry(filename, st.st_size, st.st_mtime, hashlib.sha256(data).hexdigest(),
+                           mimetypes.guess_type(filename)[0] or "application/octet-stream", width, height)
+        with self._lock:
+            self._entries[filename] = entry
+            _CATALOG_SIZE.set(len(self._entries))
+        _CATALOG_EVENTS.labels(source).inc()
+        return entry
+
+    def remove(self, filename, source="route"):
+        with self._lock:
+            removed = self._entries.pop(filename, None)
+            _CATALOG_SIZE.set(len(self._entries))
+        if removed is not None:
+            _CATALOG_EVENTS.labels(source).inc()
+
+    def scan(self, source="scan"):
+        """Reconcile the catalog with the directory; unchanged files (same size and mtime) are not re-read"""
+        try:
+            names = {n for n in os.listdir(self.images_dir) if self._is_image(n)}
+        except FileNotFoundError:
+            names = set()
+        with self._lock:
+            known = dict(self._entries)
+        for name in set(known) - names:
+            self.remove(name, source)
+        for name in names:
+            entry = known.get(name)
+            if entry is not None:
+                try:
+                    st = os.stat(os.path.join(self.images_dir, name))
+                except FileNotFoundError:
+                    self.remove(name, source)
+                    continue
+                if st.st_size == entry.size and st.st_mtime == entry.mtime:
+                    continue
+            self.refresh(name, source)
+
+    def get(self, filename):
+        """Entry for an image, or None; consults the disk only when no watcher keeps the catalog current"""
+        entry = self._entries.get(filename)
+        if entry is None and self.watch_mode != "inotify":
+            entry = self.refresh(filename, "miss")
+        return entry
+
+    def path(self, entry):
+        return os.path.join(self.images_dir, entry.filename)
+
+    def entries(self):
+        """All entries, sorted by filename"""
+        with self._lock:
+            return sorted(self._entries.values(), key=lambda e: e.filename)
+
+    def start(self):
+        """Index the directory and start the watcher thread"""
+        os.makedirs(self.images_dir, exist_ok=True)
+        fd = self._inotify_open()
+        self.watch_mode = "inotify" if fd is not None else "poll"
+        # Scan after the watch is in place so nothing created in between is missed
+        self.scan()
+        target = self._inotify_loop if fd is not None else self._poll_loop
+        self._watcher = threading.Thread(target=target, args=(fd,), name="image-watcher", daemon=True)
+        self._watcher.start()
+        log.info("Image catalog: %d images, watching via %s", len(self._entries), self.watch_mode)
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _inotify_open(self):
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+            fd = libc.inotify_init1(_IN_CLOEXEC)
+            if fd < 0:
+                return None
+            mask = _IN_CLOSE_WRITE | _IN_MOVED_TO | _IN_MOVED_FROM | _IN_DELETE | _IN_DELETE_SELF
+            if libc.inotify_add_watch(fd, os.fsencode(self.images_dir), mask) < 0:
+                os.close(fd)
+                return None
+            return fd
+        except (OSError, AttributeError):
+            return None
+
+    def _inotify_loop(self, fd):
+        try:
+            while not self._stop.is_set():
+                readable, _, _ = select.select([fd], [], [], 1.0)
+                if not readable:
+                    continue
+                data = os.read(fd, 65536)
+                offset = 0
+                while offset < len(data):
+                    _, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+                    name = data[offset + 16:offset + 16 + length].rstrip(b"\0").decode("utf-8", "replace")
+                    offset += 16 + length
+                    if mask & _IN_Q_OVERFLOW:
+                        self.scan("inotify")
+                    elif mask & (_IN_DELETE_SELF | _IN_IGNORED):
+                        log.warning("Image directory watch lost; falling back to polling")
+                        self.watch_mode = "poll"
+                        self._poll_loop(None)
+                        return
+                    elif mask & (_IN_CLOSE_WRITE | _IN_MOVED_TO):
+                        self.refresh(name, "inotify")
+                    elif mask & (_IN_DELETE | _IN_MOVED_FROM):
+                        self.remove(name, "inotify")
+        except OSError as e:
+            log.error("Image watcher failed: %s", e)
+        finally:
+            os.close(fd)
+
+    def _poll_loop(self, _fd):
+        # scan() only stats files whose entry exists, so a pass over a few dozen images is cheap
+        while not self._stop.wait(self.poll_interval):
+            self.scan("poll")
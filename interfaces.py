@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Network interface inventory for Raspberry Pi LED Server
+Interfaces, their MAC addresses and the default route's interface, collected on a background
+thread at startup; netifaces is imported there rather than when the server loads
+"""
+
+import logging
+import threading
+from startup import READINESS
+
+log = logging.getLogger(__name__)
+
+# Interface name prefixes tried, in order, when there is no default route
+_PHYSICAL_PREFIXES = ("eth", "wlan", "en", "wl")
+
+
+class InterfaceInventory:
+    def __init__(self, readiness=READINESS):
+        """Initialize an empty inventory; call start() to collect it"""
+        self.default = None  # interface of the IPv4 default route
+        self.macs = {}  # interface name -> MAC address (upper case)
+        self.error = "starting"
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+        readiness.add("interfaces", self.ready_state)
+
+    def start(self):
+        threading.Thread(target=self.refresh, name="interface-inventory", daemon=True).start()
+        return self
+
+    def ready_state(self):
+        return self._ready.is_set() and self.error is None, self.error
+
+    def refresh(self):
+        """Rescan the interfaces; returns True on success"""
+        with self._lock:
+            try:
+                import netifaces
+            except ImportError:
+                self.error = "netifaces not installed"
+                self._ready.set()
+                return False
+            try:
+                macs = {}
+                for name in netifaces.interfaces():
+                    link = netifaces.ifaddresses(name).get(netifaces.AF_LINK)
+                    if link and link[0].get("addr"):
+                        macs[name] = link[0]["addr"].upper()
+                default = netifaces.gateways().get("default", {}).get(netifaces.AF_INET)
+                self.macs = macs
+                self.default = default[1] if default else None
+                self.error = None
+            except Exception as e:
+                self.error = f"Interface scan failed: {e}"
+                log.warning("%s", self.error)
+            self._ready.set()
+            return self.error is None
+
+    def source_mac(self, timeout=5.0):
+        """MAC of the default route's interface, else of the first physical one; (mac, error)"""
+        if not self._ready.wait(timeout):
+            return None, "Interface inventory not ready"
+        mac = self.macs.get(self.default)
+        if mac is None:
+            # The route may have come up since the last scan (DHCP after boot)
+            self.refresh()
+            mac = self.macs.get(self.default)
+        if mac is not None:
+            return mac, None
+        for name, mac in self.macs.items():
+            if name.startswith(_PHYSICAL_PREFIXES) and mac != "00:00:00:00:00:00":
+                return mac, None
+        return None, self.error or "No valid network interface found"
@@ -0,0 +1,362 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Operation journal for Raspberry Pi LED Server
+Append-only JSON-lines record of executor operations (SNMP sets, port flaps, crafted packets, floods),
+written off the request thread into size-rotated segments. Each segment carries a small index
+(time range, types, targets, sparse time-to-offset checkpoints) so history queries read only the
+segments, and the part of a segment, that can match
+"""
+
+import bisect
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from config import *
+from metrics import METRICS
+
+log = logging.getLogger(__name__)
+
+_ENTRIES = METRICS.counter("journal_entries_total", "Operations appended to the journal", ("type",))
+_DROPPED = METRICS.counter("journal_entries_dropped_total", "Operations lost because the journal queue was full")
+_SEGMENTS = METRICS.gauge("journal_segments", "Journal segment files on disk")
+_QUERY_SECONDS = METRICS.histogram("journal_query_seconds", "History query time")
+_SEGMENTS_READ = METRICS.counter("journal_segments_read_total", "Segments read by history queries")
+
+SEGMENT_PREFIX = "journal-"
+SEGMENT_SUFFIX = ".jsonl"
+INDEX_SUFFIX = ".idx"
+CHECKPOINT_EVERY = 256  # entries between time-to-offset checkpoints
+MAX_INDEXED_TARGETS = 64  # distinct targets a segment indexes before it stops ruling any out
+
+_STOP = object()
+
+
+def _dumps(data):
+    return json.dumps(data, separators=(",", ":"))
+
+
+class Segment:
+    """One journal file and its index"""
+
+    def __init__(self, path, first_seq):
+        self.path = path
+        self.first_seq = first_seq
+        self.size = 0
+        self.count = 0
+        self.min_ts = None
+        self.max_ts = None
+        self.types = {}
+        self.targets = set()
+        # (latest ts of every entry before offset, offset), every CHECKPOINT_EVERY entries
+        self.checkpoints = []
+
+    def add(self, entry, length):
+        if self.count % CHECKPOINT_EVERY == 0 and self.count:
+            self.checkpoints.append((self.max_ts, self.size))
+        ts = entry["ts"]
+        self.min_ts = ts if self.min_ts is None else min(self.min_ts, ts)
+        self.max_ts = ts if self.max_ts is None else max(self.max_ts, ts)
+        self.types[entry["type"]] = self.types.get(entry["type"], 0) + 1
+        if self.targets is not None:
+            self.targets.add(entry.get("target"))
+            if len(self.targets) > MAX_INDEXED_TARGETS:
+                self.targets = None
+        self.size += length
+        self.count += 1
+
+    def may_match(self, since, until, type, target):
+        if not self.count:
+            return False
+        if since is not None and self.max_ts < since:
+            return False
+        if until is not None and self.min_ts > until:
+            return False
+        if type is not None and type not in self.types:
+            return False
+        if target is not None and self.targets is not None and target not in self.targets:
+            return False
+        return True
+
+    def start_offset(self, since):
+        """Byte offset before which every entry is older than `since`"""
+        if since is None or not self.checkpoints:
+            return 0
+        i = bisect.bisect_left([ts for ts, _ in self.checkpoints], since)
+        return self.checkpoints[i - 1][1] if i else 0
+
+    def to_doc(self):
+        return {
+            "first_seq": self.first_seq, "size": self.size, "count": self.count,
+            "min_ts": self.min_ts, "max_ts": self.max_ts,
+            "types": self.types, "targets": sorted(self.targets, key=str) if self.targets is not None else None,
+            "checkpoints": self.checkpoints,
+        }
+
+    @classmethod
+    def from_doc(cls, path, doc):
+        seg = cls(path, doc["first_seq"])
+        seg.size, seg.count = doc["size"], doc["count"]
+        seg.min_ts, seg.max_ts = doc["min_ts"], doc["max_ts"]
+        seg.types = doc["types"]
+        seg.targets = set(doc["targets"]) if doc["targets"] is not None else None
+        seg.checkpoints = [tuple(c) for c in doc["checkpoints"]]
+        return seg
+
+
+class Journal:
+    def __init__(self, directory, segment_bytes=JOURNAL_SEGMENT_BYTES, max_bytes=JOURNAL_MAX_BYTES,
+                 queue_size=JOURNAL_QUEUE_SIZE):
+        """Initialize journal in `directory`; call start() to load existing segments and run the writer"""
+        if not os.path.isabs(directory):
+            directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), directory)
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self._queue = queue.Queue(queue_size)
+        self._lock = threading.Lock()
+        self._segments = []
+        self._file = None
+        self._next_seq = 1
+        self._writer = None
+        self._m_dropped = _DROPPED.labels()
+        self._m_segments = _SEGMENTS.labels()
+        self._m_read = _SEGMENTS_READ.labels()
+        self._m_query = _QUERY_SECONDS.labels()
+        self._m_types = {}
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        names = sorted(n for n in os.listdir(self.directory)
+                       if n.startswith(SEGMENT_PREFIX) and n.endswith(SEGMENT_SUFFIX))
+        for i, name in enumerate(names):
+            path = os.path.join(self.directory, name)
+            seg = None if i == len(names) - 1 else self._load_index(path)
+            self._segments.append(seg or self._scan_segment(path))
+        if self._segments:
+            last = self._segments[-1]
+            self._next_seq = last.first_seq + last.count
+        self._m_segments.set(len(self._segments))
+        self._writer = threading.Thread(target=self._run, name="journal-writer", daemon=True)
+        self._writer.start()
+        log.info("Journal %s: %d segments, next entry %d", self.directory, len(self._segments), self._next_seq)
+        return self
+
+    @staticmethod
+    def _first_seq(path):
+        return int(os.path.basename(path)[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)])
+
+    def _load_index(self, path):
+        """Sealed segment's saved index, if it still describes the file"""
+        try:
+            with open(path + INDEX_SUFFIX) as f:
+                doc = json.load(f)
+            if doc["size"] == os.path.getsize(path):
+                return Segment.from_doc(path, doc)
+        except (OSError, ValueError, KeyError):
+            pass
+        return None
+
+    def _scan_segment(self, path):
+        """Rebuild a segment's index from its lines; a torn last line (power cut) is cut off"""
+        seg = Segment(path, self._first_seq(path))
+        with open(path, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    seg.add(json.loads(line), len(line))
+                except ValueError:
+                    break
+        if seg.size != os.path.getsize(path):
+            log.warning("Journal segment %s: dropping %d torn bytes", path, os.path.getsize(path) - seg.size)
+            os.truncate(path, seg.size)
+        return seg
+
+    def append(self, type, target=None, ok=None, params=None, result=None, ts=None):
+        """Queue an entry; never blocks the caller (entries are dropped if the writer falls far behind)"""
+        entry = {"ts": round(time.time() if ts is None else ts, 3), "type": type, "target": target, "ok": ok}
+        if params:
+            entry["params"] = params
+        if result:
+            entry["result"] = result
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            self._m_dropped.inc()
+
+    def flush(self, timeout=2.0):
+        """Wait until everything appended so far is on disk (written, not fsynced)"""
+        if self._writer is None or not self._writer.is_alive():
+            return False
+        done = threading.Event()
+        try:
+            self._queue.put(done, timeout=timeout)
+        except queue.Full:
+            return False
+        return done.wait(timeout)
+
+    def close(self):
+        if self._writer is not None and self._writer.is_alive():
+            self._queue.put(_STOP)
+            self._writer.join(5.0)
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+                self._save_index(self._segments[-1])
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            try:
+                while len(batch) < 1024:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+            entries = [item for item in batch if isinstance(item, dict)]
+            try:
+                if entries:
+                    self._write(entries)
+            except OSError as e:
+                log.error("Journal write failed, %d entries lost: %s", len(entries), e)
+            for item in batch:
+                if isinstance(item, threading.Event):
+                    item.set()
+            if any(item is _STOP for item in batch):
+                return
+
+    def _write(self, entries):
+        if self._file is None:
+            self._open_segment(reuse=True)
+        pending, pending_bytes = [], 0
+        for entry in entries:
+            entry["seq"] = self._next_seq
+            line = (_dumps(entry) + "\n").encode("utf-8")
+            seg = self._segments[-1]
+            if (seg.count or pending) and seg.size + pending_bytes + len(line) > self.segment_bytes:
+                self._commit(pending)
+                pending, pending_bytes = [], 0
+                self._seal()
+                self._open_segment(reuse=False)
+            self._file.write(line)
+            pending.append((entry, len(line)))
+            pending_bytes += len(line)
+            self._next_seq += 1
+            counter = self._m_types.get(entry["type"])
+            if counter is None:
+                counter = self._m_types[entry["type"]] = _ENTRIES.labels(entry["type"])
+            counter.inc()
+        self._commit(pending)
+
+    def _commit(self, pending):
+        """Publish written lines to readers: the index only ever describes bytes already in the file"""
+        if not pending:
+            return
+        self._file.flush()
+        with self._lock:
+            seg = self._segments[-1]
+            for entry, length in pending:
+                seg.add(entry, length)
+
+    def _seal(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        self._file = None
+        self._save_index(self._segments[-1])
+
+    def _open_segment(self, reuse):
+        """Open the segment for new entries: after a restart the last one while it has room, else a new one;
+        then drop the oldest segments beyond the size bound"""
+        last = self._segments[-1] if self._segments else None
+        if reuse and last is not None and last.size < self.segment_bytes:
+            self._file = open(last.path, "ab")
+            return
+        path = os.path.join(self.directory, f"{SEGMENT_PREFIX}{self._next_seq:012d}{SEGMENT_SUFFIX}")
+        self._file = open(path, "ab")
+        removed = []
+        with self._lock:
+            self._segments.append(Segment(path, self._next_seq))
+            # Room for the new segment to fill up keeps the total within max_bytes
+            while len(self._segments) > 1 and sum(s.size for s in self._segments) + self.segment_bytes > self.max_bytes:
+                removed.append(self._segments.pop(0))
+            self._m_segments.set(len(self._segments))
+        for seg in removed:
+            for p in (seg.path, seg.path + INDEX_SUFFIX):
+                try:
+                    os.remove(p)
+                except FileNotFoundError:
+                    pass
+
+    def _save_index(self, seg):
+        tmp = f"{seg.path}{INDEX_SUFFIX}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            f.write(_dumps(seg.to_doc()))
+        os.replace(tmp, seg.path + INDEX_SUFFIX)
+
+    def query(self, since=None, until=None, type=None, target=None, limit=JOURNAL_QUERY_LIMIT):
+        """Matching entries oldest first (the newest `limit` of them) and the number of segments read"""
+        start = time.perf_counter()
+        self.flush()
+        with self._lock:
+            segments = [(seg, seg.size) for seg in self._segments]
+        needles = []
+        if type is not None:
+            needles.append(b'"type":' + json.dumps(type).encode())
+        if target is not None:
+            needles.append(b'"target":' + json.dumps(target).encode())
+        matches, read = [], 0
+        for seg, size in reversed(segments):
+            if len(matches) >= limit:
+                break
+            if not seg.may_match(since, until, type, target):
+                continue
+            read += 1
+            found = self._scan(seg, size, since, until, type, target, needles)
+            matches = found[max(0, len(found) - (limit - len(matches))):] + matches
+        self._m_read.inc(read)
+        self._m_query.observe(time.perf_counter() - start)
+        return matches, read
+
+    @staticmethod
+    def _scan(seg, size, since, until, type, target, needles):
+        offset = seg.start_offset(since)
+        try:
+            with open(seg.path, "rb") as f:
+                f.seek(offset)
+                data = f.read(size - offset)
+        except FileNotFoundError:
+            # Removed by retention while the query ran
+            return []
+        found = []
+        for line in data.split(b"\n"):
+            if not line or any(needle not in line for needle in needles):
+                continue
+            entry = json.loads(line)
+            ts = entry["ts"]
+            if (since is not None and ts < since) or (until is not None and ts > until):
+                continue
+            if (type is not None and entry["type"] != type) or (target is not None and entry.get("target") != target):
+                continue
+            found.append(entry)
+        return found
+
+    def stats(self):
+        with self._lock:
+            return {
+                "segments": len(self._segments),
+                "entries": sum(seg.count for seg in self._segments),
+                "bytes": sum(seg.size for seg in self._segments),
+                "oldest_ts": min((seg.min_ts for seg in self._segments if seg.count), default=None),
+            }
+
+
+def open_journal(directory=JOURNAL_DIR):
+    """Started Journal in `directory`, or None when the journal is disabled"""
+    if not directory:
+        return None
+    return Journal(directory).start()
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Logging setup for Raspberry Pi LED Server
+Queue-based, rate-limited logging so formatting and I/O stay off request threads
+"""
+
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+from config import *
+from metrics import METRICS
+
+_DROPPED = METRICS.counter("log_records_dropped_total", "Log records dropped because the log queue was full")
+_SUPPRESSED = METRICS.counter("log_records_suppressed_total", "Repeated log records suppressed by the rate limiter")
+
+# Attributes every LogRecord has; anything else was passed via extra= and is shipped as a field
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+_listener = None
+_settings = ()
+_setup_lock = threading.Lock()
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line, suitable for journald/Fluent Bit/Vector shipping"""
+
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 6),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "msg": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, separators=(",", ":"))
+
+
+class RateLimitFilter(logging.Filter):
+    """Let at most `burst` identical messages through per `interval` seconds"""
+
+    def __init__(self, burst=LOG_RATE_LIMIT, interval=LOG_RATE_INTERVAL):
+        super().__init__()
+        self.burst = burst
+        self.interval = interval
+        self._windows = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno < logging.WARNING or self.burst <= 0:
+            return True
+        # Key on the unformatted template so "error: %s" with different args counts as one message
+        key = (record.name, record.levelno, str(record.msg))
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= self.interval:
+                suppressed = window[2] if window else 0
+                self._windows[key] = [now, 1, 0]
+                if len(self._windows) > 1024:
+                    self._prune(now)
+            elif window[1] < self.burst:
+                window[1] += 1
+                suppressed = 0
+            else:
+                window[2] += 1
+                _SUPPRESSED.inc()
+                return False
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+    def _prune(self, now):
+        for key in [k for k, w in self._windows.items() if now - w[0] >= self.interval]:
+            del self._windows[key]
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that never blocks or formats on the calling thread"""
+
+    def prepare(self, record):
+        # Records stay in-process, so skip the eager formatting QueueHandler does for pickling
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _DROPPED.inc()
+
+
+def _make_formatter(fmt):
+    if fmt == "json":
+        return JSONFormatter()
+    return logging.Formatter("%(asctime)s %(levelname)-7s %(name)s [%(threadName)s] %(message)s")
+
+
+def setup_logging(level=LOG_LEVEL, levels=None, fmt=LOG_FORMAT, stream=None):
+    """Install the queue handler on the root logger and start the writer thread (idempotent)"""
+    global _listener, _settings
+    with _setup_lock:
+        if _listener is not None:
+            return _listener
+        _settings = (level, levels, fmt, stream)
+
+        output = logging.StreamHandler(stream or sys.stdout)
+        output.setFormatter(_make_formatter(fmt))
+
+        log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+        handler = NonBlockingQueueHandler(log_queue)
+        handler.addFilter(RateLimitFilter())
+
+        root = logging.getLogger()
+        for existing in list(root.handlers):
+            root.removeHandler(existing)
+        root.addHandler(handler)
+        root.setLevel(level)
+        for name, logger_level in (LOG_LEVELS if levels is None else levels).items():
+            logging.getLogger(name).setLevel(logger_level)
+
+        _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+        _listener.start()
+        # Give the writer thread a readable name in thread dumps
+        if getattr(_listener, "_thread", None) is not None:
+            _listener._thread.name = "log-writer"
+        return _listener
+
+
+def _restart_after_fork():
+    # A forked worker inherits the handler but not the writer thread; give it its own
+    global _listener, _setup_lock
+    _setup_lock = threading.Lock()
+    if _listener is not None:
+        _listener = None
+        setup_logging(*_settings)
+
+
+os.register_at_fork(after_in_child=_restart_after_fork)
+
+
+def shutdown_logging():
+    """Flush queued records and stop the writer thread"""
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
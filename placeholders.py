@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Placeholder images for Raspberry Pi LED Server
+One SVG per component type, rendered once at startup and served in place of missing images
+"""
+
+import hashlib
+
+PLACEHOLDER_ICONS = {
+    'rpi': '🍓',
+    'raspberry': '🍓',
+    'switch': '🔀',
+    'device1': '🖥️',
+    'workstation': '🖥️',
+    'device2': '🖨️',
+    'printer': '🖨️',
+    'device3': '📱',
+    'iot': '📱',
+    'device4': '📹',
+    'camera': '📹'
+}
+DEFAULT_ICON = '📦'
+
+_SVG = '''<?xml version="1.0" encoding="UTF-8"?>
+<svg xmlns="http://www.w3.org/2000/svg" width="64" height="64" viewBox="0 0 64 64">
+    <rect width="64" height="64" fill="#34495e" rx="8"/>
+    <text x="32" y="40" text-anchor="middle" font-size="24" fill="white">{icon}</text>
+</svg>'''
+
+
+class Placeholder:
+    __slots__ = ("body", "etag")
+
+    def __init__(self, icon):
+        self.body = _SVG.format(icon=icon).encode("utf-8")
+        self.etag = "ph-" + hashlib.sha256(self.body).hexdigest()[:20]
+
+
+class Placeholders:
+    def __init__(self):
+        """Render the placeholder for every known component type; icons shared by types share one body"""
+        by_icon = {icon: Placeholder(icon) for icon in set(PLACEHOLDER_ICONS.values()) | {DEFAULT_ICON}}
+        self._by_type = {component_type: by_icon[icon] for component_type, icon in PLACEHOLDER_ICONS.items()}
+        self.default = by_icon[DEFAULT_ICON]
+
+    def get(self, component_type):
+        return self._by_type.get(component_type, self.default)
+
+    def for_image(self, filename):
+        """Placeholder for a missing image, typed by its filename prefix (e.g. rpi-photo.jpg, switch_1.png)"""
+        if '-' in filename:
+            component_type = filename.split('-')[0]
+        elif '_' in filename:
+            component_type = filename.split('_')[0]
+        else:
+            component_type = 'device'
+        return self.get(component_type)
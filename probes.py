@@ -0,0 +1,372 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Reachability probes for Raspberry Pi LED Server
+Every device on the diagram with an address in app_config.json, and every PROBE_TARGETS entry, is probed
+concurrently from one asyncio loop thread: ICMP echo over a single unprivileged datagram ICMP socket where
+net.ipv4.ping_group_range allows it, else a TCP connect (a refusal counts as an answer). Results go into
+fixed-size rings per device; up/down transitions are published as "probe" events
+"""
+
+import asyncio
+import errno
+import logging
+import math
+import os
+import random
+import socket
+import struct
+import threading
+import time
+from config import *
+from config_store import JSONDocument
+from event_bus import EVENTS
+from metrics import METRICS
+
+log = logging.getLogger(__name__)
+
+_PROBES = METRICS.counter("probes_total", "Reachability probes", ("method", "result"))
+_RTT = METRICS.histogram("probe_rtt_seconds", "Reachability probe round-trip time", ("method",))
+_DEVICES = METRICS.gauge("probe_devices", "Probed devices by state", ("state",))
+
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app_config.json")
+
+# Component fields that hold a device's address, and values in them that are not one
+_ADDRESS_FIELDS = ("ip", "defaultIP", "address", "host")
+_NOT_ADDRESSES = ("", "auto-detect")
+
+_ECHO_REQUEST, _ECHO_REPLY = 8, 0
+
+_SLOTS = 20  # probe start times per interval
+
+
+class _Ring:
+    """The latest probe results, oldest overwritten: RTT in seconds, or None for a loss"""
+    __slots__ = ("samples", "head", "count")
+
+    def __init__(self, size):
+        self.samples = [None] * size
+        self.head = 0
+        self.count = 0
+
+    def add(self, rtt):
+        self.samples[self.head] = rtt
+        self.head = (self.head + 1) % len(self.samples)
+        self.count = min(self.count + 1, len(self.samples))
+
+    def latest(self):
+        """Results oldest first"""
+        if self.count < len(self.samples):
+            return self.samples[:self.count]
+        return self.samples[self.head:] + self.samples[:self.head]
+
+
+class _Device:
+    __slots__ = ("key", "name", "host", "port", "ip", "ring", "state", "since", "failures", "sent", "lost",
+                 "last_rtt", "method", "tcp_port", "task")
+
+    def __init__(self, key, name, host, port, history):
+        self.key = key
+        self.name = name
+        self.host = host
+        self.port = port
+        self.ip = None
+        self.ring = _Ring(history)
+        self.state = "unknown"
+        self.since = time.time()
+        self.failures = 0
+        self.sent = 0
+        self.lost = 0
+        self.last_rtt = None
+        self.method = None  # "icmp" or "tcp"; a device that answers TCP but not ICMP stays on TCP
+        self.tcp_port = None  # port that answered the last TCP probe
+        self.task = None
+
+
+def configured_targets(document, extra=PROBE_TARGETS):
+    """{key: (name, host, port)} for the diagram's components with an address, and `extra`"""
+    targets = {}
+    try:
+        components = document.data().get("components", {})
+    except (OSError, ValueError) as e:
+        log.warning("Probe targets: %s unreadable: %s", document.name, e)
+        components = {}
+    for key, component in components.items():
+        if not isinstance(component, dict):
+            continue
+        for field in _ADDRESS_FIELDS:
+            host = str(component.get(field) or "").strip()
+            if host.lower() not in _NOT_ADDRESSES:
+                targets[key] = (component.get("name") or key, host, None)
+                break
+    for target in extra:
+        name = target.get("name") or target["host"]
+        targets[name] = (name, target["host"], target.get("port"))
+    return targets
+
+
+class ProbeEngine:
+    def __init__(self, config_path=CONFIG_PATH, extra=PROBE_TARGETS, interval=PROBE_INTERVAL, timeout=PING_TIMEOUT,
+                 history=PROBE_HISTORY, down_after=PROBE_DOWN_AFTER, tcp_ports=PROBE_TCP_PORTS, bus=EVENTS):
+        """Initialize the engine; call start() to begin probing"""
+        self.document = JSONDocument(config_path, "config")
+        self.extra = extra
+        self.interval = interval
+        self.timeout = timeout
+        self.history = history
+        self.down_after = down_after
+        self.tcp_ports = tuple(tcp_ports)
+        self.bus = bus
+        self.icmp_error = "not started"  # why ICMP is not used, None while it is
+        self._devices = {}
+        self._icmp = None
+        self._pending = {}  # (ip, sequence) -> future resolved with the reply's loop time
+        self._sequence = 0
+        self._loop = None
+        self._stop = None
+        self._epoch = 0.0
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run_loop, name="probe-engine", daemon=True)
+        self._thread.start()
+        return self
+
+    def close(self):
+        if self._loop is not None and self._stop is not None:
+            self._loop.call_soon_threadsafe(self._stop.set)
+        if self._thread is not None:
+            self._thread.join(timeout=5.0)
+
+    def _run_loop(self):
+        self._loop = asyncio.new_event_loop()
+        try:
+            self._loop.run_until_complete(self._main())
+        finally:
+            self._loop.close()
+
+    async def _main(self):
+        self._stop = asyncio.Event()
+        self._epoch = self._loop.time()
+        self._open_icmp()
+        try:
+            while not self._stop.is_set():
+                self._sync(configured_targets(self.document, self.extra))
+                try:
+                    # Pick up devices added or removed on the admin page
+                    await asyncio.wait_for(self._stop.wait(), max(self.interval, 1.0) * 5)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            for device in self._devices.values():
+                device.task.cancel()
+            await asyncio.gather(*(d.task for d in self._devices.values()), return_exceptions=True)
+            if self._icmp is not None:
+                self._loop.remove_reader(self._icmp.fileno())
+                self._icmp.close()
+
+    def _open_icmp(self):
+        try:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_ICMP)
+        except PermissionError:
+            self.icmp_error = "ICMP sockets not allowed for this group (net.ipv4.ping_group_range); using TCP connects"
+            log.info("%s", self.icmp_error)
+            return
+        except OSError as e:
+            self.icmp_error = f"ICMP sockets unavailable ({e}); using TCP connects"
+            log.info("%s", self.icmp_error)
+            return
+        sock.setblocking(False)
+        self._icmp = sock
+        self.icmp_error = None
+        self._loop.add_reader(sock.fileno(), self._icmp_read)
+
+    def _sync(self, targets):
+        """Start probing new targets, stop removed ones, restart ones whose address changed"""
+        for key in list(self._devices):
+            device = self._devices[key]
+            if targets.get(key, (None, None, None))[1:] != (device.host, device.port):
+                device.task.cancel()
+                del self._devices[key]
+        for key, (name, host, port) in targets.items():
+            device = self._devices.get(key)
+            if device is None:
+                device = self._devices[key] = _Device(key, name, host, port, self.history)
+                device.task = self._loop.create_task(self._probe_loop(device))
+            device.name = name
+        self._count_states()
+
+    async def _probe_loop(self, device):
+        # Spread probes over _SLOTS start times per interval: hundreds of targets do not go out together,
+        # and the ones sharing a slot go out in one pass of the loop rather than a wakeup each
+        next_at = self._epoch + random.randrange(_SLOTS) * self.interval / _SLOTS
+        await asyncio.sleep(max(next_at - self._loop.time(), 0))
+        while True:
+            rtt, method = await self._probe(device)
+            self._record(device, rtt, method)
+            next_at += self.interval
+            now = self._loop.time()
+            if next_at < now:
+                # A probe that waited out its timeout skips to its slot in the next interval
+                next_at += math.ceil((now - next_at) / self.interval) * self.interval
+            await asyncio.sleep(next_at - now)
+
+    async def _probe(self, device):
+        """(RTT seconds or None, method)"""
+        if device.ip is None:
+            try:
+                # Addresses need no lookup, and lookups take a thread from the loop's executor
+                socket.inet_aton(device.host)
+                device.ip = device.host
+            except OSError:
+                pass
+        if device.ip is None:
+            try:
+                infos = await self._loop.getaddrinfo(device.host, None, family=socket.AF_INET, type=socket.SOCK_STREAM)
+                device.ip = infos[0][4][0]
+            except (OSError, UnicodeError):
+                return None, "dns"
+        if self._icmp is not None and device.port is None and device.method != "tcp":
+            rtt = await self._icmp_probe(device.ip)
+            if rtt is not None:
+                device.method = "icmp"
+            if device.method == "icmp":
+                return rtt, "icmp"
+        rtt = await self._tcp_probe(device)
+        if rtt is not None and device.method is None:
+            # No ICMP answer, but TCP got one: ICMP is filtered for this device
+            device.method = "tcp"
+        return rtt, "tcp"
+
+    def _icmp_read(self):
+        while True:
+            try:
+                data, (ip, _) = self._icmp.recvfrom(1024)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                return
+            if len(data) >= 8 and data[0] == _ECHO_REPLY:
+                future = self._pending.pop((ip, struct.unpack_from("!H", data, 6)[0]), None)
+                if future is not None and not future.done():
+                    future.set_result(self._loop.time())
+
+    @staticmethod
+    def _expire(future):
+        if not future.done():
+            future.set_result(None)
+
+    async def _icmp_probe(self, ip):
+        # The kernel sets the identifier (the socket's port) and checksum and routes replies by identifier
+        self._sequence = (self._sequence + 1) & 0xFFFF
+        key = (ip, self._sequence)
+        future = self._pending[key] = self._loop.create_future()
+        # A timer on the future itself; wait_for costs several times the probe
+        timer = self._loop.call_later(self.timeout, self._expire, future)
+        sent = self._loop.time()
+        try:
+            self._icmp.sendto(struct.pack("!BBHHHd", _ECHO_REQUEST, 0, 0, 0, self._sequence, time.time()), (ip, 0))
+            replied = await future
+        except OSError:
+            return None
+        finally:
+            timer.cancel()
+            self._pending.pop(key, None)
+        return None if replied is None else replied - sent
+
+    async def _tcp_probe(self, device):
+        """Connect to the device's port, else the port that answered last time, else every PROBE_TCP_PORTS port
+        at once; the host has answered once a handshake completes or is refused"""
+        ports = (device.port,) if device.port else (device.tcp_port,) if device.tcp_port else self.tcp_ports
+        answered = self._loop.create_future()
+        remaining = [len(ports)]
+        sockets = []
+
+        def settle(port, err):
+            remaining[0] -= 1
+            if answered.done():
+                return
+            if err in (0, errno.ECONNREFUSED):
+                answered.set_result(port)
+            elif not remaining[0]:
+                answered.set_result(None)
+
+        def writable(sock, port):
+            self._loop.remove_writer(sock.fileno())
+            settle(port, sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR))
+
+        timer = self._loop.call_later(self.timeout, self._expire, answered)
+        sent = self._loop.time()
+        try:
+            for port in ports:
+                sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                sock.setblocking(False)
+                sockets.append(sock)
+                err = sock.connect_ex((device.ip, port))
+                if err == errno.EINPROGRESS:
+                    self._loop.add_writer(sock.fileno(), writable, sock, port)
+                else:
+                    settle(port, err)
+            device.tcp_port = await answered
+        finally:
+            timer.cancel()
+            for sock in sockets:
+                self._loop.remove_writer(sock.fileno())
+                sock.close()
+        return None if device.tcp_port is None else self._loop.time() - sent
+
+    def _record(self, device, rtt, method):
+        device.ring.add(rtt)
+        device.sent += 1
+        _PROBES.labels(method, "ok" if rtt is not None else "lost").inc()
+        if rtt is None:
+            device.lost += 1
+            device.failures += 1
+            if device.state != "down" and device.failures >= self.down_after:
+                self._transition(device, "down", method)
+        else:
+            _RTT.labels(method).observe(rtt)
+            device.failures = 0
+            device.last_rtt = rtt
+            if device.state != "up":
+                self._transition(device, "up", method)
+
+    def _transition(self, device, state, method):
+        previous = device.state
+        device.state, device.since = state, time.time()
+        self._count_states()
+        log.info("Device %s (%s) is %s", device.name, device.host, state)
+        self.bus.publish("probe", {"device": device.key, "name": device.name, "address": device.host,
+                                   "state": state, "previous": previous, "method": method,
+                                   "rtt_ms": round(device.last_rtt * 1e3, 3) if state == "up" else None})
+
+    def _count_states(self):
+        states = [d.state for d in list(self._devices.values())]
+        for state in ("up", "down", "unknown"):
+            _DEVICES.labels(state).set(states.count(state))
+
+    @staticmethod
+    def _stats(device, history):
+        samples = device.ring.latest()
+        rtts = [s * 1e3 for s in samples if s is not None]
+        stats = {"name": device.name, "address": device.host, "port": device.port, "state": device.state,
+                 "since": device.since, "method": device.method, "probes": device.sent, "lost": device.lost,
+                 "window": len(samples),
+                 "loss_pct": round(100 * (len(samples) - len(rtts)) / len(samples), 1) if samples else None,
+                 "rtt_ms": {"last": round(device.last_rtt * 1e3, 3) if device.last_rtt is not None else None,
+                            "min": round(min(rtts), 3), "avg": round(sum(rtts) / len(rtts), 3),
+                            "max": round(max(rtts), 3)} if rtts else None}
+        if history:
+            stats["history_ms"] = [round(s * 1e3, 3) if s is not None else None for s in samples]
+        return stats
+
+    def status(self, key=None, history=False):
+        """{device key: state, loss and RTT over the last PROBE_HISTORY probes}; `history` adds each result"""
+        return {k: self._stats(d, history) for k, d in list(self._devices.items()) if key is None or k == key}
+
+
+def start_probes(enabled=PROBE_ENABLED):
+    """Started ProbeEngine, or None when probing is disabled"""
+    if not enabled:
+        return None
+    return ProbeEngine().start()
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Sampling profiler for Raspberry Pi LED Server
+Wall-clock stack sampling across all threads plus a thread census, for live diagnosis
+"""
+
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from config import *
+
+# Leaf frames that mean "this thread is parked", used when idle stacks are excluded
+_IDLE_LEAVES = {"wait", "_wait_for_tstate_lock", "select", "poll", "accept", "get", "sleep", "serve_forever",
+                "readinto", "recv", "recv_into", "_recv", "handle_request"}
+
+try:
+    _CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+except (AttributeError, ValueError, OSError):
+    _CLOCK_TICKS = 100
+
+
+def _boot_time():
+    """System boot time (epoch seconds) from /proc/stat, or None off Linux"""
+    try:
+        with open("/proc/stat") as f:
+            for line in f:
+                if line.startswith("btime"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+_BOOT_TIME = _boot_time()
+
+
+def _thread_started_at(native_id):
+    """Epoch start time of an OS thread, read from /proc/self/task/<tid>/stat"""
+    if _BOOT_TIME is None or native_id is None:
+        return None
+    try:
+        with open(f"/proc/self/task/{native_id}/stat") as f:
+            stat = f.read()
+    except OSError:
+        return None
+    # Field 22 (starttime) counted after the parenthesised command name
+    fields = stat[stat.rfind(")") + 2:].split()
+    return _BOOT_TIME + int(fields[19]) / _CLOCK_TICKS
+
+
+def _origin(thread):
+    """module.function the thread was started with"""
+    target = getattr(thread, "_target", None)
+    if target is None:
+        return type(thread).__module__ + "." + type(thread).__qualname__
+    owner = getattr(target, "__self__", None)
+    module = getattr(target, "__module__", None) or type(owner).__module__
+    return f"{module}.{getattr(target, '__qualname__', repr(target))}"
+
+
+def thread_census():
+    """Name, origin, age and state of every live thread"""
+    now = time.time()
+    current = sys._current_frames()
+    threads = []
+    for thread in threading.enumerate():
+        started = _thread_started_at(getattr(thread, "native_id", None))
+        frame = current.get(thread.ident)
+        threads.append({
+            "name": thread.name,
+            "ident": thread.ident,
+            "native_id": getattr(thread, "native_id", None),
+            "daemon": thread.daemon,
+            "origin": _origin(thread),
+            "age_seconds": round(now - started, 2) if started else None,
+            "current": f"{frame.f_code.co_name} ({os.path.basename(frame.f_code.co_filename)}:{frame.f_lineno})"
+                       if frame else None,
+        })
+    threads.sort(key=lambda t: (t["age_seconds"] is None, -(t["age_seconds"] or 0)))
+    return threads
+
+
+class StackSampler:
+    def __init__(self):
+        """Initialize sampler; only one profile can run at a time"""
+        self._busy = threading.Lock()
+        self._labels = {}
+
+    def _label(self, code):
+        label = self._labels.get(code)
+        if label is None:
+            label = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+            self._labels[code] = label
+        return label
+
+    def _stack(self, frame):
+        labels = []
+        while frame is not None:
+            labels.append(self._label(frame.f_code))
+            frame = frame.f_back
+        labels.reverse()
+        return labels
+
+    def profile(self, seconds, hz=PROFILER_DEFAULT_HZ, include_idle=True):
+        """Sample every thread for `seconds`; returns (Counter of collapsed stacks, stats) or None if busy"""
+        if not self._busy.acquire(blocking=False):
+            return None
+        try:
+            seconds = max(0.1, min(float(seconds), PROFILER_MAX_SECONDS))
+            interval = 1.0 / max(1.0, min(float(hz), 1000.0))
+            own = threading.get_ident()
+            names = {}
+            stacks = Counter()
+            samples = 0
+            overhead = 0.0
+            start = time.perf_counter()
+            deadline = start + seconds
+            next_tick = start
+            while True:
+                tick_start = time.perf_counter()
+                if tick_start >= deadline:
+                    break
+                frames = sys._current_frames()
+                if len(names) != len(frames):
+                    names = {t.ident: t.name for t in threading.enumerate()}
+                for ident, frame in frames.items():
+                    if ident == own:
+                        continue
+                    labels = self._stack(frame)
+                    if not include_idle and labels and labels[-1].split(" ", 1)[0] in _IDLE_LEAVES:
+                        continue
+                    name = names.get(ident, f"thread-{ident}").replace(";", ":").replace(" ", "_")
+                    stacks[name + ";" + ";".join(labels)] += 1
+                del frames
+                samples += 1
+                overhead += time.perf_counter() - tick_start
+                next_tick += interval
+                delay = next_tick - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    next_tick = time.perf_counter()
+            elapsed = time.perf_counter() - start
+            stats = {
+                "seconds": round(elapsed, 3),
+                "samples": samples,
+                "achieved_hz": round(samples / elapsed, 1) if elapsed else 0,
+                "sampler_cpu_fraction": round(overhead / elapsed, 4) if elapsed else 0,
+                "stacks": len(stacks),
+            }
+            return stacks, stats
+        finally:
+            self._busy.release()
+
+
+def render_collapsed(stacks):
+    """Brendan Gregg collapsed format: 'frame;frame;frame count' per line"""
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Scenario runner for Raspberry Pi LED Server
+Plays a scripted demo: a JSON (or YAML, with PyYAML) file in SCENARIO_DIR listing CommandExecutor
+operations at offsets from the start, each with an optional LED cue. Before the clock starts, targets
+are resolved, SNMP agents are warmed with one round trip and target MACs are looked up, so the steps
+themselves do not pay those first-time costs. Progress is published on the event bus as "scenario"
+
+    {"name": "Port down demo", "target": "192.168.127.254",
+     "steps": [{"at": 0, "op": "snmp_portdown", "ifindex": "3", "cue": {"layer": "status", "levels": {"17": 255}}},
+               {"at": 4, "op": "packet_eicar", "target_port": 80},
+               {"at": 8, "op": "snmp_portup", "ifindex": "3", "cue": {"layer": "status", "clear": true}}]}
+"""
+
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from config import *
+from event_bus import EVENTS
+from metrics import METRICS
+
+log = logging.getLogger(__name__)
+
+_STEP_SECONDS = METRICS.histogram("scenario_step_seconds", "Scenario step run time", ("op",))
+_STEP_LATENESS = METRICS.histogram("scenario_step_lateness_seconds", "Scenario step start behind its schedule")
+
+# Step op -> (CommandExecutor method, positional argument names). None passes the step's arguments as the
+# method's one request dict. Op names match the journal's
+OPERATIONS = {
+    "snmp_walk": ("snmp_walk", ("target", "community")),
+    "snmp_portdown": ("snmp_portdown", ("target", "ifindex", "community")),
+    "snmp_portup": ("snmp_portup", ("target", "ifindex", "community")),
+    "snmp_portstatus": ("snmp_get_port_status", ("target", "ifindex", "community")),
+    "snmp_interfaces": ("snmp_get_interfaces", ("target", "community")),
+    "packet_craft": ("craft_and_send_packet", None),
+    "packet_raw": ("send_raw_packet", None),
+    "packet_eicar": ("send_eicar_packet", None),
+    "flood_start": ("start_udp_flood", None),
+    "flood_stop": ("stop_udp_flood", ()),
+}
+
+# Community each SNMP op uses when the step names none (the executor's defaults); port changes also read back with public
+_SNMP_COMMUNITY = {"snmp_walk": "public", "snmp_portdown": "private", "snmp_portup": "private",
+                   "snmp_portstatus": "public", "snmp_interfaces": "public"}
+
+# Step keys that are not operation arguments
+_STEP_KEYS = ("at", "op", "cue")
+
+# The last stretch before a step is spun rather than slept, for a start within a fraction of a millisecond
+_SPIN_SECONDS = 0.002
+
+
+class ScenarioError(ValueError):
+    pass
+
+
+def load_scenario(path):
+    """Read and check a scenario file; steps come back in start order. Raises ScenarioError"""
+    try:
+        with open(path, encoding="utf-8") as f:
+            if path.endswith((".yaml", ".yml")):
+                try:
+                    import yaml
+                except ImportError:
+                    raise ScenarioError("YAML scenarios need PyYAML (pip install pyyaml)")
+                scenario = yaml.safe_load(f)
+            else:
+                scenario = json.load(f)
+    except OSError as e:
+        raise ScenarioError(f"Cannot read {os.path.basename(path)}: {e.strerror}")
+    except ValueError as e:
+        raise ScenarioError(f"{os.path.basename(path)}: {e}")
+    return check_scenario(scenario, os.path.splitext(os.path.basename(path))[0])
+
+
+def check_scenario(scenario, default_name):
+    if not isinstance(scenario, dict) or not isinstance(scenario.get("steps"), list) or not scenario["steps"]:
+        raise ScenarioError("A scenario is an object with a non-empty steps list")
+    steps = []
+    for i, step in enumerate(scenario["steps"]):
+        if not isinstance(step, dict):
+            raise ScenarioError(f"Step {i + 1} is not an object")
+        at = step.get("at", 0)
+        if not isinstance(at, (int, float)) or at < 0:
+            raise ScenarioError(f"Step {i + 1}: at must be seconds from the start, 0 or more")
+        op = step.get("op")
+        if op is None and "cue" not in step:
+            raise ScenarioError(f"Step {i + 1} has neither an op nor a cue")
+        if op is not None and op not in OPERATIONS:
+            raise ScenarioError(f"Step {i + 1}: unknown op {op!r} (one of {', '.join(OPERATIONS)})")
+        cue = step.get("cue")
+        if cue is not None and not (isinstance(cue, dict) and isinstance(cue.get("levels", {}), dict)):
+            raise ScenarioError(f"Step {i + 1}: cue must be an object with a levels object")
+        steps.append(dict(step, at=float(at)))
+    # Stable: steps at the same offset keep their file order
+    steps.sort(key=lambda step: step["at"])
+    return dict(scenario, name=scenario.get("name") or default_name, steps=steps)
+
+
+def _arguments(scenario, step):
+    """The step's operation arguments, with the scenario's target where the step names none"""
+    args = {k: v for k, v in step.items() if k not in _STEP_KEYS}
+    method, positional = OPERATIONS[step["op"]]
+    if positional is None:
+        args.setdefault("target_ip", scenario.get("target", ""))
+    elif "target" in positional:
+        args.setdefault("target", scenario.get("target", ""))
+    return args
+
+
+class ScenarioRunner:
+    """Runs one scenario at a time on a background thread against a CommandExecutor"""
+
+    def __init__(self, cmd, directory=SCENARIO_DIR):
+        self.cmd = cmd
+        if not os.path.isabs(directory):
+            directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), directory)
+        self.directory = directory
+        self.report = None  # current or last run
+        self._runs = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def list(self):
+        """Scenario files available to start"""
+        try:
+            names = sorted(os.listdir(self.directory))
+        except FileNotFoundError:
+            names = []
+        return [os.path.splitext(name)[0] for name in names if name.endswith((".json", ".yaml", ".yml"))]
+
+    def _path(self, name):
+        for ext in (".json", ".yaml", ".yml"):
+            path = os.path.join(self.directory, name + ext)
+            if os.path.isfile(path):
+                return path
+        raise ScenarioError(f"No scenario named {name!r}")
+
+    def start(self, name):
+        """Load and start a scenario; returns the run report, or raises ScenarioError"""
+        if os.path.basename(name) != name or name.startswith("."):
+            raise ScenarioError(f"No scenario named {name!r}")
+        scenario = load_scenario(self._path(name))
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                raise ScenarioError(f"Scenario {self.report['name']!r} is already running")
+            self._runs += 1
+            self._stop.clear()
+            self.report = {
+                "id": self._runs,
+                "name": scenario["name"],
+                "file": name,
+                "state": "preparing",
+                "started": time.time(),
+                "prepared": None,
+                "steps": [{"index": i, "at": step["at"], "op": step.get("op")} for i, step in enumerate(scenario["steps"])],
+                "error": None,
+                "ms": None,
+            }
+            self._thread = threading.Thread(target=self._run, args=(scenario, self.report),
+                                            name=f"scenario-{self._runs}", daemon=True)
+            self._thread.start()
+            return self.report
+
+    def stop(self):
+        """Stop the running scenario after its current step; False if none was running"""
+        with self._lock:
+            thread = self._thread
+            if thread is None or not thread.is_alive():
+                return False
+            self._stop.set()
+        thread.join(SNMP_TIMEOUT + DEFAULT_TIMEOUT)
+        return True
+
+    def _publish(self, report, step=None):
+        data = {"id": report["id"], "name": report["name"], "state": report["state"]}
+        if step is not None:
+            data["step"] = step
+        if report["error"]:
+            data["error"] = report["error"]
+        EVENTS.publish("scenario", data)
+
+    def _run(self, scenario, report):
+        lit = {}  # layer -> pins the cues left set, cleared when the run ends
+        flood_started = False
+        try:
+            self._publish(report)
+            start = time.perf_counter()
+            prepared = self._prepare(scenario)
+            prepared["ms"] = round((time.perf_counter() - start) * 1e3, 1)
+            report["prepared"] = prepared
+            report["state"] = "running"
+            self._publish(report)
+            start = time.perf_counter()
+            # Step results are replaced whole, never grown in place, so the report can be read while it runs
+            for i, step in enumerate(scenario["steps"]):
+                if not self._wait_until(start + step["at"]):
+                    break
+                began = time.perf_counter()
+                result = dict(report["steps"][i], lateness_ms=round((began - start - step["at"]) * 1e3, 3))
+                _STEP_LATENESS.observe(began - start - step["at"])
+                if step.get("cue"):
+                    self._cue(step["cue"], lit)
+                if step.get("op"):
+                    outcome = self._call(scenario, step)
+                    result["ok"] = bool(outcome.get("ok"))
+                    if not result["ok"]:
+                        result["error"] = outcome.get("error") or outcome.get("stderr") or outcome.get("set_stderr")
+                    flood_started |= step["op"] == "flood_start" and result["ok"]
+                    elapsed = time.perf_counter() - began
+                    result["ms"] = round(elapsed * 1e3, 1)
+                    _STEP_SECONDS.labels(step["op"]).observe(elapsed)
+                report["steps"][i] = result
+                self._publish(report, result)
+            report["state"] = "stopped" if self._stop.is_set() else "done"
+        except Exception as e:
+            log.exception("Scenario %s failed", report["name"])
+            report["state"] = "failed"
+            report["error"] = str(e) or type(e).__name__
+        finally:
+            if self._stop.is_set() and flood_started and getattr(self.cmd, "flood_active", False):
+                self.cmd.stop_udp_flood()
+            # Only the cues' own pins: other users of the layer keep theirs
+            for layer, pins in lit.items():
+                if pins:
+                    self.cmd.gpio.clear_layer(layer, sorted(pins))
+            report["ms"] = round((time.time() - report["started"]) * 1e3, 1)
+            self._publish(report)
+            failed = [r["index"] for r in report["steps"] if r.get("ok") is False]
+            self.cmd.record_operation("scenario", report["name"], report["state"] == "done" and not failed,
+                                      {"file": report["file"], "steps": len(report["steps"])},
+                                      {"state": report["state"], "failed_steps": len(failed)})
+
+    def _prepare(self, scenario):
+        """Resolve targets, warm SNMP agents (also filling the ARP cache) and look up MACs; rewrites the steps"""
+        addresses, snmp, packet_targets = {}, set(), set()
+        for step in scenario["steps"]:
+            op = step.get("op")
+            if op is None or OPERATIONS[op][1] == ():
+                continue
+            args = _arguments(scenario, step)
+            key = "target_ip" if OPERATIONS[op][1] is None else "target"
+            host = str(args.get(key, "")).strip()
+            if not host:
+                continue
+            if host not in addresses:
+                try:
+                    addresses[host] = socket.gethostbyname(host)
+                except OSError as e:
+                    raise ScenarioError(f"Cannot resolve {host}: {e}")
+            step[key] = addresses[host]
+            if op in _SNMP_COMMUNITY:
+                snmp.add((addresses[host], args.get("community") or _SNMP_COMMUNITY[op]))
+                if op in ("snmp_portdown", "snmp_portup"):
+                    snmp.add((addresses[host], "public"))
+            elif op.startswith("packet_"):
+                packet_targets.add(addresses[host])
+
+        warmed = {}
+        for address, community in sorted(snmp):
+            began = time.perf_counter()
+            code, _, err = self.cmd._run(f"snmpget -v2c -c {community} {address} 1.3.6.1.2.1.1.3.0", timeout=SNMP_TIMEOUT)
+            warmed[f"{address}/{community}"] = {"ok": code == 0, "ms": round((time.perf_counter() - began) * 1e3, 1)}
+            if code != 0:
+                log.warning("Scenario SNMP warm-up of %s failed: %s", address, err)
+
+        macs = {}
+        source = self.cmd.get_source_mac()
+        for address in sorted(packet_targets):
+            if not any(address == a for a, _ in snmp):
+                # Nothing has talked to this host yet; one empty datagram to discard makes the kernel ARP for it
+                with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as probe:
+                    try:
+                        probe.sendto(b"", (address, 9))
+                    except OSError:
+                        pass
+                time.sleep(0.05)
+            found = self.cmd.get_target_mac(address)
+            macs[address] = found.get("mac")
+        for step in scenario["steps"]:
+            if (step.get("op") or "").startswith("packet_") and step.get("target_ip") in macs:
+                if macs[step["target_ip"]]:
+                    step.setdefault("target_mac", macs[step["target_ip"]])
+                if source.get("ok"):
+                    step.setdefault("source_mac", source["mac"])
+        return {"addresses": addresses, "snmp": warmed, "macs": macs}
+
+    def _wait_until(self, deadline):
+        """Sleep, then spin, until `deadline` (perf_counter); False if stopped first"""
+        while True:
+            remaining = deadline - time.perf_counter()
+            if remaining <= _SPIN_SECONDS:
+                break
+            if self._stop.wait(remaining - _SPIN_SECONDS):
+                return False
+        while time.perf_counter() < deadline:
+            pass
+        return not self._stop.is_set()
+
+    def _cue(self, cue, lit):
+        """Apply an LED cue, noting in `lit` (layer -> pins) what it leaves set"""
+        layer = cue.get("layer", "status")
+        levels = {str(name): int(level) for name, level in cue.get("levels", {}).items()}
+        pins = lit.setdefault(layer, set())
+        if cue.get("clear"):
+            self.cmd.gpio.clear_layer(layer, list(levels) or None, float(cue.get("fade", 0)))
+            if levels:
+                pins.difference_update(levels)
+            else:
+                pins.clear()
+            return
+        pins.update(levels)
+        if cue.get("flash"):
+            self.cmd.gpio.flash(layer, levels, int(cue.get("on_ms", ERROR_ON_MS)), int(cue.get("off_ms", ERROR_OFF_MS)),
+                                int(cue.get("count", ERROR_BLINKS)))
+        else:
+            self.cmd.gpio.set_brightness(layer, levels, float(cue.get("fade", 0)))
+
+    def _call(self, scenario, step):
+        method, positional = OPERATIONS[step["op"]]
+        args = _arguments(scenario, step)
+        try:
+            if positional is None:
+                return getattr(self.cmd, method)(args)
+            return getattr(self.cmd, method)(**{name: args[name] for name in positional if name in args})
+        except Exception as e:
+            log.warning("Scenario step %s failed: %s", step["op"], e)
+            return {"ok": False, "error": str(e)}
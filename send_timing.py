@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Send timing for crafted packets
+Stage durations of one TCP/UDP send (resolve, connect, send, first response), the kernel's transmit,
+peer-ACK and receive timestamps (SO_TIMESTAMPING) where the platform gives them, and per-target
+histograms of every stage
+"""
+
+import select
+import socket
+import struct
+import threading
+import time
+from contextlib import contextmanager
+from config import *
+from metrics import METRICS, LATENCY_BUCKETS
+
+# linux/net_tstamp.h, linux/errqueue.h
+SO_TIMESTAMPING = 37
+SOF_TIMESTAMPING_TX_SOFTWARE = 1 << 1
+SOF_TIMESTAMPING_RX_SOFTWARE = 1 << 3
+SOF_TIMESTAMPING_SOFTWARE = 1 << 4
+SOF_TIMESTAMPING_OPT_ID = 1 << 7
+SOF_TIMESTAMPING_TX_ACK = 1 << 9
+SOF_TIMESTAMPING_OPT_TSONLY = 1 << 11
+SCM_TSTAMP_SND, SCM_TSTAMP_ACK = 0, 2
+SO_EE_ORIGIN_TIMESTAMPING = 4
+IP_RECVERR = getattr(socket, "IP_RECVERR", 11)
+
+_STAGE_SECONDS = METRICS.histogram("packet_send_stage_seconds", "Crafted send stage durations per target",
+                                   ("target", "protocol", "stage"), buckets=(0.0001, 0.00025) + LATENCY_BUCKETS)
+
+# Stages kept in the histograms, in the order a send goes through them
+STAGES = ("resolve", "connect", "send", "wire", "ack", "response")
+
+
+def _timestamp(ancdata):
+    """(software timestamp ns, errqueue timestamp type or None) from a recvmsg's control messages"""
+    ns = tstype = None
+    for level, kind, data in ancdata:
+        if level == socket.SOL_SOCKET and kind == SO_TIMESTAMPING and len(data) >= struct.calcsize("2l"):
+            sec, nsec = struct.unpack_from("2l", data)
+            ns = sec * 10 ** 9 + nsec
+        elif level == socket.SOL_IP and kind == IP_RECVERR:
+            _, origin, _, _, _, info, _ = struct.unpack_from("IBBBBII", data)
+            if origin == SO_EE_ORIGIN_TIMESTAMPING:
+                tstype = info
+    return ns, tstype
+
+
+class SendTiming:
+    """Stage durations of one send, with the kernel's timestamps where it gives them"""
+
+    def __init__(self):
+        self.stages = {}  # stage -> ms
+        self.failed = None  # stage that raised
+        self.response = None  # "data", "closed", "reset", "refused" or "timeout" when a reply was waited for
+        self.kernel = False
+        self._send_ns = self._tx_ns = self._ack_ns = self._rx_ns = None
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.failed = name
+            raise
+        finally:
+            self.stages[name] = (time.perf_counter() - start) * 1e3
+
+    def enable_kernel(self, sock, tcp):
+        """Ask for software TX (and for TCP, peer ACK) timestamps on the error queue and RX timestamps
+        on received data; a TCP socket must be connected. Without SO_TIMESTAMPING the timing is user space only"""
+        flags = (SOF_TIMESTAMPING_TX_SOFTWARE | SOF_TIMESTAMPING_RX_SOFTWARE | SOF_TIMESTAMPING_SOFTWARE |
+                 SOF_TIMESTAMPING_OPT_ID | SOF_TIMESTAMPING_OPT_TSONLY | (SOF_TIMESTAMPING_TX_ACK if tcp else 0))
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, SO_TIMESTAMPING, flags)
+            self.kernel = True
+        except OSError:
+            self.kernel = False
+
+    def send(self, sock, data, address=None):
+        """sock.send(data), or sendto when an address is given, timed as the "send" stage"""
+        self._send_ns = time.time_ns()
+        with self.stage("send"):
+            return sock.send(data) if address is None else sock.sendto(data, address)
+
+    def await_response(self, sock):
+        """Wait for the first byte back within the socket's timeout; a connected UDP socket also hears of
+        the port being closed, from the ICMP port unreachable"""
+        start = time.perf_counter()
+        try:
+            data, ancdata, _, _ = sock.recvmsg(1, 256)
+        except socket.timeout:
+            self.response = "timeout"
+            return
+        except ConnectionResetError:
+            self.response = "reset"
+        except ConnectionRefusedError:
+            self.response = "refused"
+        else:
+            self.response = "data" if data else "closed"
+            self._rx_ns = _timestamp(ancdata)[0]
+        self.stages["response"] = (time.perf_counter() - start) * 1e3
+
+    def transmitted(self, sock, wait_ack, timeout):
+        """Read the kernel's transmit timestamp, and with `wait_ack` the peer's ACK of the data, from the
+        socket's error queue; waits at most `timeout` seconds"""
+        if not self.kernel or self._send_ns is None:
+            return
+        sock.setblocking(False)
+        poller = select.poll()
+        poller.register(sock, select.POLLERR)
+        deadline = time.monotonic() + timeout
+        while self._tx_ns is None or (wait_ack and self._ack_ns is None):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not poller.poll(remaining * 1000):
+                break
+            try:
+                _, ancdata, _, _ = sock.recvmsg(64, 512, socket.MSG_ERRQUEUE)
+            except OSError:
+                break
+            ns, tstype = _timestamp(ancdata)
+            if tstype == SCM_TSTAMP_SND:
+                self._tx_ns = ns
+            elif tstype == SCM_TSTAMP_ACK:
+                self._ack_ns = ns
+
+    def result(self):
+        """Stage durations in ms; wire is send() to the packet leaving the host, ack is leaving to the peer's
+        ACK, response_kernel is leaving to the reply reaching the host"""
+        timing = {f"{name}_ms": round(ms, 3) for name, ms in self.stages.items()}
+        if self._tx_ns is not None:
+            timing["wire_ms"] = round((self._tx_ns - self._send_ns) / 1e6, 3)
+            if self._ack_ns is not None:
+                timing["ack_ms"] = round((self._ack_ns - self._tx_ns) / 1e6, 3)
+            if self._rx_ns is not None:
+                timing["response_kernel_ms"] = round((self._rx_ns - self._tx_ns) / 1e6, 3)
+        timing["kernel_timestamps"] = self._tx_ns is not None
+        if self.response is not None:
+            timing["response"] = self.response
+        if self.failed is not None:
+            timing["failed_stage"] = self.failed
+        return timing
+
+
+class SendLatency:
+    """Per-target histograms of send stages, exported as packet_send_stage_seconds; targets past
+    `max_targets` are counted as "other" """
+
+    def __init__(self, histogram=_STAGE_SECONDS, max_targets=PACKET_LATENCY_TARGETS):
+        self.histogram = histogram
+        self.max_targets = max_targets
+        self._targets = set()
+        self._lock = threading.Lock()
+
+    def record(self, target, protocol, timing):
+        """Add the completed stages of one send's timing (SendTiming.result())"""
+        with self._lock:
+            if target not in self._targets:
+                if len(self._targets) >= self.max_targets:
+                    target = "other"
+                self._targets.add(target)
+        failed = timing.get("failed_stage")
+        for stage in STAGES:
+            ms = timing.get(f"{stage}_ms")
+            if ms is not None and stage != failed and ms >= 0:
+                self.histogram.labels(target, protocol, stage).observe(ms / 1e3)
+
+    def query(self, target=None):
+        """{target: {protocol: {stage: count, mean and quantiles in ms, cumulative [le ms, count] buckets}}}"""
+        targets = {}
+        for (name, protocol, stage), child in self.histogram.children():
+            if target is not None and name != target:
+                continue
+            cumulative, total, count = child.snapshot()
+            if not count:
+                continue
+            summary = {"count": count, "mean_ms": round(total / count * 1e3, 3)}
+            for q in (0.5, 0.9, 0.99):
+                bound = child.quantile(q)
+                # Upper bucket bounds; None past the last one
+                summary[f"p{int(q * 100)}_ms"] = None if bound == float('inf') else round(bound * 1e3, 3)
+            summary["buckets"] = [[round(bound * 1e3, 3), c] for bound, c in zip(child.bounds, cumulative)]
+            summary["buckets"].append(["+Inf", count])
+            targets.setdefault(name, {}).setdefault(protocol, {})[stage] = summary
+        return targets
@@ -78,13 +78,13 @@ echo "Activating virtual environment..."
 source venv/bin/activate
 
 # Check if dependencies are installed in venv
-if ! python -c "import flask, pigpio, psutil, netifaces" 2>/dev/null; then
+if ! python -c "import flask, pigpio, netifaces" 2>/dev/null; then
     echo "Installing Python dependencies in virtual environment..."
     pip cache purge 2>/dev/null || true
     pip install --no-cache-dir --force-reinstall -r requirements.txt
     
     # Verify installation succeeded
-    if ! python -c "import flask, pigpio, psutil, netifaces" 2>/dev/null; then
+    if ! python -c "import flask, pigpio, netifaces" 2>/dev/null; then
         echo "ERROR: Failed to install Python dependencies"
         echo "Try manually: pip install --no-cache-dir -r requirements.txt"
         exit 1
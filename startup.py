@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Startup for Raspberry Pi LED Server
+The server answers as soon as Flask is up; hardware comes up behind it. The GPIO controller is
+built on a background thread and retried while pigpiod is still starting after a power cycle,
+and until then LED calls run degraded: status reads all-off and commands are refused. Components
+register readiness checks in READINESS, which /readyz reports
+"""
+
+import logging
+import os
+import threading
+import time
+from config import *
+from cluster import build_controller
+from event_bus import EVENTS
+from gpio_controller import claim_gpio
+
+log = logging.getLogger(__name__)
+
+# Process start, near enough: this module is imported early by everything that serves
+STARTED = time.monotonic()
+
+
+class Readiness:
+    """Named checks, each a callable returning (ready, detail)"""
+
+    def __init__(self):
+        self._checks = {}
+        self._lock = threading.Lock()
+
+    def add(self, name, check):
+        """Register or replace a check"""
+        with self._lock:
+            self._checks[name] = check
+
+    def remove(self, name):
+        with self._lock:
+            self._checks.pop(name, None)
+
+    def check(self):
+        """(ready, {name: {"ready", "detail"}}); ready once every check passes"""
+        with self._lock:
+            checks = list(self._checks.items())
+        results = {}
+        for name, check in checks:
+            try:
+                ready, detail = check()
+            except Exception as e:
+                ready, detail = False, str(e) or type(e).__name__
+            results[name] = {"ready": ready, "detail": detail}
+        return all(r["ready"] for r in results.values()), results
+
+
+# Process-wide checks behind /readyz
+READINESS = Readiness()
+
+
+def _refused(*args, **kwargs):
+    return False
+
+
+def _skipped(*args, **kwargs):
+    return None
+
+
+# What the controller interface does while the hardware is not up: commands that report success
+# are refused, everything else (all-off, stop, animation frames) is skipped
+_DEGRADED = {name: _refused for name in (
+    "set_pins", "turn_on_pin", "_set_frame", "start_chaser", "set_brightness", "clear_layer", "flash")}
+_DEGRADED.update((name, _skipped) for name in (
+    "_set", "_write_frame", "_off_all", "_apply_states", "stop_anim",
+    "wave_once", "roundtrip_wave", "chaser", "strobe_error"))
+_DEGRADED["layers"] = dict  # nothing drawn
+
+
+class DeferredController:
+    """GPIOController stand-in that brings the real controller up on a background thread, retrying every
+    STARTUP_RETRY_INTERVAL seconds until it connects; calls are degraded until then and go straight
+    to the controller afterwards"""
+
+    def __init__(self, build, owner_fd=None, retry_interval=STARTUP_RETRY_INTERVAL, readiness=READINESS):
+        self.controller = None
+        self.error = "starting"
+        self._build = build
+        self._owner_fd = owner_fd
+        self._retry_interval = retry_interval
+        self._ready = threading.Event()
+        self._stopped = threading.Event()
+        readiness.add("gpio", self.ready_state)
+        self._thread = threading.Thread(target=self._run, name="gpio-init", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        start = time.monotonic()
+        attempts = 0
+        while not self._stopped.is_set():
+            attempts += 1
+            try:
+                controller = self._build()
+            except (Exception, SystemExit) as e:
+                # GPIOController raises SystemExit when pigpiod is not running
+                self.error = str(e) or type(e).__name__
+                if attempts == 1:
+                    log.warning("GPIO not ready (%s); serving degraded, retrying every %.0fs",
+                                self.error, self._retry_interval)
+                self._stopped.wait(self._retry_interval)
+                continue
+            if self._stopped.is_set():
+                controller.cleanup()
+                return
+            self.controller = controller
+            self.error = None
+            self._ready.set()
+            log.info("GPIO ready after %.2fs (%d attempt%s)", time.monotonic() - start, attempts,
+                     "" if attempts == 1 else "s")
+            EVENTS.publish("ready", {"component": "gpio"})
+            return
+
+    def ready_state(self):
+        return self.controller is not None, self.error
+
+    def wait_ready(self, timeout=None):
+        """Block until the controller is up; False on timeout"""
+        return self._ready.wait(timeout)
+
+    def get_status(self):
+        controller = self.controller
+        if controller is not None:
+            return controller.get_status()
+        return {"pins": dict.fromkeys(PIN_NAMES, 0), "brightness": dict.fromkeys(PIN_NAMES, 0),
+                "degraded": self.error}
+
+    def __getattr__(self, name):
+        # Only reached for names not set on the instance; once up, methods are cached here so later
+        # calls skip this hook
+        controller = self.controller
+        if controller is not None:
+            value = getattr(controller, name)
+            if callable(value):
+                self.__dict__[name] = value
+            return value
+        if name in _DEGRADED:
+            return _DEGRADED[name]
+        raise AttributeError(f"{name}: GPIO is not ready ({self.error})")
+
+    def cleanup(self):
+        self._stopped.set()
+        self._thread.join(timeout=self._retry_interval + 1.0)
+        if self.controller is not None:
+            self.controller.cleanup()
+        elif self._owner_fd is not None:
+            os.close(self._owner_fd)
+            self._owner_fd = None
+
+
+def start_controller():
+    """DeferredController around cluster.build_controller. The GPIO lock is taken here, before returning,
+    so a second server on the same Pi still exits at once"""
+    owner_fd = claim_gpio() if not CLUSTER_BOARDS and GPIO_BACKEND != "simulated" else None
+    return DeferredController(lambda: build_controller(owner_fd=owner_fd), owner_fd=owner_fd)
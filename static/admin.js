@@ -463,7 +463,7 @@ async function saveConfiguration() {
             
             // Update the main topology diagram if it's loaded
             if (window.networkDiagram) {
-                await window.networkDiagram.loadCustomizations();
+                await window.networkDiagram.loadCustomizations(true);
                 adminController.addAdminLog('Topology diagram updated with new configuration', 'success');
             }
             
@@ -658,10 +658,14 @@ async function removeImage(component) {
         if (currentUrl && !currentUrl.includes('default.png')) {
             const filename = currentUrl.split('/').pop();
             
-            // Delete from server
-            await fetch(`/delete-image/${filename}`, {
+            // Delete from server; it keeps files other components still use
+            const response = await fetch(`/delete-image/${filename}?component=${encodeURIComponent(component)}`, {
                 method: 'DELETE'
             });
+            if (response.status === 409) {
+                const data = await response.json();
+                adminController.addAdminLog(`Kept ${filename}: ${data.error}`, 'info');
+            }
         }
         
         // Reset to default image
@@ -1,20 +1,46 @@
 // Interactive Network Diagram JavaScript
+
+// Raster uploads are drawn at diagram size; /thumbs/ serves a scaled copy (or the original until it is ready)
+function thumbnailUrl(url) {
+    const match = /^\/static\/images\/([^/?#]+\.(?:png|jpe?g|gif|webp))$/i.exec(url || '');
+    return match ? `/thumbs/${match[1]}` : url;
+}
+
 class NetworkDiagram {
     constructor() {
         this.targetIP = '192.168.127.254';
         this.interfaces = [];
         this.eventSource = null;
+        this.ledSocket = null;
         this.isAttacking = false;
         this.currentAttackPort = null;
         this.isDragging = false;
         this.dragElement = null;
         this.dragOffset = { x: 0, y: 0 };
+        // Config, positions and LED status rendered into the page by the server
+        this.bootstrap = this.readBootstrap();
         
         this.init();
     }
     
+    readBootstrap() {
+        const element = document.getElementById('bootstrap-data');
+        if (!element) {
+            return {};
+        }
+        try {
+            return JSON.parse(element.textContent);
+        } catch (error) {
+            console.error('Error parsing bootstrap data:', error);
+            return {};
+        }
+    }
+    
     init() {
         this.setupEventListeners();
+        if (this.bootstrap.status) {
+            this.updateLEDDisplay(this.bootstrap.status);
+        }
         // LED monitoring removed per user request
         this.updateTargetIP();
         this.loadCustomizations();
@@ -716,11 +742,22 @@ class NetworkDiagram {
         this.addLog(`${deviceId.replace('-', ' ')} ${show ? 'shown' : 'hidden'}`, 'info');
     }
 
+    // Fetch /load-config once per page; visibility and customizations share the response
+    fetchServerConfig(refresh = false) {
+        if (!this.serverConfigRequest || refresh) {
+            if (!refresh && this.bootstrap.config) {
+                return Promise.resolve({ ok: true, config: this.bootstrap.config });
+            }
+            this.serverConfigRequest = fetch('/load-config').then(response => response.json());
+            this.serverConfigRequest.catch(() => { this.serverConfigRequest = null; });
+        }
+        return this.serverConfigRequest;
+    }
+    
     // Load device visibility settings on page load
     async loadDeviceVisibilitySettings() {
         try {
-            const response = await fetch('/load-config');
-            const data = await response.json();
+            const data = await this.fetchServerConfig();
             
             if (data.ok && data.config && data.config.display) {
                 const config = data.config;
@@ -782,12 +819,24 @@ class NetworkDiagram {
     
     // LED Control Functions removed - available on settings page
     
+    // Send over the LED control socket when it is open, otherwise use the HTTP route
+    async ledCommand(command, endpoint) {
+        if (!this.ledSocket) {
+            // Opened on first use; commands go over HTTP until it connects
+            this.ledSocket = new LedSocket();
+        }
+        if (this.ledSocket.isOpen) {
+            return this.ledSocket.send(command);
+        }
+        const response = await fetch(endpoint);
+        return response.json();
+    }
+    
     async toggleManualLED(pin) {
         this.addLog(`Toggling LED ${pin}`, 'info');
         
         try {
-            const response = await fetch(`/on${pin}`);
-            const data = await response.json();
+            const data = await this.ledCommand({ op: 'pins', on: [String(pin)] }, `/on${pin}`);
             
             if (data.ok) {
                 this.addLog(`LED ${pin} activated`, 'success');
@@ -801,10 +850,9 @@ class NetworkDiagram {
     }
     
     // Load customizations from server
-    async loadCustomizations() {
+    async loadCustomizations(refresh = false) {
         try {
-            const response = await fetch('/load-config');
-            const data = await response.json();
+            const data = await this.fetchServerConfig(refresh);
             
             if (data.ok && data.config && Object.keys(data.config).length > 0) {
                 this.applyCustomizations(data.config);
@@ -919,42 +967,42 @@ class NetworkDiagram {
         if (components.rpi && components.rpi.imageUrl) {
             const rpiImage = document.getElementById('rpi-main-image');
             if (rpiImage) {
-                rpiImage.setAttribute('href', components.rpi.imageUrl);
+                rpiImage.setAttribute('href', thumbnailUrl(components.rpi.imageUrl));
             }
         }
         
         if (components.switch && components.switch.imageUrl) {
             const switchImage = document.getElementById('switch-main-image');
             if (switchImage) {
-                switchImage.setAttribute('href', components.switch.imageUrl);
+                switchImage.setAttribute('href', thumbnailUrl(components.switch.imageUrl));
             }
         }
         
         if (components.device1 && components.device1.imageUrl) {
             const device1Image = document.getElementById('device1-main-image');
             if (device1Image) {
-                device1Image.setAttribute('href', components.device1.imageUrl);
+                device1Image.setAttribute('href', thumbnailUrl(components.device1.imageUrl));
             }
         }
         
         if (components.device2 && components.device2.imageUrl) {
             const device2Image = document.getElementById('device2-main-image');
             if (device2Image) {
-                device2Image.setAttribute('href', components.device2.imageUrl);
+                device2Image.setAttribute('href', thumbnailUrl(components.device2.imageUrl));
             }
         }
         
         if (components.device3 && components.device3.imageUrl) {
             const device3Image = document.getElementById('device3-main-image');
             if (device3Image) {
-                device3Image.setAttribute('href', components.device3.imageUrl);
+                device3Image.setAttribute('href', thumbnailUrl(components.device3.imageUrl));
             }
         }
         
         if (components.device4 && components.device4.imageUrl) {
             const device4Image = document.getElementById('device4-main-image');
             if (device4Image) {
-                device4Image.setAttribute('href', components.device4.imageUrl);
+                device4Image.setAttribute('href', thumbnailUrl(components.device4.imageUrl));
             }
         }
     }
@@ -1302,8 +1350,8 @@ class NetworkDiagram {
             const transform = this.dragElement.getAttribute('transform');
             this.addLog(`Moved ${this.dragElement.id.replace('-', ' ')} - position saved`, 'success');
             
-            // Save positions to localStorage
-            this.saveComponentPositions();
+            // Save positions to localStorage; only the moved component goes to the server
+            this.saveComponentPositions(this.dragElement.id);
             
             // Add small delay before resetting drag state to prevent accidental clicks
             setTimeout(() => {
@@ -1363,7 +1411,7 @@ class NetworkDiagram {
         }
     }
     
-    saveComponentPositions() {
+    saveComponentPositions(movedId = null) {
         const positions = {};
         const draggableElements = ['raspberry-pi', 'network-switch', 'device-1', 'device-2', 'device-3', 'device-4'];
         
@@ -1384,11 +1432,12 @@ class NetworkDiagram {
         // Save to localStorage
         localStorage.setItem('componentPositions', JSON.stringify(positions));
         
-        // Also send to server
+        // Also send to server; it merges per component, so a drag only needs to send what moved
+        const update = movedId && positions[movedId] ? { [movedId]: positions[movedId] } : positions;
         fetch('/save-positions', {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify(positions)
+            body: JSON.stringify(update)
         }).catch(error => {
             console.error('Error saving positions to server:', error);
         });
@@ -1396,8 +1445,9 @@ class NetworkDiagram {
     
     async loadComponentPositions() {
         try {
-            const response = await fetch('/load-positions');
-            const data = await response.json();
+            const data = this.bootstrap.positions
+                ? { ok: true, positions: this.bootstrap.positions }
+                : await (await fetch('/load-positions')).json();
             
             if (data.ok && data.positions && Object.keys(data.positions).length > 0) {
                 Object.entries(data.positions).forEach(([elementId, pos]) => {
@@ -1454,6 +1504,9 @@ class NetworkDiagram {
         if (this.eventSource) {
             this.eventSource.close();
         }
+        if (this.ledSocket) {
+            this.ledSocket.close();
+        }
     }
 }
 
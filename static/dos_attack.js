@@ -2,7 +2,7 @@
 class DOSAttackController {
     constructor() {
         this.isFloodActive = false;
-        this.statusInterval = null;
+        this.statusSource = null;
         this.animationInterval = null;
         this.init();
     }
@@ -132,6 +132,7 @@ class DOSAttackController {
                     this.addLog('info', `Final Statistics:`);
                     this.addLog('info', `• Packets sent: ${result.packets_sent.toLocaleString()}`);
                     this.addLog('info', `• Bytes sent: ${result.bytes_sent.toLocaleString()}`);
+                    this.addLog('info', `• Send errors: ${(result.errors || 0).toLocaleString()}`);
                     this.addLog('info', `• Duration: ${result.duration_seconds} seconds`);
                     this.addLog('info', `• Average bandwidth: ${result.average_bandwidth_mbps} Mbps`);
                 }
@@ -164,18 +165,21 @@ class DOSAttackController {
     }
     
     startStatusMonitoring() {
-        this.statusInterval = setInterval(async () => {
+        // Flood telemetry is pushed once a second as a named 'flood' event on the shared /events stream
+        this.stopStatusMonitoring();
+        this.statusSource = new EventSource('/events');
+        this.statusSource.addEventListener('flood', (event) => {
             try {
-                const response = await fetch('/dos/flood-status');
-                const result = await response.json();
+                const result = JSON.parse(event.data);
                 
                 if (result.ok && result.active) {
                     // Update bandwidth display
                     const bandwidthDisplay = document.getElementById('bandwidth-display');
                     bandwidthDisplay.innerHTML = `
                         Target: 80 Mbps<br>
-                        Current: ${result.current_bandwidth_mbps || 0} Mbps<br>
-                        Packets: ${(result.packets_sent || 0).toLocaleString()}
+                        Current: ${result.current_bandwidth_mbps || 0} Mbps (avg ${result.ewma_bandwidth_mbps || 0})<br>
+                        Packets: ${(result.packets_sent || 0).toLocaleString()} (${(result.current_pps || 0).toLocaleString()}/s)<br>
+                        Errors: ${(result.errors || 0).toLocaleString()}
                     `;
                     bandwidthDisplay.classList.add('active');
                     
@@ -194,13 +198,13 @@ class DOSAttackController {
             } catch (error) {
                 console.error('Status monitoring error:', error);
             }
-        }, 1000); // Update every second
+        });
     }
     
     stopStatusMonitoring() {
-        if (this.statusInterval) {
-            clearInterval(this.statusInterval);
-            this.statusInterval = null;
+        if (this.statusSource) {
+            this.statusSource.close();
+            this.statusSource = null;
         }
         
         // Reset target status indicator (device-1 is the DOS target)
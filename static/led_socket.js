@@ -0,0 +1,95 @@
+// LED control channel over WebSocket (/ws, JSON encoding)
+// Pin and animation commands and LED status pushes share one connection; callers fall back to
+// the HTTP routes while the socket is not open. Reconnects with backoff after the server goes away.
+class LedSocket {
+    constructor({ onStatus = null, onEvent = null, onOpen = null, onClose = null } = {}) {
+        this.onStatus = onStatus;
+        this.onEvent = onEvent;
+        this.onOpen = onOpen;
+        this.onClose = onClose;
+        this.socket = null;
+        this.nextId = 1;
+        this.pending = new Map();
+        this.retryDelay = 1000;
+        this.closed = false;
+
+        this.connect();
+    }
+
+    get isOpen() {
+        return this.socket !== null && this.socket.readyState === WebSocket.OPEN;
+    }
+
+    connect() {
+        const scheme = window.location.protocol === 'https:' ? 'wss' : 'ws';
+        this.socket = new WebSocket(`${scheme}://${window.location.host}/ws`, 'led.json');
+
+        this.socket.onopen = () => {
+            this.retryDelay = 1000;
+            if (this.onOpen) {
+                this.onOpen();
+            }
+        };
+
+        this.socket.onmessage = (event) => {
+            try {
+                this.handleMessage(JSON.parse(event.data));
+            } catch (error) {
+                console.error('Error parsing LED socket message:', error);
+            }
+        };
+
+        this.socket.onclose = () => {
+            this.pending.forEach(({ reject }) => reject(new Error('LED socket closed')));
+            this.pending.clear();
+            if (this.closed) {
+                return;
+            }
+            if (this.onClose) {
+                this.onClose();
+            }
+            setTimeout(() => this.connect(), this.retryDelay);
+            this.retryDelay = Math.min(this.retryDelay * 2, 30000);
+        };
+    }
+
+    handleMessage(message) {
+        if (message.event === 'status') {
+            if (this.onStatus) {
+                this.onStatus(message);
+            }
+        } else if (message.event) {
+            if (this.onEvent) {
+                this.onEvent(message.event, message.data);
+            }
+        } else if (this.pending.has(message.id)) {
+            const { resolve } = this.pending.get(message.id);
+            this.pending.delete(message.id);
+            resolve(message);
+        }
+    }
+
+    // Send a command such as {op: 'pins', on: ['17']}; resolves with the server's reply
+    send(command) {
+        const id = this.nextId++;
+        return new Promise((resolve, reject) => {
+            const timer = setTimeout(() => {
+                if (this.pending.delete(id)) {
+                    reject(new Error('LED socket timeout'));
+                }
+            }, 5000);
+            this.pending.set(id, {
+                resolve: (reply) => { clearTimeout(timer); resolve(reply); },
+                reject: (error) => { clearTimeout(timer); reject(error); }
+            });
+            this.socket.send(JSON.stringify({ ...command, id }));
+        });
+    }
+
+    close() {
+        this.closed = true;
+        if (this.socket) {
+            this.socket.close();
+        }
+    }
+}
@@ -2,6 +2,7 @@
 class SettingsController {
     constructor() {
         this.eventSource = null;
+        this.ledSocket = null;
         this.currentWaveSpeed = 2.0;
         this.currentPattern = 'forward';
         this.isWaveRunning = false;
@@ -49,8 +50,27 @@ class SettingsController {
         return patterns[pattern] || 'Forward';
     }
     
-    // LED Monitoring via Server-Sent Events
+    // LED Monitoring via the control socket; Server-Sent Events while it is not connected
     startLEDMonitoring() {
+        this.ledSocket = new LedSocket({
+            onStatus: (data) => this.updateLEDStatus(data),
+            onOpen: () => this.stopEventSource(),
+            onClose: () => {
+                if (!this.eventSource) {
+                    this.startEventSource();
+                }
+            }
+        });
+    }
+    
+    stopEventSource() {
+        if (this.eventSource) {
+            this.eventSource.close();
+            this.eventSource = null;
+        }
+    }
+    
+    startEventSource() {
         if (this.eventSource) {
             this.eventSource.close();
         }
@@ -70,8 +90,8 @@ class SettingsController {
             console.error('LED monitoring connection error:', error);
             // Reconnect after 5 seconds
             setTimeout(() => {
-                if (this.eventSource.readyState === EventSource.CLOSED) {
-                    this.startLEDMonitoring();
+                if (this.eventSource && this.eventSource.readyState === EventSource.CLOSED) {
+                    this.startEventSource();
                 }
             }, 5000);
         };
@@ -133,9 +153,10 @@ class SettingsController {
     
     // Cleanup
     destroy() {
-        if (this.eventSource) {
-            this.eventSource.close();
+        if (this.ledSocket) {
+            this.ledSocket.close();
         }
+        this.stopEventSource();
     }
 }
 
@@ -154,21 +175,25 @@ window.addEventListener('beforeunload', function() {
     }
 });
 
+// Send over the LED control socket when it is open, otherwise use the HTTP route
+async function ledCommand(command, endpoint) {
+    const socket = settingsController.ledSocket;
+    if (socket && socket.isOpen) {
+        return socket.send(command);
+    }
+    const response = await fetch(endpoint);
+    return response.json();
+}
+
 // GPIO Testing Functions
 async function testGPIO(pin, action) {
     const actionText = action === 'on' ? 'ON' : 'OFF';
     settingsController.addTestLog(`Testing GPIO ${pin}: ${actionText}`, 'info');
     
     try {
-        let endpoint;
-        if (action === 'on') {
-            endpoint = `/on${pin}`;
-        } else {
-            endpoint = '/off';
-        }
-        
-        const response = await fetch(endpoint);
-        const data = await response.json();
+        const data = action === 'on'
+            ? await ledCommand({ op: 'pins', on: [String(pin)] }, `/on${pin}`)
+            : await ledCommand({ op: 'off' }, '/off');
         
         if (data.ok) {
             settingsController.addTestLog(`GPIO ${pin} test successful: ${actionText}`, 'success');
@@ -187,7 +212,7 @@ async function runTestSequence() {
     
     try {
         // Turn all off first
-        await fetch('/off');
+        await ledCommand({ op: 'off' }, '/off');
         await new Promise(resolve => setTimeout(resolve, 500));
         
         // Test each pin in sequence
@@ -195,11 +220,11 @@ async function runTestSequence() {
             settingsController.addTestLog(`Testing GPIO ${pin}...`, 'info');
             
             // Turn on
-            await fetch(`/on${pin}`);
+            await ledCommand({ op: 'pins', on: [String(pin)] }, `/on${pin}`);
             await new Promise(resolve => setTimeout(resolve, 600));
             
             // Turn off
-            await fetch('/off');
+            await ledCommand({ op: 'off' }, '/off');
             await new Promise(resolve => setTimeout(resolve, 200));
         }
         
@@ -216,10 +241,10 @@ async function allGPIOOn() {
     const pins = [17, 27, 22, 10, 9, 5, 6, 26, 16, 14, 18, 23, 24, 25, 20];
     
     try {
-        // Turn on each pin
-        for (const pin of pins) {
-            await fetch(`/on${pin}`);
-            await new Promise(resolve => setTimeout(resolve, 50));
+        // One command lights every pin as a single frame
+        const data = await ledCommand({ op: 'pins', on: pins.map(String) }, `/pins?on=${pins.join(',')}`);
+        if (!data.ok) {
+            throw new Error(data.error || 'request failed');
         }
         
         settingsController.addTestLog('All GPIOs turned ON', 'success');
@@ -233,8 +258,7 @@ async function allGPIOOff() {
     settingsController.addTestLog('Turning all GPIOs OFF...', 'info');
     
     try {
-        const response = await fetch('/off');
-        const data = await response.json();
+        const data = await ledCommand({ op: 'off' }, '/off');
         
         if (data.ok) {
             settingsController.addTestLog('All GPIOs turned OFF', 'success');
@@ -254,25 +278,32 @@ async function startWaveAnimation() {
     
     try {
         let endpoint;
+        let anim;
         if (pattern === 'forward') {
             endpoint = `/wave/forward?hz=${speed}`;
+            anim = 'wave';
         } else if (pattern === 'backward') {
             // For backward, we'll use roundtrip but only show the return part
             endpoint = `/wave/roundtrip?hz=${speed}`;
+            anim = 'roundtrip';
         } else if (pattern === 'roundtrip') {
             endpoint = `/wave/roundtrip?hz=${speed}`;
+            anim = 'roundtrip';
         } else if (pattern === 'bounce') {
+            // Three roundtrips in a row; only the HTTP route plays it
             endpoint = `/wave/bounce?hz=${speed}`;
         } else {
             // Default to continuous chaser
             endpoint = `/start?hz=${speed}`;
+            anim = 'chaser';
         }
         
-        const response = await fetch(endpoint);
-        const data = await response.json();
+        const data = anim
+            ? await ledCommand({ op: 'play', anim, hz: speed }, endpoint)
+            : await (await fetch(endpoint)).json();
         
         if (data.ok) {
-            settingsController.addTestLog(`${data.anim} started at ${data.hz} Hz`, 'success');
+            settingsController.addTestLog(`${pattern} animation started at ${speed} Hz`, 'success');
             if (pattern === 'forward' || pattern === 'roundtrip' || pattern === 'bounce') {
                 settingsController.updateWaveStatus('Completed');
             } else {
@@ -290,8 +321,7 @@ async function stopWaveAnimation() {
     settingsController.addTestLog('Stopping wave animation...', 'info');
     
     try {
-        const response = await fetch('/stop');
-        const data = await response.json();
+        const data = await ledCommand({ op: 'stop' }, '/stop');
         
         if (data.ok) {
             settingsController.addTestLog('Wave animation stopped', 'success');
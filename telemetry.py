@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Rate telemetry for Raspberry Pi LED Server
+Single-writer per-thread counters rolled up by a 1-second ticker into a fixed-size history ring
+"""
+
+import threading
+import time
+
+PACKETS, BYTES, ERRORS = 0, 1, 2
+
+
+class RateTelemetry:
+    def __init__(self, history_seconds=120, ewma_alpha=0.3, on_tick=None, name="telemetry"):
+        """Initialize counters; call start() to begin the once-a-second roll-up"""
+        self.history_seconds = history_seconds
+        self.ewma_alpha = ewma_alpha
+        self.on_tick = on_tick
+        self.name = name
+        self.started_at = time.time()
+
+        # One [packets, bytes, errors] list per writer thread; only its owner ever mutates it
+        self._shards = []
+        self._shards_lock = threading.Lock()
+        self._local = threading.local()
+
+        # Ring of (epoch second, packets, bytes, errors) written only by the ticker
+        self._ring = [None] * history_seconds
+        self._head = 0
+        self._last_totals = (0, 0, 0)
+        self._ewma_pps = 0.0
+        self._ewma_bps = 0.0
+        self._latest = None
+
+        self._stop = threading.Event()
+        self._ticker = None
+
+    def shard(self):
+        """The calling thread's counter list; increment shard[PACKETS] etc. without locking"""
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = [0, 0, 0]
+            with self._shards_lock:
+                self._shards.append(shard)
+            self._local.shard = shard
+        return shard
+
+    def totals(self):
+        """Lifetime (packets, bytes, errors) summed across shards"""
+        with self._shards_lock:
+            shards = list(self._shards)
+        packets = bytes_ = errors = 0
+        for shard in shards:
+            packets += shard[PACKETS]
+            bytes_ += shard[BYTES]
+            errors += shard[ERRORS]
+        return packets, bytes_, errors
+
+    def start(self):
+        """Start the ticker thread"""
+        self._ticker = threading.Thread(target=self._run, name=f"{self.name}-ticker", daemon=True)
+        self._ticker.start()
+
+    def stop(self):
+        """Stop the ticker after recording the final partial second"""
+        if self._stop.is_set():
+            return
+        self._stop.set()
+        if self._ticker and self._ticker is not threading.current_thread():
+            self._ticker.join(timeout=2.0)
+
+    @property
+    def running(self):
+        return not self._stop.is_set()
+
+    def _run(self):
+        next_tick = time.monotonic() + 1.0
+        while not self._stop.wait(max(0.0, next_tick - time.monotonic())):
+            self._tick(1.0)
+            next_tick += 1.0
+            # If the Pi stalled for several seconds, resynchronise rather than burst ticks
+            if next_tick < time.monotonic():
+                next_tick = time.monotonic() + 1.0
+        self._tick(1.0)
+
+    def _tick(self, period):
+        totals = self.totals()
+        delta = tuple(now - before for now, before in zip(totals, self._last_totals))
+        self._last_totals = totals
+        sample = (int(time.time()), delta[PACKETS], delta[BYTES], delta[ERRORS])
+        self._ring[self._head] = sample
+        self._head = (self._head + 1) % self.history_seconds
+
+        pps = delta[PACKETS] / period
+        bps = delta[BYTES] / period
+        if self._latest is None:
+            self._ewma_pps, self._ewma_bps = pps, bps
+        else:
+            self._ewma_pps += self.ewma_alpha * (pps - self._ewma_pps)
+            self._ewma_bps += self.ewma_alpha * (bps - self._ewma_bps)
+        self._latest = sample
+
+        if self.on_tick is not None:
+            self.on_tick(self)
+
+    def history(self, seconds=None):
+        """Per-second samples, oldest first, as dicts"""
+        seconds = self.history_seconds if seconds is None else max(0, min(int(seconds), self.history_seconds))
+        head = self._head
+        ordered = self._ring[head:] + self._ring[:head]
+        samples = [s for s in ordered if s is not None]
+        if seconds < len(samples):
+            samples = samples[len(samples) - seconds:] if seconds else []
+        return [{"t": t, "packets": p, "bytes": b, "errors": e} for t, p, b, e in samples]
+
+    def snapshot(self, history_seconds=0):
+        """Totals, instantaneous and EWMA rates, plus optional history"""
+        packets, bytes_, errors = self.totals()
+        latest = self._latest or (int(time.time()), 0, 0, 0)
+        snap = {
+            "packets_sent": packets,
+            "bytes_sent": bytes_,
+            "errors": errors,
+            "current_pps": latest[PACKETS + 1],
+            "current_bytes_per_second": latest[BYTES + 1],
+            "current_errors_per_second": latest[ERRORS + 1],
+            "ewma_pps": round(self._ewma_pps, 1),
+            "ewma_bytes_per_second": round(self._ewma_bps, 1),
+        }
+        if history_seconds:
+            snap["history"] = self.history(history_seconds)
+        return snap
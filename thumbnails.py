@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Thumbnails for Raspberry Pi LED Server
+Background stage that renders diagram-sized WebP (or PNG) variants of raster images;
+needs Pillow, and without it the originals are served unchanged. Pillow is imported by the
+worker, off the startup path; originals are served until it is loaded
+"""
+
+import io
+import logging
+import os
+import queue
+import threading
+from config import *
+from metrics import METRICS
+
+log = logging.getLogger(__name__)
+
+_THUMBS = METRICS.counter("thumbnails_generated_total", "Thumbnails rendered", ("format",))
+
+RASTER_MIMETYPES = {"image/png", "image/jpeg", "image/gif", "image/webp"}
+
+
+def _import_pillow():
+    """Pillow's Image and features modules, or (None, None) if it is not installed"""
+    try:
+        from PIL import Image, features
+    except ImportError:
+        return None, None
+    return Image, features
+
+
+class Thumbnail:
+    __slots__ = ("path", "mimetype", "size", "mtime")
+
+    def __init__(self, path, mimetype, size, mtime):
+        self.path = path
+        self.mimetype = mimetype
+        self.size = size
+        self.mtime = mtime
+
+
+class Thumbnailer:
+    def __init__(self, catalog, thumb_dir, max_size=THUMBNAIL_MAX_SIZE):
+        """Initialize thumbnailer for images in `catalog`; call start() to run the worker"""
+        self.catalog = catalog
+        self.thumb_dir = thumb_dir
+        self.max_size = max_size
+        self.available = False  # set by the worker once Pillow is loaded
+        self.format = "PNG"
+        self._image = None
+        self._ready = {}
+        self._queued = set()
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._worker = None
+
+    def _name(self, entry):
+        return f"{entry.sha256[:16]}-{self.max_size}.{self.format.lower()}"
+
+    def _wanted(self, entry):
+        """Only raster images larger than the diagram draws them are worth a variant"""
+        if not self.available or entry.mimetype not in RASTER_MIMETYPES:
+            return False
+        if entry.width is None or entry.height is None:
+            return True
+        return max(entry.width, entry.height) > self.max_size
+
+    def lookup(self, entry):
+        """Thumbnail for a catalog entry, or None (serve the original) while it is pending or not needed"""
+        thumb = self._ready.get(entry.sha256)
+        if thumb is None and self._wanted(entry):
+            self.ensure(entry)
+        return thumb or None
+
+    def ensure(self, entry):
+        """Queue a thumbnail render unless one exists or is pending"""
+        if not self._wanted(entry):
+            return
+        with self._lock:
+            if entry.sha256 in self._ready or entry.sha256 in self._queued:
+                return
+            self._queued.add(entry.sha256)
+        self._queue.put(entry)
+
+    def discard(self, entry):
+        thumb = self._ready.pop(entry.sha256, None)
+        if thumb:
+            try:
+                os.remove(thumb.path)
+            except FileNotFoundError:
+                pass
+
+    def pending(self):
+        """Renders queued or in progress"""
+        with self._lock:
+            return len(self._queued)
+
+    def start(self):
+        """Start the worker; it loads Pillow, then queues every catalog image that needs a variant"""
+        self._worker = threading.Thread(target=self._run, name="thumbnailer", daemon=True)
+        self._worker.start()
+        return self
+
+    def _load(self):
+        Image, features = _import_pillow()
+        if Image is None:
+            log.info("Pillow not installed; images are served at full size")
+            return False
+        self._image = Image
+        self.format = "WEBP" if features.check("webp") else "PNG"
+        os.makedirs(self.thumb_dir, exist_ok=True)
+        self.available = True
+        for entry in self.catalog.entries():
+            self.ensure(entry)
+        return True
+
+    def _run(self):
+        if not self._load():
+            return
+        while True:
+            entry = self._queue.get()
+            try:
+                self._render(entry)
+            except Exception as e:
+                log.warning("Thumbnail for %s failed: %s", entry.filename, e)
+            finally:
+                with self._lock:
+                    self._queued.discard(entry.sha256)
+
+    def _render(self, entry):
+        path = os.path.join(self.thumb_dir, self._name(entry))
+        if not os.path.exists(path):
+            with self._image.open(self.catalog.path(entry)) as img:
+                img.thumbnail((self.max_size, self.max_size), self._image.LANCZOS)
+                if self.format == "WEBP":
+                    if img.mode not in ("RGB", "RGBA"):
+                        img = img.convert("RGBA" if "transparency" in img.info or img.mode in ("LA", "P") else "RGB")
+                    buf = io.BytesIO()
+                    img.save(buf, "WEBP", quality=80, method=4)
+                else:
+                    buf = io.BytesIO()
+                    img.save(buf, "PNG", optimize=True)
+            data = buf.getvalue()
+            if len(data) >= entry.size:
+                # Already compact at full size; keep serving the original
+                self._ready[entry.sha256] = False
+                return
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+            _THUMBS.labels(self.format.lower()).inc()
+            log.debug("Thumbnail %s -> %s (%d -> %d bytes)", entry.filename, path, entry.size, len(data))
+        st = os.stat(path)
+        self._ready[entry.sha256] = Thumbnail(path, f"image/{self.format.lower()}", st.st_size, st.st_mtime)
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Image uploads for Raspberry Pi LED Server
+Multipart file parts are streamed once, straight into the images folder, hashed on the way in
+and committed under a content-addressed name so duplicate uploads share one file
+"""
+
+import hashlib
+import os
+import tempfile
+from flask import Request
+from metrics import METRICS
+
+_UPLOAD_BYTES = METRICS.counter("image_upload_bytes_written_total", "Bytes written to disk by image uploads")
+_UPLOADS = METRICS.counter("image_uploads_total", "Image uploads by outcome", ("result",))
+
+
+class HashingUpload:
+    """Writable temp file in the destination folder that hashes and counts what the form parser writes"""
+
+    def __init__(self, directory):
+        fd, self.tmp_path = tempfile.mkstemp(dir=directory, prefix=".upload-")
+        self._file = os.fdopen(fd, "w+b")
+        self._sha256 = hashlib.sha256()
+        self.size = 0
+        self.committed = False
+
+    def write(self, data):
+        self._sha256.update(data)
+        self.size += len(data)
+        _UPLOAD_BYTES.inc(len(data))
+        return self._file.write(data)
+
+    def hexdigest(self):
+        return self._sha256.hexdigest()
+
+    def commit(self, final_path):
+        """Move the upload to final_path; returns False if identical content was already stored there"""
+        if os.path.exists(final_path):
+            self.close()
+            _UPLOADS.labels("duplicate").inc()
+            return False
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        os.replace(self.tmp_path, final_path)
+        self.committed = True
+        self._file.close()
+        _UPLOADS.labels("stored").inc()
+        return True
+
+    def close(self):
+        if "_file" not in self.__dict__:
+            return
+        if not self._file.closed:
+            self._file.close()
+        if not self.committed:
+            try:
+                os.unlink(self.tmp_path)
+            except FileNotFoundError:
+                pass
+
+    def __del__(self):
+        # Parts abandoned mid-parse (e.g. the request hit the size cap) never reach commit()
+        self.close()
+
+    # The multipart parser and FileStorage treat this as an ordinary file object
+    def seek(self, *args):
+        return self._file.seek(*args)
+
+    def tell(self):
+        return self._file.tell()
+
+    def read(self, *args):
+        return self._file.read(*args)
+
+    def flush(self):
+        return self._file.flush()
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self._file, name)
+
+
+class UploadRequest(Request):
+    """Request whose uploaded file parts go directly into `upload_dir` instead of a spooled temp file"""
+
+    upload_dir = None
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if self.upload_dir is None:
+            return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+        return HashingUpload(self.upload_dir)
@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+WebSocket (RFC 6455) for Raspberry Pi LED Server
+Handshake, framing, ping and close handling on the connection Werkzeug's request handler already
+owns, so both server modes can upgrade a request without another dependency; connect() is a
+minimal client for benchmarks and scripts
+"""
+
+import base64
+import hashlib
+import os
+import socket
+import struct
+import threading
+import time
+from flask import Response
+from config import *
+
+GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+OP_CONTINUATION = 0x0
+OP_TEXT = 0x1
+OP_BINARY = 0x2
+OP_CLOSE = 0x8
+OP_PING = 0x9
+OP_PONG = 0xA
+
+CLOSE_NORMAL = 1000
+CLOSE_PROTOCOL_ERROR = 1002
+CLOSE_TOO_BIG = 1009
+
+_U16 = struct.Struct("!H")
+_U64 = struct.Struct("!Q")
+
+
+class WebSocketError(Exception):
+    """Protocol violation by the peer; the connection is closed with `code`"""
+
+    def __init__(self, message, code=CLOSE_PROTOCOL_ERROR):
+        super().__init__(message)
+        self.code = code
+
+
+def accept_key(key):
+    return base64.b64encode(hashlib.sha1((key + GUID).encode("ascii")).digest()).decode("ascii")
+
+
+def handshake_error(environ):
+    """Why the request cannot be upgraded, or None if it can"""
+    if "werkzeug.socket" not in environ:
+        return "WebSocket needs the built-in server (SERVER_MODE)"
+    if environ.get("HTTP_UPGRADE", "").lower() != "websocket":
+        return "Expected a WebSocket upgrade request"
+    if "upgrade" not in environ.get("HTTP_CONNECTION", "").lower():
+        return "Expected Connection: Upgrade"
+    if environ.get("HTTP_SEC_WEBSOCKET_VERSION") != "13":
+        return "Unsupported WebSocket version; use 13"
+    if not environ.get("HTTP_SEC_WEBSOCKET_KEY"):
+        return "Missing Sec-WebSocket-Key"
+    return None
+
+
+def choose_protocol(environ, supported):
+    """First of the client's requested subprotocols that is supported, or None"""
+    requested = [p.strip() for p in environ.get("HTTP_SEC_WEBSOCKET_PROTOCOL", "").split(",") if p.strip()]
+    for protocol in requested:
+        if protocol in supported:
+            return protocol
+    return None
+
+
+def _mask(payload, key):
+    """XOR payload with the repeating 4-byte key, a whole message at a time"""
+    if not payload:
+        return payload
+    n = len(payload)
+    repeated = (key * (n // 4 + 1))[:n]
+    return (int.from_bytes(payload, "big") ^ int.from_bytes(repeated, "big")).to_bytes(n, "big")
+
+
+class WebSocket:
+    def __init__(self, sock, rfile, client=False, max_message=WS_MAX_MESSAGE_BYTES):
+        """Initialize over an upgraded connection; clients mask what they send, servers require masking"""
+        self.sock = sock
+        self.rfile = rfile
+        self.client = client
+        self.max_message = max_message
+        self.closed = False
+        self.last_seen = time.monotonic()
+        self._send_lock = threading.Lock()
+
+    def _read_exact(self, n):
+        data = self.rfile.read(n)
+        if len(data) < n:
+            raise ConnectionError("WebSocket connection closed")
+        return data
+
+    def _read_frame(self):
+        b0, b1 = self._read_exact(2)
+        fin, opcode, masked, length = b0 & 0x80, b0 & 0x0F, b1 & 0x80, b1 & 0x7F
+        if b0 & 0x70:
+            raise WebSocketError("Reserved bits set")
+        if masked != (0 if self.client else 0x80):
+            raise WebSocketError("Client frames must be masked" if not self.client else "Server frames must not be masked")
+        if length == 126:
+            length = _U16.unpack(self._read_exact(2))[0]
+        elif length == 127:
+            length = _U64.unpack(self._read_exact(8))[0]
+        if opcode >= OP_CLOSE and (length > 125 or not fin):
+            raise WebSocketError("Invalid control frame")
+        if length > self.max_message:
+            raise WebSocketError("Message too big", CLOSE_TOO_BIG)
+        key = self._read_exact(4) if masked else None
+        payload = self._read_exact(length) if length else b""
+        if key:
+            payload = _mask(payload, key)
+        self.last_seen = time.monotonic()
+        return bool(fin), opcode, payload
+
+    def receive(self):
+        """Next text (str) or binary (bytes) message; None once the connection is closed.
+        Pings are answered and pongs consumed along the way"""
+        message, message_opcode = [], None
+        while not self.closed:
+            try:
+                fin, opcode, payload = self._read_frame()
+            except WebSocketError as e:
+                self.close(e.code, str(e))
+                return None
+            except (ConnectionError, OSError, ValueError):
+                # ValueError: the socket was closed under a blocked read
+                self.closed = True
+                return None
+            if opcode == OP_PING:
+                self._send_frame(OP_PONG, payload)
+                continue
+            if opcode == OP_PONG:
+                continue
+            if opcode == OP_CLOSE:
+                code = _U16.unpack(payload[:2])[0] if len(payload) >= 2 else CLOSE_NORMAL
+                self.close(code)
+                return None
+            if opcode == OP_CONTINUATION:
+                if message_opcode is None:
+                    self.close(CLOSE_PROTOCOL_ERROR, "Unexpected continuation")
+                    return None
+            elif message_opcode is not None:
+                self.close(CLOSE_PROTOCOL_ERROR, "Expected continuation")
+                return None
+            elif opcode in (OP_TEXT, OP_BINARY):
+                message_opcode = opcode
+            else:
+                self.close(CLOSE_PROTOCOL_ERROR, "Unknown opcode")
+                return None
+            message.append(payload)
+            if sum(len(part) for part in message) > self.max_message:
+                self.close(CLOSE_TOO_BIG, "Message too big")
+                return None
+            if fin:
+                data = b"".join(message)
+                if message_opcode == OP_TEXT:
+                    try:
+                        return data.decode("utf-8")
+                    except UnicodeDecodeError:
+                        self.close(1007, "Invalid UTF-8")
+                        return None
+                return data
+        return None
+
+    def _send_frame(self, opcode, payload):
+        length = len(payload)
+        if length < 126:
+            header = bytes((0x80 | opcode, length))
+        elif length < 65536:
+            header = bytes((0x80 | opcode, 126)) + _U16.pack(length)
+        else:
+            header = bytes((0x80 | opcode, 127)) + _U64.pack(length)
+        if self.client:
+            key = os.urandom(4)
+            header = bytes((header[0], header[1] | 0x80)) + header[2:] + key
+            payload = _mask(payload, key)
+        with self._send_lock:
+            self.sock.sendall(header + payload)
+
+    def send(self, data):
+        """Send str as a text message and bytes as a binary one"""
+        if isinstance(data, str):
+            self._send_frame(OP_TEXT, data.encode("utf-8"))
+        else:
+            self._send_frame(OP_BINARY, data)
+
+    def ping(self, payload=b""):
+        self._send_frame(OP_PING, payload)
+
+    def close(self, code=CLOSE_NORMAL, reason=""):
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            self._send_frame(OP_CLOSE, _U16.pack(code) + reason.encode("utf-8")[:123])
+        except OSError:
+            pass
+
+    def abort(self):
+        """Drop the connection at once, e.g. after the peer stopped answering pings"""
+        self.closed = True
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+
+class WebSocketResponse(Response):
+    """Completes the upgrade and runs `handler(ws)` for the life of the connection.
+    The server must not write a response or read another request afterwards; raising
+    ConnectionAbortedError makes Werkzeug's handler treat the connection as dropped"""
+
+    def __init__(self, handler, protocol=None):
+        super().__init__(status=101)
+        self.handler = handler
+        self.protocol = protocol
+
+    def __call__(self, environ, start_response):
+        sock = environ["werkzeug.socket"]
+        lines = [
+            "HTTP/1.1 101 Switching Protocols",
+            "Upgrade: websocket",
+            "Connection: Upgrade",
+            f"Sec-WebSocket-Accept: {accept_key(environ['HTTP_SEC_WEBSOCKET_KEY'])}",
+        ]
+        if self.protocol:
+            lines.append(f"Sec-WebSocket-Protocol: {self.protocol}")
+        # The server's request timeouts do not apply to a long-lived connection; liveness is checked with pings
+        sock.settimeout(None)
+        sock.sendall(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+        ws = WebSocket(sock, environ["wsgi.input"])
+        try:
+            self.handler(ws)
+        finally:
+            ws.close()
+            ws.abort()
+        raise ConnectionAbortedError("WebSocket closed")
+
+
+def connect(host, port, path="/ws", protocol=None, timeout=10.0):
+    """Client connection to a WebSocket endpoint; returns a WebSocket"""
+    sock = socket.create_connection((host, port), timeout=timeout)
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    key = base64.b64encode(os.urandom(16)).decode("ascii")
+    lines = [f"GET {path} HTTP/1.1", f"Host: {host}:{port}", "Upgrade: websocket", "Connection: Upgrade",
+             f"Sec-WebSocket-Key: {key}", "Sec-WebSocket-Version: 13"]
+    if protocol:
+        lines.append(f"Sec-WebSocket-Protocol: {protocol}")
+    sock.sendall(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+    rfile = sock.makefile("rb")
+    status = rfile.readline()
+    headers = {}
+    while True:
+        line = rfile.readline()
+        if line in (b"\r\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    if not status.startswith(b"HTTP/1.1 101") or headers.get("sec-websocket-accept") != accept_key(key):
+        sock.close()
+        raise ConnectionError(f"WebSocket handshake failed: {status.decode('latin-1').strip()}")
+    sock.settimeout(None)
+    return WebSocket(sock, rfile, client=True)
@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+WebSocket control channel for Raspberry Pi LED Server
+One connection per client carries pin and animation commands and receives LED status and events,
+in one of two encodings chosen with Sec-WebSocket-Protocol:
+
+  led.binary  every message is 4 bytes: op (B), tag (B), arg (H)
+              client  PINS arg=mask (bit i lights PIN_TABLE[i]), OFF, STOP, STATUS,
+                      CHASER / WAVE / ROUNDTRIP arg=hz*100
+              server  op|0x80, tag, mask of lit pins: the reply to a command (tag echoed) or a status
+                      change (tag 0); ERROR, tag, 0 for a rejected command
+  led.json    (default) {"op": "pins", "on": ["17", "27"], "id": 1}, {"op": "off"}, {"op": "stop"},
+              {"op": "status"}, {"op": "play", "anim": "chaser" | "wave" | "roundtrip", "hz": 2};
+              replies {"id", "ok", "pins"}, status changes {"event": "status", "pins"}
+
+Event bus events (flood telemetry, cluster boards) are pushed to both as JSON text messages
+{"event": name, "data": payload}. LED status is read by one StatusWatcher thread shared by every connection
+"""
+
+import json
+import logging
+import math
+import queue
+import struct
+import threading
+import time
+from config import *
+from event_bus import EVENTS
+from metrics import METRICS
+
+log = logging.getLogger(__name__)
+
+MESSAGE = struct.Struct("!BBH")
+
+OP_PINS = 1
+OP_OFF = 2
+OP_STOP = 3
+OP_STATUS = 4
+OP_CHASER = 5
+OP_WAVE = 6
+OP_ROUNDTRIP = 7
+OP_ERROR = 0x7F
+REPLY = 0x80
+
+PROTOCOL_BINARY = "led.binary"
+PROTOCOL_JSON = "led.json"
+PROTOCOLS = (PROTOCOL_BINARY, PROTOCOL_JSON)
+
+_OP_NAMES = {OP_PINS: "pins", OP_OFF: "off", OP_STOP: "stop", OP_STATUS: "status",
+             OP_CHASER: "chaser", OP_WAVE: "wave", OP_ROUNDTRIP: "roundtrip"}
+_ANIMATIONS = {"chaser": OP_CHASER, "wave": OP_WAVE, "roundtrip": OP_ROUNDTRIP}
+
+_WS_CLIENTS = METRICS.gauge("ws_clients", "Open WebSocket control connections")
+_WS_COMMANDS = METRICS.counter("ws_commands_total", "Commands received over WebSocket", ("op",))
+
+# Queue entry carrying a status change (None, mask) alongside the bus's (event, data) tuples
+_STATUS = None
+
+
+def current_mask(gpio):
+    """Bitmask over PIN_NAMES of the pins lit now"""
+    pins = gpio.get_status()["pins"]
+    mask = 0
+    for i, name in enumerate(PIN_NAMES):
+        if pins.get(name):
+            mask |= 1 << i
+    return mask
+
+
+def _offer(q, item):
+    """Queue without blocking; a full queue loses its oldest entry, as on the event bus"""
+    try:
+        q.put_nowait(item)
+    except queue.Full:
+        try:
+            q.get_nowait()
+            q.put_nowait(item)
+        except (queue.Empty, queue.Full):
+            pass
+
+
+class StatusWatcher:
+    """Reads LED status every WS_STATUS_INTERVAL while any connection listens and queues each change to all
+    of them, so the controller (or the GPIO daemon) is polled once per interval however many clients are open"""
+
+    def __init__(self, gpio, interval=WS_STATUS_INTERVAL):
+        self.gpio = gpio
+        self.interval = interval
+        self._listeners = set()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._mask = None
+
+    def add(self, q):
+        """Queue (None, mask) on `q` now and whenever the lit pins change"""
+        with self._lock:
+            self._listeners.add(q)
+            if self._mask is not None:
+                _offer(q, (_STATUS, self._mask))
+            if self._thread is None:
+                self._mask = None
+                self._thread = threading.Thread(target=self._loop, name="ws-status", daemon=True)
+                self._thread.start()
+
+    def remove(self, q):
+        with self._lock:
+            self._listeners.discard(q)
+
+    def _loop(self):
+        while True:
+            with self._lock:
+                if not self._listeners:
+                    self._thread = None
+                    return
+            try:
+                mask = current_mask(self.gpio)
+            except (OSError, RuntimeError) as e:
+                log.debug("LED status read failed: %s", e)
+                mask = self._mask
+            with self._lock:
+                if mask != self._mask:
+                    self._mask = mask
+                    for q in self._listeners:
+                        _offer(q, (_STATUS, mask))
+            time.sleep(self.interval)
+
+
+class ControlChannel:
+    """Serves one WebSocket connection: commands in on the request thread, pushes out from a second thread"""
+
+    def __init__(self, gpio, ws, protocol=PROTOCOL_JSON, watcher=None):
+        """Initialize channel; `watcher` is the StatusWatcher shared with the other connections"""
+        self.gpio = gpio
+        self.watcher = watcher if watcher is not None else StatusWatcher(gpio)
+        self.ws = ws
+        self.binary = protocol == PROTOCOL_BINARY
+        self._mask = None  # lit pins the client was last told about
+        self._mask_lock = threading.Lock()
+        self._done = threading.Event()
+        self._commands = {op: _WS_COMMANDS.labels(name) for op, name in _OP_NAMES.items()}
+        self._commands[OP_ERROR] = _WS_COMMANDS.labels("invalid")
+
+    def run(self):
+        # Label the pool thread while it serves this connection, and give its name back afterwards
+        thread = threading.current_thread()
+        pool_name, thread.name = thread.name, f"ws-control-{threading.get_ident()}"
+        _WS_CLIENTS.inc()
+        subscription = EVENTS.subscribe()
+        self.watcher.add(subscription)
+        pusher = threading.Thread(target=self._push_loop, args=(subscription,),
+                                  name=f"ws-push-{threading.get_ident()}", daemon=True)
+        pusher.start()
+        try:
+            while True:
+                message = self.ws.receive()
+                if message is None:
+                    break
+                if isinstance(message, bytes):
+                    self._handle_binary(message)
+                else:
+                    self._handle_json(message)
+        except OSError as e:
+            log.debug("WebSocket client gone: %s", e)
+        finally:
+            self._done.set()
+            pusher.join(1.0)
+            self.watcher.remove(subscription)
+            EVENTS.unsubscribe(subscription)
+            _WS_CLIENTS.dec()
+            thread.name = pool_name
+
+    def _execute(self, op, arg):
+        """Run a command; arg is the pin mask for PINS and hz*100 for animations. Returns False if rejected"""
+        self._commands[op].inc()
+        if op == OP_PINS:
+            if arg >> len(PIN_NAMES):
+                return False
+            return self.gpio.set_pins([name for i, name in enumerate(PIN_NAMES) if arg >> i & 1])
+        if op == OP_OFF:
+            self.gpio.stop_anim()
+            self.gpio._off_all()
+        elif op == OP_STOP:
+            self.gpio.stop_anim()
+        elif op == OP_CHASER:
+            return self.gpio.start_chaser(1.0 / max(0.1, arg / 100.0))
+        elif op in (OP_WAVE, OP_ROUNDTRIP):
+            if "degraded" in self.gpio.get_status():
+                return False
+            # One-shot waves block for their whole run, like /demo/packet they play in the background
+            animation = self.gpio.wave_once if op == OP_WAVE else self.gpio.roundtrip_wave
+            threading.Thread(target=self._play, args=(animation, 1.0 / max(0.1, arg / 100.0)),
+                             name=f"anim-ws-{_OP_NAMES[op]}", daemon=True).start()
+        return True
+
+    @staticmethod
+    def _play(animation, step_period):
+        """Run a one-shot wave on its own thread; the reply has gone already, so failures are only logged"""
+        try:
+            animation(step_period=step_period)
+        except (OSError, RuntimeError) as e:
+            log.warning("WebSocket %s failed: %s", animation.__name__, e)
+
+    def _reply_mask(self):
+        """Read back the lit pins and record them as seen, so the pusher does not repeat them"""
+        mask = current_mask(self.gpio)
+        with self._mask_lock:
+            self._mask = mask
+        return mask
+
+    def _handle_binary(self, message):
+        if len(message) != MESSAGE.size:
+            self._commands[OP_ERROR].inc()
+            self.ws.send(MESSAGE.pack(OP_ERROR, 0, 0))
+            return
+        op, tag, arg = MESSAGE.unpack(message)
+        if op not in _OP_NAMES or not self._execute(op, arg):
+            if op not in _OP_NAMES:
+                self._commands[OP_ERROR].inc()
+            self.ws.send(MESSAGE.pack(OP_ERROR, tag, 0))
+            return
+        self.ws.send(MESSAGE.pack(op | REPLY, tag, self._reply_mask()))
+
+    def _handle_json(self, message):
+        command = None
+        try:
+            command = json.loads(message)
+            name = command.get("op")
+            if name == "pins":
+                names = command.get("on") or []
+                unknown = [n for n in names if n not in PIN_NAMES]
+                if unknown:
+                    raise ValueError(f"Unknown pin(s): {', '.join(map(str, unknown))}")
+                op, arg = OP_PINS, sum(1 << PIN_NAMES.index(n) for n in set(names))
+            elif name == "play":
+                op = _ANIMATIONS.get(command.get("anim", "chaser"))
+                if op is None:
+                    raise ValueError(f"Unknown animation: {command.get('anim')}")
+                hz = float(command.get("hz", DEFAULT_WAVE_SPEED))
+                if not math.isfinite(hz):
+                    raise ValueError(f"hz must be a finite number, not {command.get('hz')!r}")
+                arg = min(0xFFFF, max(0, int(hz * 100)))
+            else:
+                op = {"off": OP_OFF, "stop": OP_STOP, "status": OP_STATUS}.get(name)
+                if op is None:
+                    raise ValueError(f"Unknown op: {name}")
+                arg = 0
+        except (ValueError, TypeError, AttributeError) as e:
+            self._commands[OP_ERROR].inc()
+            reply = {"ok": False, "error": str(e)}
+            if isinstance(command, dict) and "id" in command:
+                reply["id"] = command["id"]
+            self.ws.send(json.dumps(reply))
+            return
+        ok = self._execute(op, arg)
+        mask = self._reply_mask()
+        reply = {"ok": ok, "pins": {n: mask >> i & 1 for i, n in enumerate(PIN_NAMES)}}
+        if "id" in command:
+            reply["id"] = command["id"]
+        self.ws.send(json.dumps(reply))
+
+    def _push_status(self, mask):
+        if self.binary:
+            self.ws.send(MESSAGE.pack(OP_STATUS | REPLY, 0, mask))
+        else:
+            self.ws.send(json.dumps({"event": "status",
+                                     "pins": {n: mask >> i & 1 for i, n in enumerate(PIN_NAMES)}}))
+
+    def _push_loop(self, subscription):
+        """Push status changes from the watcher and bus events; ping and drop silent clients"""
+        next_ping = time.monotonic() + WS_PING_INTERVAL
+        try:
+            while not self._done.is_set():
+                # Wake at least every WS_STATUS_INTERVAL so a closed connection is noticed promptly
+                try:
+                    event, data = subscription.get(timeout=WS_STATUS_INTERVAL)
+                except queue.Empty:
+                    event = data = None
+                if event is not _STATUS:
+                    self.ws.send(json.dumps({"event": event, "data": data}))
+                elif data is not None:
+                    with self._mask_lock:
+                        changed = data != self._mask
+                        self._mask = data
+                    if changed:
+                        self._push_status(data)
+                now = time.monotonic()
+                if now >= next_ping:
+                    if now - self.ws.last_seen > 2 * WS_PING_INTERVAL:
+                        log.info("WebSocket client silent for %.0fs, closing", now - self.ws.last_seen)
+                        self.ws.abort()
+                        return
+                    self.ws.ping()
+                    next_ping = now + WS_PING_INTERVAL
+        except OSError as e:
+            log.debug("WebSocket push stopped: %s", e)
+            self.ws.abort()
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Production HTTP server for Raspberry Pi LED Server
+Werkzeug's WSGI handler on a bounded worker pool: one request per connection (Werkzeug closes every
+connection after its response), a listen backlog for bursts, and a timeout so stalled clients cannot
+hold workers forever
+"""
+
+import logging
+import os
+import signal
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+from config import *
+from metrics import METRICS
+
+log = logging.getLogger(__name__)
+
+_BUSY = METRICS.gauge("http_workers_busy", "HTTP worker threads serving a connection")
+_CONNECTIONS = METRICS.counter("http_connections_total", "HTTP connections accepted")
+
+
+class PooledRequestHandler(WSGIRequestHandler):
+    def setup(self):
+        # Bounds receiving the request and every blocked send of the response
+        self.timeout = self.server.request_timeout
+        super().setup()
+
+    def log_error(self, format, *args):
+        # A connection that never sends a request (a browser's speculative preconnect) timing out is routine
+        if format.startswith("Request timed out"):
+            self.close_connection = True
+            return
+        super().log_error(format, *args)
+
+
+class PooledWSGIServer(BaseWSGIServer):
+    """WSGI server handing each connection to one of `threads` workers"""
+
+    multithread = True
+
+    def __init__(self, host, port, app, threads=SERVER_THREADS, backlog=SERVER_BACKLOG,
+                 request_timeout=SERVER_REQUEST_TIMEOUT, fd=None):
+        # Read by server_activate(), which the base constructor calls
+        self.request_queue_size = backlog
+        self.threads = threads
+        self.request_timeout = request_timeout
+        self._slots = threading.BoundedSemaphore(threads)
+        self._pool = None
+        self._m_busy = _BUSY.labels()
+        self._m_connections = _CONNECTIONS.labels()
+        super().__init__(host, port, app, handler=PooledRequestHandler, fd=fd)
+        # Created after the base constructor, which calls server_close() when adopting an inherited fd
+        self._pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="http")
+
+    def process_request(self, request, client_address):
+        # With every worker busy the accept loop waits here and new connections queue in the backlog
+        self._slots.acquire()
+        self._m_connections.inc()
+        self._pool.submit(self._process, request, client_address)
+
+    def _process(self, request, client_address):
+        self._m_busy.inc()
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self._m_busy.dec()
+            self._slots.release()
+
+    def server_close(self):
+        super().server_close()
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+def serve(app, host=HOST, port=PORT, mode=SERVER_MODE, fd=None):
+    """Serve `app` until interrupted with the server selected by SERVER_MODE; `fd` is an inherited listener"""
+    if mode == "development" and fd is None:
+        app.run(host=host, port=port, debug=False, threaded=True)
+        return
+    if mode != "threaded":
+        raise ValueError(f"Unknown SERVER_MODE {mode!r}; use 'threaded' or 'development'")
+    server = PooledWSGIServer(host, port, app, fd=fd)
+    log.info("HTTP server: %d workers, backlog %d, request timeout %.0fs",
+             server.threads, server.request_queue_size, server.request_timeout)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+
+def serve_workers(run_worker, workers=SERVER_WORKERS, host=HOST, port=PORT, backlog=SERVER_BACKLOG, services=()):
+    """Fork `workers` processes calling run_worker(listen_fd) on one shared socket, after forking each of
+    `services` (callables such as the GPIO daemon) into its own process; any child that exits is restarted"""
+    listener = socket.create_server((host, port), backlog=backlog)
+    children = {}
+
+    def spawn(target, is_service):
+        pid = os.fork()
+        if pid == 0:
+            code = 1
+            try:
+                if is_service:
+                    listener.close()
+                    target()
+                else:
+                    target(listener.fileno())
+                code = 0
+            except SystemExit as e:
+                code = e.code if isinstance(e.code, int) else 0
+            except BaseException:
+                log.exception("Process %d failed", os.getpid())
+            finally:
+                os._exit(code)
+        children[pid] = (target, is_service, time.monotonic())
+
+    for service in services:
+        spawn(service, True)
+    for _ in range(workers):
+        spawn(run_worker, False)
+    log.info("Started %d web workers on %s:%s", workers, host, port)
+    try:
+        while True:
+            pid, status = os.wait()
+            child = children.pop(pid, None)
+            if child is None:
+                continue
+            target, is_service, started = child
+            log.warning("%s %d exited with status %d; restarting", "Service" if is_service else "Worker", pid,
+                        os.waitstatus_to_exitcode(status))
+            # A child that dies straight after starting would otherwise be respawned in a tight loop
+            if time.monotonic() - started < 5.0:
+                time.sleep(1.0)
+            spawn(target, is_service)
+    finally:
+        # Workers first, so the services (the GPIO daemon) outlive every request that might use them
+        for want_service in (False, True):
+            pids = [pid for pid, child in children.items() if child[1] == want_service]
+            for pid in pids:
+                try:
+                    os.kill(pid, signal.SIGTERM)
+                except ProcessLookupError:
+                    pass
+            for pid in pids:
+                try:
+                    os.waitpid(pid, 0)
+                except ChildProcessError:
+                    pass
+        listener.close()